@@ -0,0 +1,316 @@
+# admin.py
+# Обслуживание данных без запуска бота и без импорта telegram: проверка и починка
+# файлов команд, пересчёт остатков отпуска и отчёты. Модули данных (storage, indexes,
+# archive) импортируются только внутри подкоманд, так что запуск из cron стоит
+# десятки миллисекунд. Команды обрабатываются параллельно в пуле процессов.
+#
+#   python admin.py check [--team КОМАНДА ...]              # код выхода 1, если есть проблемы
+#   python admin.py repair [--team КОМАНДА ...] [--dry-run]
+#   python admin.py balances [--year ГГГГ] [--over] [--csv]
+#   python admin.py report summary [--csv]
+#   python admin.py report absent ДД.ММ.ГГГГ [ДД.ММ.ГГГГ] [--csv]
+
+import os
+import sys
+import logging
+import argparse
+import datetime
+import functools
+from typing import Callable, Iterable, Iterator, List
+
+WORKERS = int(os.environ.get("ADMIN_WORKERS", "0")) or os.cpu_count() or 1
+# меньше команд — пул процессов дороже, чем он экономит
+POOL_MIN_TEAMS = 8
+
+
+class _Collect(logging.Handler):
+    """Собирает предупреждения хранилища при загрузке: битые строки, испорченный журнал."""
+
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.messages = []
+
+    def emit(self, record: logging.LogRecord):
+        self.messages.append(record.getMessage())
+
+
+def _backend(read_only: bool = False):
+    from storage import STORE
+    return STORE.backend.reader() if read_only else STORE.backend
+
+
+def _load(load: Callable, team: str):
+    """
+    Записи команды, прочитанные load(team) (бэкендом или LeaveStore), и предупреждения
+    хранилища при загрузке — они попадают в вывод команды, а не в лог.
+    """
+    collect = _Collect()
+    storage_log = logging.getLogger("storage")
+    storage_log.addHandler(collect)
+    storage_log.propagate = False
+    try:
+        return load(team), collect.messages
+    finally:
+        storage_log.propagate = True
+        storage_log.removeHandler(collect)
+
+
+def _type_norm(leave_type: str) -> str:
+    """Ключ сравнения типов: регистр, пробелы и ё/е не различаются."""
+    from indexes import type_key
+    return type_key(leave_type).casefold().strip()
+
+
+def _fix(rec, aliases: dict):
+    """Исправимые отступления записи: (исправленная запись, список исправлений)."""
+    notes = []
+    name = " ".join(rec.name.split())
+    if name != rec.name:
+        notes.append("лишние пробелы в имени")
+    start, end = rec.start, rec.end
+    if end < start:
+        start, end = end, start
+        notes.append("конец раньше начала")
+    # «…счёт» и «…счет» — один тип; заменяются только сокращения вроде «отгул» и «ОЗС»
+    key = _type_norm(rec.leave_type)
+    leave_type = aliases.get(key, rec.leave_type)
+    if _type_norm(leave_type) == key:
+        leave_type = rec.leave_type
+    else:
+        notes.append(f"тип {rec.leave_type!r}")
+    return rec._replace(name=name, start=start, end=end, leave_type=leave_type), notes
+
+
+def _problems(records) -> Iterator[tuple]:
+    """(запись, исправленная запись или None для повтора, описание) для каждой проблемной записи."""
+    from bulk import TYPE_ALIASES
+    known = {_type_norm(t) for t in TYPE_ALIASES.values()}
+    seen = set()
+    for rec in records:
+        fixed, notes = _fix(rec, TYPE_ALIASES)
+        if not fixed.name:
+            notes.append("пустое имя")
+        if _type_norm(fixed.leave_type) not in known:
+            notes.append(f"неизвестный тип {fixed.leave_type!r}")
+        key = (fixed.name, fixed.start, fixed.end, _type_norm(fixed.leave_type))
+        if key in seen:
+            yield rec, None, "повтор записи"
+            continue
+        seen.add(key)
+        if notes:
+            yield rec, fixed, ", ".join(notes)
+
+
+def check_team(team: str):
+    # индекс остатков здесь не сверяется: собранный заново, он всегда совпадёт с данными —
+    # живой индекс бота сверяет сам бот (service.TotalsAudit)
+    records, messages = _load(_backend(read_only=True).load, team)
+    problems = messages + [f"{rec}: {note}" for rec, _, note in _problems(records)]
+    return team, len(records), problems
+
+
+def repair_team(team: str, dry_run: bool = False):
+    """
+    Перезаписывает снимок команды: журнал накатан, записи исправлены, повторы убраны.
+    Нечитаемые строки снимка не теряются — они дописываются в vacations_{команда}.txt.bad.
+    """
+    from storage import TextStorage
+    from codec import parse_many
+    backend = _backend(read_only=dry_run)
+    records, messages = _load(backend.load, team)
+    # после загрузки: если она уже пересобрала снимок, битые строки перенесены в .bad ею
+    bad = []
+    if isinstance(backend, TextStorage):
+        try:
+            with open(backend.path(team), encoding="utf-8") as f:
+                bad = [line for _, line, rec in parse_many(f) if rec is None and not line.startswith("#gen ")]
+        except FileNotFoundError:
+            pass
+    fixes = {}
+    notes = list(messages)
+    for rec, fixed, note in _problems(records):
+        fixes[rec.rid] = fixed
+        notes.append(f"{rec}: {note}")
+    kept = [fixes.get(rec.rid, rec) for rec in records]
+    if dry_run or not bad and kept == records:
+        # неизвестный тип и пустое имя сами не чинятся — перезаписывать нечего
+        return team, notes
+    if bad:
+        with open(backend.path(team) + ".bad", "a", encoding="utf-8") as f:
+            f.writelines(bad)
+    backend.replace(team, [rec for rec in kept if rec is not None])
+    return team, notes
+
+
+def balances_team(team: str, year: int):
+    """[(команда, сотрудник, использовано дней Отпуска)] за год — по рабочим данным и архиву."""
+    from indexes import LIMITED_TYPE, TotalsIndex
+    from archive import ARCHIVE_ENABLED, ARCHIVE, cutoff_year
+    records, _ = _load(_backend(read_only=True).load, team)
+    used = {name: days for (name, y), days in TotalsIndex.build(records).items() if y == year}
+    if ARCHIVE_ENABLED and year < cutoff_year():
+        for summary in ARCHIVE.summaries(team).values():
+            for name, years in summary["employees"].items():
+                days = years.get(str(year), {}).get(LIMITED_TYPE, 0)
+                if days:
+                    used[name] = used.get(name, 0) + days
+    return [(team, name, days) for name, days in sorted(used.items())]
+
+
+def summary_team(team: str):
+    records, _ = _load(_backend(read_only=True).load, team)
+    types = {}
+    for rec in records:
+        types[rec.leave_type] = types.get(rec.leave_type, 0) + 1
+    first = min((r.start for r in records), default=None)
+    last = max((r.end for r in records), default=None)
+    return team, len(records), len({r.name for r in records}), first, last, types
+
+
+def absent_team(team: str, start: datetime.date, end: datetime.date):
+    from archive import ARCHIVE_ENABLED, ARCHIVE
+    records, _ = _load(_backend(read_only=True).load, team)
+    found = [r for r in records if r.start <= end and start <= r.end]
+    if ARCHIVE_ENABLED:
+        found.extend(ARCHIVE.query(team, start, end))
+    return [(team, r) for r in sorted(found, key=lambda r: (r.start, r.name))]
+
+
+def _map(func: Callable, teams: List[str], workers: int = WORKERS) -> Iterator:
+    """func по командам — в пуле процессов, результаты в порядке teams."""
+    if workers <= 1 or len(teams) < POOL_MIN_TEAMS:
+        yield from map(func, teams)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    workers = min(workers, len(teams))
+    with ProcessPoolExecutor(workers) as pool:
+        yield from pool.map(func, teams, chunksize=max(1, len(teams) // (workers * 4)))
+
+
+def _teams(selected: List[str]) -> List[str]:
+    return selected or _backend().teams()
+
+
+def _rows(rows: Iterable[list], as_csv: bool, header: List[str]):
+    if as_csv:
+        import csv
+        writer = csv.writer(sys.stdout)
+        writer.writerow(header)
+        writer.writerows(rows)
+    else:
+        for row in rows:
+            print("\t".join(str(cell) for cell in row))
+
+
+def cmd_check(args) -> int:
+    failed = 0
+    checked = 0
+    for team, count, problems in _map(check_team, _teams(args.team), args.workers):
+        checked += 1
+        if problems:
+            failed += 1
+            print(f"❌ {team} ({count} записей):")
+            for problem in problems:
+                print(f"   {problem}")
+    print(f"Проверено команд: {checked}, с проблемами: {failed}")
+    return 1 if failed else 0
+
+
+def cmd_repair(args) -> int:
+    repaired = 0
+    for team, notes in _map(functools.partial(repair_team, dry_run=args.dry_run), _teams(args.team), args.workers):
+        if notes:
+            repaired += 1
+            print(f"{'🔎' if args.dry_run else '🛠'} {team}:")
+            for note in notes:
+                print(f"   {note}")
+    print(f"{'Нужна починка' if args.dry_run else 'Исправлено'} команд: {repaired}")
+    return 0
+
+
+def cmd_balances(args) -> int:
+    from indexes import YEAR_LIMIT
+    teams = _teams(args.team)
+
+    def rows():
+        for result in _map(functools.partial(balances_team, year=args.year), teams, args.workers):
+            for team, name, used in result:
+                if not args.over or used > YEAR_LIMIT:
+                    yield [team, name, args.year, used, YEAR_LIMIT - used]
+
+    _rows(rows(), args.csv, ["team", "name", "year", "used", "left"])
+    return 0
+
+
+def cmd_report(args) -> int:
+    from codec import format_date, parse_date
+    teams = _teams(args.team)
+    if args.report == "summary":
+        def rows():
+            for team, count, employees, first, last, types in _map(summary_team, teams, args.workers):
+                yield [team, count, employees, format_date(first) if first else "", format_date(last) if last else "",
+                       "; ".join(f"{t}: {n}" for t, n in sorted(types.items()))]
+
+        _rows(rows(), args.csv, ["team", "records", "employees", "first", "last", "types"])
+        return 0
+    start = parse_date(args.start)
+    end = parse_date(args.end) if args.end else start
+
+    def rows():
+        for result in _map(functools.partial(absent_team, start=start, end=end), teams, args.workers):
+            for team, rec in result:
+                yield [team, rec.name, format_date(rec.start), format_date(rec.end), rec.leave_type]
+
+    _rows(rows(), args.csv, ["team", "name", "start", "end", "type"])
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Проверка, починка и отчёты по данным команд без запуска бота")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="процессов в пуле (1 — без пула)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="показывать журнал хранилища")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def team_arg(p):
+        p.add_argument("--team", action="append", default=[], help="только эта команда (можно несколько раз)")
+
+    check = sub.add_parser("check", help="проверить файлы команд")
+    team_arg(check)
+    check.set_defaults(run=cmd_check)
+    repair = sub.add_parser("repair", help="починить файлы команд (лучше при остановленном боте)")
+    team_arg(repair)
+    repair.add_argument("--dry-run", action="store_true", help="только показать, что будет исправлено")
+    repair.set_defaults(run=cmd_repair)
+    balances = sub.add_parser("balances", help="использованные дни и остаток Отпуска по сотрудникам")
+    team_arg(balances)
+    balances.add_argument("--year", type=int, default=datetime.date.today().year)
+    balances.add_argument("--over", action="store_true", help="только превысившие лимит")
+    balances.add_argument("--csv", action="store_true")
+    balances.set_defaults(run=cmd_balances)
+    report = sub.add_parser("report", help="отчёты")
+    report_sub = report.add_subparsers(dest="report", required=True)
+    summary = report_sub.add_parser("summary", help="сводка по командам")
+    absent = report_sub.add_parser("absent", help="кто отсутствует в день или период")
+    absent.add_argument("start", help="ДД.ММ.ГГГГ")
+    absent.add_argument("end", nargs="?", help="ДД.ММ.ГГГГ")
+    for p in (summary, absent):
+        team_arg(p)
+        p.add_argument("--csv", action="store_true")
+        p.set_defaults(run=cmd_report)
+    return parser
+
+
+def main(argv: List[str] = None) -> int:
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(format="%(levelname)s %(name)s: %(message)s",
+                        level=logging.INFO if args.verbose else logging.WARNING)
+    try:
+        return args.run(args)
+    except BrokenPipeError:
+        # вывод обрезали (| head) — это не ошибка
+        sys.stdout = open(os.devnull, "w")
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,260 @@
+# archive.py
+# Архив закрытых лет: записи, закончившиеся раньше ARCHIVE_KEEP_YEARS последних лет,
+# переносятся из рабочего файла команды в сжатые сегменты по году начала
+# (vacations_{команда}.{год}.txt.gz, только для чтения). Рядом лежит манифест команды
+# (vacations_{команда}.archive.json) со сводкой каждого сегмента: число записей, границы дат
+# и дни по сотрудникам, годам и типам. Рабочий файл после переноса содержит только
+# активные годы, поэтому его загрузка и индексы не платят за историю.
+#
+# Лимит отпуска, поиск и запросы за прошлые периоды идут в архив через сводки;
+# распаковывается только сегмент, записи которого действительно нужны. Для поиска
+# сотрудники из сводок держатся в памяти, в индексе по ФИО.
+#
+#   python archive.py run [--team КОМАНДА]      # перенести закрытые годы
+#   python archive.py show КОМАНДА               # сводка архива команды
+
+import os
+import io
+import gzip
+import json
+import datetime
+import threading
+from bisect import bisect_left, insort
+from collections import OrderedDict, defaultdict
+from typing import Dict, List
+
+from storage import STORE, Leave
+from codec import parse_many
+from indexes import LIMITED_TYPE, TOTALS, days_by_year, normalize_name
+
+ARCHIVE_ENABLED = os.environ.get("ARCHIVE", "1") == "1"
+ARCHIVE_KEEP_YEARS = int(os.environ.get("ARCHIVE_KEEP_YEARS", "1"))  # сколько прошлых лет остаются рабочими
+SEGMENT_PATH = "vacations_{}.{}.txt.gz"
+MANIFEST_PATH = "vacations_{}.archive.json"
+SEGMENT_CACHE = int(os.environ.get("ARCHIVE_SEGMENT_CACHE", "4"))  # распакованных сегментов в памяти
+
+
+def cutoff_year(today: datetime.date = None) -> int:
+    """Записи, закончившиеся раньше этого года, уходят в архив."""
+    return (today or datetime.date.today()).year - ARCHIVE_KEEP_YEARS
+
+
+def summarize(records: List[Leave]) -> dict:
+    """Сводка сегмента: без распаковки по ней считаются лимит и ищутся сотрудники."""
+    employees = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
+    for rec in records:
+        for year, days in days_by_year(rec.start, rec.end).items():
+            employees[rec.name][str(year)][rec.leave_type] += days
+    return {
+        "records": len(records),
+        "first": min(r.start for r in records).isoformat(),
+        "last": max(r.end for r in records).isoformat(),
+        "employees": {name: {y: dict(t) for y, t in years.items()} for name, years in employees.items()},
+    }
+
+
+def _write_atomic(path: str, data: bytes):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    if os.path.exists(path):
+        os.chmod(path, 0o644)
+    os.replace(tmp, path)
+
+
+class ArchiveStore:
+    """
+    Манифесты команд кэшируются в памяти и перечитываются по mtime; распакованные
+    сегменты — в небольшом LRU. Из манифестов же собирается добавка к TOTALS:
+    дни Отпуска в архивных годах по (сотрудник, год), — и индекс сотрудников для поиска.
+    В индекс попадают команды, чей манифест уже читался (archive() при старте и сжатии журнала).
+    """
+
+    def __init__(self, segment_path: str = SEGMENT_PATH, manifest_path: str = MANIFEST_PATH,
+                 cache_size: int = SEGMENT_CACHE):
+        self.segment_path = segment_path
+        self.manifest_path = manifest_path
+        self.cache_size = cache_size
+        self._manifests = {}  # team -> ((mtime_ns, размер), манифест, {(сотрудник, год): дни Отпуска})
+        self._segments = OrderedDict()  # (team, year, mtime_ns) -> [Leave]
+        self._people = {}  # team -> {ФИО: {год: {тип: дни}}} по всем сегментам команды
+        self._keys = []  # отсортированные (ключ, team, ФИО): ключи — ФИО и его «хвосты» со слова
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _name_keys(team: str, name: str):
+        words = normalize_name(name).split(" ")
+        return [(" ".join(words[i:]), team, name) for i in range(len(words))]
+
+    def _index(self, team: str, manifest: dict):
+        """Пересобирает индекс сотрудников команды по её манифесту."""
+        people = {}
+        for summary in manifest.values():
+            for name, years in summary["employees"].items():
+                target = people.setdefault(name, {})
+                for year, types in years.items():
+                    bucket = target.setdefault(year, {})
+                    for lt, days in types.items():
+                        bucket[lt] = bucket.get(lt, 0) + days
+        with self._lock:
+            for name in self._people.pop(team, {}):
+                for key in self._name_keys(team, name):
+                    i = bisect_left(self._keys, key)
+                    if i < len(self._keys) and self._keys[i] == key:
+                        del self._keys[i]
+            if people:
+                self._people[team] = people
+                for name in people:
+                    for key in self._name_keys(team, name):
+                        insort(self._keys, key)
+
+    def _manifest(self, team: str):
+        path = self.manifest_path.format(team)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            if team in self._people:
+                self._index(team, {})
+            return {}, {}
+        stamp = st.st_mtime_ns, st.st_size
+        with self._lock:
+            cached = self._manifests.get(team)
+        if cached is not None and cached[0] == stamp:
+            return cached[1], cached[2]
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        used = defaultdict(int)
+        for summary in manifest.values():
+            for name, years in summary["employees"].items():
+                for year, types in years.items():
+                    if LIMITED_TYPE in types:
+                        used[(name, int(year))] += types[LIMITED_TYPE]
+        with self._lock:
+            self._manifests[team] = (stamp, manifest, dict(used))
+        self._index(team, manifest)
+        return manifest, used
+
+    def summaries(self, team: str) -> Dict[int, dict]:
+        return {int(year): summary for year, summary in self._manifest(team)[0].items()}
+
+    def years(self, team: str) -> List[int]:
+        return sorted(self.summaries(team))
+
+    def used(self, team: str, name: str, year: int) -> int:
+        """Дни Отпуска сотрудника в году по архивным сегментам — только из манифеста."""
+        if year >= cutoff_year():
+            # в архиве только записи, закончившиеся до cutoff_year: рабочие годы — без обращения к диску
+            return 0
+        return self._manifest(team)[1].get((name, year), 0)
+
+    def records(self, team: str, year: int) -> List[Leave]:
+        """Записи одного сегмента (распаковка при первом обращении)."""
+        path = self.segment_path.format(team, year)
+        try:
+            key = (team, year, os.stat(path).st_mtime_ns)
+        except FileNotFoundError:
+            return []
+        with self._lock:
+            if key in self._segments:
+                self._segments.move_to_end(key)
+                return self._segments[key]
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            recs = [rec for _, _, rec in parse_many(f) if rec is not None]
+        with self._lock:
+            self._segments[key] = recs
+            while len(self._segments) > self.cache_size:
+                self._segments.popitem(last=False)
+        return recs
+
+    def query(self, team: str, start: datetime.date, end: datetime.date = None) -> List[Leave]:
+        """Архивные записи, пересекающиеся с [start, end]; распаковываются только подходящие по сводке сегменты."""
+        end = end or start
+        found = []
+        for year, summary in sorted(self.summaries(team).items()):
+            if summary["first"] <= end.isoformat() and start.isoformat() <= summary["last"]:
+                found.extend(r for r in self.records(team, year) if r.start <= end and start <= r.end)
+        return sorted(found, key=lambda r: (r.start, r.name))
+
+    def search(self, query: str) -> Dict[str, Dict[str, Dict[str, Dict[str, int]]]]:
+        """
+        Сотрудники в архивах команд — точное совпадение или начало ФИО/фамилии, по индексу в памяти:
+        {команда: {ФИО: {год: {тип: дни}}}}. Ни файлы, ни сегменты не читаются.
+        """
+        key = normalize_name(query)
+        if not key:
+            return {}
+        found = {}
+        with self._lock:
+            i = bisect_left(self._keys, (key,))
+            while i < len(self._keys) and self._keys[i][0].startswith(key):
+                _, team, name = self._keys[i]
+                found.setdefault(team, {})[name] = {
+                    year: dict(types) for year, types in self._people[team][name].items()
+                }
+                i += 1
+        return found
+
+    def archive(self, team: str, store=STORE, today: datetime.date = None) -> int:
+        """
+        Переносит записи закрытых лет из рабочих данных команды в сегменты; возвращает их число.
+        Вызывать под блокировкой команды (LeaveService.archive). Сегменты и манифест пишутся
+        до перезаписи рабочего файла: после сбоя посередине повтор ничего не задвоит —
+        записи в сегменте склеиваются по rid.
+        """
+        limit = cutoff_year(today)
+        # манифест читается и без переноса: так команда попадает в индекс поиска
+        self._manifest(team)
+        old = [rec for rec in store.records(team) if rec.end.year < limit]
+        if not old:
+            return 0
+        by_year = defaultdict(list)
+        for rec in old:
+            by_year[rec.start.year].append(rec)
+        manifest = dict(self._manifest(team)[0])
+        for year, recs in by_year.items():
+            merged = {r.rid: r for r in self.records(team, year)}
+            merged.update((r.rid, r) for r in recs)
+            recs = sorted(merged.values(), key=lambda r: (r.start, r.name))
+            buf = io.BytesIO()
+            # mtime=0: одинаковое содержимое даёт одинаковый файл
+            with gzip.GzipFile(fileobj=buf, mode="wb", compresslevel=9, mtime=0) as gz:
+                gz.write("".join(r.to_line() for r in recs).encode("utf-8"))
+            path = self.segment_path.format(team, year)
+            _write_atomic(path, buf.getvalue())
+            os.chmod(path, 0o444)
+            manifest[str(year)] = summarize(recs)
+        _write_atomic(self.manifest_path.format(team),
+                      json.dumps(dict(sorted(manifest.items())), ensure_ascii=False, indent=1).encode("utf-8"))
+        self._manifest(team)
+        moved = {rec.rid for rec in old}
+        store.replace(team, [rec for rec in store.records(team) if rec.rid not in moved])
+        return len(old)
+
+
+ARCHIVE = ArchiveStore()
+# лимит Отпуска в архивных годах считается по сводкам сегментов
+TOTALS.archived = ARCHIVE.used
+
+
+def _show(team: str):
+    for year, summary in sorted(ARCHIVE.summaries(team).items()):
+        print(f"{year}: записей {summary['records']}, {summary['first']} – {summary['last']}, "
+              f"сотрудников {len(summary['employees'])}")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Архив закрытых лет")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="перенести записи закрытых лет в архив")
+    run.add_argument("--team", help="только эта команда (по умолчанию все)")
+    show = sub.add_parser("show", help="сводка архива команды")
+    show.add_argument("team")
+    args = parser.parse_args()
+    if args.command == "run":
+        for team in [args.team] if args.team else STORE.backend.teams():
+            print(f"{team}: перенесено записей {ARCHIVE.archive(team)}")
+    else:
+        _show(args.team)
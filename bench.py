@@ -0,0 +1,292 @@
+# bench.py
+# Замеры производительности на синтетических данных: настоящие хендлеры бота вызываются
+# с поддельными Update/Context и ботом-заглушкой, сеть не нужна. Результат — JSON
+# с пропускной способностью и p50/p99 по каждой операции; два прогона сравниваются compare.
+#
+#   python bench.py run [--teams 5 --employees 50 --years 3 --iterations 300] [--out before.json]
+#   python bench.py compare before.json after.json
+
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import datetime
+import platform
+import tempfile
+from types import SimpleNamespace
+from typing import Callable, Dict, List
+
+SURNAMES = ["Иванов", "Петров", "Сидоров", "Смирнов", "Кузнецов", "Попов", "Соколов", "Лебедев",
+            "Козлов", "Новиков", "Морозов", "Волков", "Алексеев", "Фёдоров", "Михайлов", "Егоров"]
+FIRST_NAMES = ["Иван", "Пётр", "Алексей", "Сергей", "Дмитрий", "Андрей", "Михаил", "Николай",
+               "Олег", "Павел", "Роман", "Юрий"]
+OTHER_TYPES = ["Отгулы", "Отпуск за свой счет", "Командировка"]
+
+
+def employee_names(count: int) -> List[str]:
+    names = [f"{s} {f}" for f in FIRST_NAMES for s in SURNAMES]
+    return [names[i % len(names)] + (f" {i // len(names) + 1}" if i >= len(names) else "") for i in range(count)]
+
+
+def synthetic_records(rng: random.Random, names: List[str], years: List[int]):
+    """На сотрудника в год: 2–3 отпуска в пределах лимита и 1–3 прочих отсутствия."""
+    from storage import Leave, new_rid
+    for year in years:
+        first = datetime.date(year, 1, 1).toordinal()
+        for name in names:
+            left = 28
+            for _ in range(rng.randint(2, 3)):
+                days = min(left, rng.randint(5, 14))
+                if days <= 0:
+                    break
+                left -= days
+                start = datetime.date.fromordinal(first + rng.randrange(365 - days))
+                yield Leave(name, start, start + datetime.timedelta(days=days - 1), "Отпуск", new_rid())
+            for _ in range(rng.randint(1, 3)):
+                start = datetime.date.fromordinal(first + rng.randrange(360))
+                yield Leave(name, start, start + datetime.timedelta(days=rng.randint(0, 4)),
+                            rng.choice(OTHER_TYPES), new_rid())
+
+
+def generate(teams: int, employees: int, years: int, seed: int = 1) -> Dict[str, List[str]]:
+    """
+    Пишет данные команд через бэкенд хранилища (файлы vacations_*.txt или SQLite —
+    по STORAGE_BACKEND) в текущий каталог. Возвращает {команда: сотрудники}.
+    """
+    from storage import STORE
+    rng = random.Random(seed)
+    this_year = datetime.date.today().year
+    span = list(range(this_year - years + 1, this_year + 1))
+    staff = {}
+    for t in range(teams):
+        team = f"team{t + 1:02d}"
+        names = employee_names(employees)
+        rng.shuffle(names)
+        STORE.backend.ensure(team)
+        STORE.backend.replace(team, list(synthetic_records(rng, names, span)))
+        staff[team] = names
+    STORE.invalidate()
+    return staff
+
+
+class FakeBot:
+    """Бот-заглушка: ничего не отправляет, только считает сообщения."""
+
+    def __init__(self):
+        self.sent = 0
+        self.last = None
+
+    async def send_message(self, chat_id, text, reply_markup=None, **kwargs):
+        self.sent += 1
+        self.last = text
+        return SimpleNamespace(chat_id=chat_id, text=text)
+
+    async def send_document(self, chat_id, document, filename=None, **kwargs):
+        self.sent += 1
+        return SimpleNamespace(chat_id=chat_id)
+
+
+class FakeMessage:
+    def __init__(self, bot: FakeBot, chat_id: int, text: str):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.text = text
+
+    async def reply_text(self, text, reply_markup=None, **kwargs):
+        return await self.bot.send_message(self.chat_id, text, reply_markup=reply_markup, **kwargs)
+
+    async def reply_document(self, document, filename=None, **kwargs):
+        return await self.bot.send_document(self.chat_id, document, filename=filename, **kwargs)
+
+
+def fake_update(bot: FakeBot, chat_id: int, text: str):
+    """Только то, что читают хендлеры: message.text/reply_*, effective_chat, effective_user."""
+    return SimpleNamespace(
+        message=FakeMessage(bot, chat_id, text),
+        effective_chat=SimpleNamespace(id=chat_id),
+        effective_user=SimpleNamespace(id=chat_id),
+        callback_query=None,
+    )
+
+
+def fake_context(bot: FakeBot, user_data: dict = None, args: list = None):
+    return SimpleNamespace(bot=bot, user_data=user_data or {}, args=args or [])
+
+
+def _summary(latencies: List[float], elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1e3 if latencies else 0.0
+    return {
+        "count": len(latencies),
+        "per_second": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(pick(0.50), 3),
+        "p99_ms": round(pick(0.99), 3),
+        "max_ms": round(latencies[-1] * 1e3, 3) if latencies else 0.0,
+    }
+
+
+async def run_scenarios(staff: Dict[str, List[str]], iterations: int, seed: int = 2) -> Dict[str, dict]:
+    """
+    Каждая операция вызывается iterations раз для случайных чатов и сотрудников.
+    Подготовка входа (выбор записи, user_data) в замер не входит.
+    """
+    import vacation
+    from storage import STORE, read_vacations
+    from indexes import total_days_this_year
+    from service import SERVICE
+
+    rng = random.Random(seed)
+    bot = FakeBot()
+    chats = {}
+    for i, team in enumerate(staff, 1):
+        vacation.TEAM_NAMES[str(i)] = team
+        chats[team] = i
+        await SERVICE.sync(team)
+    year = datetime.date.today().year
+    fmt = lambda d: d.strftime("%d.%m.%Y")
+
+    def pick():
+        team = rng.choice(list(staff))
+        return team, chats[team], rng.choice(staff[team])
+
+    def any_record(team):
+        return rng.choice(STORE.records(team))
+
+    async def add_end():
+        team, chat, name = pick()
+        start = datetime.date(year, 1, 1) + datetime.timedelta(days=rng.randrange(360))
+        end = start + datetime.timedelta(days=rng.randint(0, 3))
+        data = {"name": name, "start": start, "leave_type": rng.choice(["Отпуск"] + OTHER_TYPES)}
+        return vacation.add_end, fake_update(bot, chat, fmt(end)), fake_context(bot, data)
+
+    async def finish_search():
+        _, chat, name = pick()
+        # фамилия целиком или её начало — как набирают люди
+        query = name.split()[0] if rng.random() < 0.5 else name[:rng.randint(3, 6)]
+        return vacation.finish_search, fake_update(bot, chat, query), fake_context(bot)
+
+    async def finish_delete():
+        team, chat, _ = pick()
+        return vacation.finish_delete, fake_update(bot, chat, "да"), fake_context(bot, {"del_rec": any_record(team)})
+
+    async def finish_edit():
+        team, chat, _ = pick()
+        rec = any_record(team)
+        end = rec.end + datetime.timedelta(days=rng.choice([-1, 0, 1]))
+        data = {"start": rec.start, "edit_rec": rec}
+        return vacation.finish_edit, fake_update(bot, chat, fmt(max(end, rec.start))), fake_context(bot, data)
+
+    async def listing():
+        _, chat, _ = pick()
+        return vacation.message_router, fake_update(bot, chat, "📅 Отпуска"), fake_context(bot)
+
+    async def read_cold():
+        team, _, _ = pick()
+        # кэш сброшен — файл или таблица читаются и разбираются заново
+        STORE.invalidate(team)
+        return (lambda u, c: asyncio.get_running_loop().run_in_executor(None, read_vacations, team)), None, None
+
+    async def total_days():
+        team, _, name = pick()
+        return (lambda u, c: asyncio.get_running_loop().run_in_executor(
+            None, total_days_this_year, team, name, year)), None, None
+
+    scenarios: Dict[str, Callable] = {
+        "add_end": add_end,
+        "finish_search": finish_search,
+        "finish_edit": finish_edit,
+        "finish_delete": finish_delete,
+        "listing": listing,
+        "read_vacations_cold": read_cold,
+        "total_days_this_year": total_days,
+    }
+    results = {}
+    for label, prepare in scenarios.items():
+        latencies = []
+        for _ in range(iterations):
+            handler, update, context = await prepare()
+            began = time.perf_counter()
+            await handler(update, context)
+            latencies.append(time.perf_counter() - began)
+        results[label] = _summary(latencies, sum(latencies))
+        # после read_vacations_cold в кэше должна быть команда для следующих операций
+        for team in staff:
+            await SERVICE.sync(team)
+    results["_bot"] = {"messages": bot.sent}
+    return results
+
+
+def run(teams: int, employees: int, years: int, iterations: int, data_dir: str = None, seed: int = 1) -> dict:
+    with tempfile.TemporaryDirectory(prefix="vacabot-bench-") as tmp:
+        # относительные пути хранилища (vacations_*.txt, vacations.db) — в каталоге данных
+        os.chdir(data_dir or tmp)
+        began = time.perf_counter()
+        staff = generate(teams, employees, years, seed)
+        generated = time.perf_counter() - began
+        from storage import STORE
+        records = sum(len(STORE.records(team)) for team in staff)
+        STORE.invalidate()
+        import vacation  # noqa: F401 — настраивает logging при импорте; дальше нужны только предупреждения
+        logging.getLogger().setLevel(logging.WARNING)
+        results = asyncio.run(run_scenarios(staff, iterations, seed + 1))
+        os.chdir("/")
+    return {
+        "config": {
+            "teams": teams, "employees": employees, "years": years, "iterations": iterations, "seed": seed,
+            "records": records, "backend": os.environ.get("STORAGE_BACKEND", "text"),
+            "python": platform.python_version(), "generate_seconds": round(generated, 3),
+        },
+        "results": results,
+    }
+
+
+def compare(before: dict, after: dict) -> str:
+    """Таблица p50/p99 и пропускной способности; отношение < 1 по задержке — стало быстрее."""
+    lines = [f"{'операция':<22} {'p50 мс':>26} {'p99 мс':>26} {'оп/с':>26}"]
+    for label, old in before["results"].items():
+        new = after["results"].get(label)
+        if label.startswith("_") or new is None:
+            continue
+        cells = []
+        for key in ("p50_ms", "p99_ms", "per_second"):
+            ratio = new[key] / old[key] if old[key] else float("nan")
+            cells.append(f"{old[key]:.2f}→{new[key]:.2f} ×{ratio:.2f}")
+        lines.append(f"{label:<22} " + " ".join(f"{c:>26}" for c in cells))
+    if before["config"] != after["config"]:
+        lines.append("внимание: конфигурации прогонов различаются")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Замеры хендлеров на синтетических данных")
+    sub = parser.add_subparsers(dest="command", required=True)
+    r = sub.add_parser("run", help="сгенерировать данные и прогнать хендлеры")
+    r.add_argument("--teams", type=int, default=5)
+    r.add_argument("--employees", type=int, default=50)
+    r.add_argument("--years", type=int, default=3)
+    r.add_argument("--iterations", type=int, default=300)
+    r.add_argument("--seed", type=int, default=1)
+    r.add_argument("--data", help="каталог для данных (по умолчанию временный)")
+    r.add_argument("--out", help="куда записать JSON (по умолчанию stdout)")
+    c = sub.add_parser("compare", help="сравнить два JSON-результата")
+    c.add_argument("before")
+    c.add_argument("after")
+    args = parser.parse_args()
+    if args.command == "run":
+        out = os.path.abspath(args.out) if args.out else None
+        data = os.path.abspath(args.data) if args.data else None
+        if data:
+            os.makedirs(data, exist_ok=True)
+        report = run(args.teams, args.employees, args.years, args.iterations, data, args.seed)
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if out:
+            with open(out, "w", encoding="utf-8") as f:
+                f.write(text + "\n")
+        else:
+            print(text)
+    else:
+        with open(args.before, encoding="utf-8") as f1, open(args.after, encoding="utf-8") as f2:
+            print(compare(json.load(f1), json.load(f2)))
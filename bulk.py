@@ -0,0 +1,278 @@
+# bulk.py
+# Массовый импорт и экспорт записей: CSV, а также XLSX, если установлен openpyxl.
+# Файлы читаются и пишутся построчно, без загрузки всей таблицы в память.
+#
+#   python bulk.py import КОМАНДА plan.csv
+#   python bulk.py export [--team КОМАНДА] out.csv
+
+import os
+import io
+import csv
+import codecs
+import zipfile
+import argparse
+import datetime
+from typing import BinaryIO, Callable, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from storage import STORE, Leave
+from codec import parse_date, format_date
+from indexes import YEAR_LIMIT, check_batch, type_key
+
+IMPORT_MAX_ROWS = int(os.environ.get("IMPORT_MAX_ROWS", "10000"))
+
+HEADER = ["team", "name", "start", "end", "type"]
+# заголовки колонок, которые понимает импорт; без заголовка порядок — ФИО, начало, окончание, тип
+COLUMN_ALIASES = {
+    "team": "team", "команда": "team",
+    "name": "name", "фио": "name", "имя": "name", "сотрудник": "name",
+    "start": "start", "начало": "start", "с": "start",
+    "end": "end", "окончание": "end", "конец": "end", "по": "end",
+    "type": "type", "тип": "type",
+}
+TYPE_ALIASES = {
+    "отпуск": "Отпуск",
+    "отгулы": "Отгулы", "отгул": "Отгулы",
+    "озс": "Отпуск за свой счет", "отпуск за свой счет": "Отпуск за свой счет",
+    "командировка": "Командировка",
+}
+
+
+class RowError(NamedTuple):
+    line: int
+    message: str
+
+    def __str__(self) -> str:
+        return f"строка {self.line}: {self.message}"
+
+
+class ImportFileError(ValueError):
+    """Файл импорта не читается целиком: неизвестная кодировка, повреждённый XLSX."""
+
+
+def _csv_encoding(stream: BinaryIO) -> str:
+    """
+    UTF-8 (с BOM или без), иначе cp1251 — так сохраняет CSV Excel с русской локалью.
+    Файл проверяется потоковым декодером за один проход, без чтения в память целиком.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        while True:
+            chunk = stream.read(1 << 16)
+            if not chunk:
+                break
+            decoder.decode(chunk)
+        decoder.decode(b"", final=True)
+        return "utf-8-sig"
+    except UnicodeDecodeError:
+        return "cp1251"
+    finally:
+        stream.seek(0)
+
+
+def _iter_csv(stream: BinaryIO) -> Iterator[Tuple[int, list]]:
+    text = io.TextIOWrapper(stream, encoding=_csv_encoding(stream), newline="")
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        # Excel с русской локалью сохраняет CSV через точку с запятой
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(text, dialect)
+    try:
+        for row in reader:
+            # line_num учитывает ячейки с переводами строк — номер совпадает со строкой в файле
+            yield reader.line_num, row
+    except UnicodeDecodeError:
+        # байт, которого нет и в cp1251
+        raise ImportFileError("CSV не в кодировке UTF-8 или Windows-1251") from None
+
+
+def _iter_xlsx(stream: BinaryIO) -> Iterator[Tuple[int, list]]:
+    import openpyxl
+    # read_only: строки листа читаются потоком, а не всей книгой в память
+    try:
+        book = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, KeyError, OSError) as e:
+        # не zip-архив или в архиве нет листа книги
+        raise ImportFileError("файл XLSX повреждён или это не XLSX") from e
+    try:
+        for line, row in enumerate(book.active.iter_rows(values_only=True), 1):
+            yield line, list(row)
+    finally:
+        book.close()
+
+
+def iter_rows(stream: BinaryIO, filename: str) -> Iterator[Tuple[int, list]]:
+    """(номер строки, ячейки) из CSV или XLSX; для XLSX без openpyxl — ImportError."""
+    if filename.lower().endswith(".xlsx"):
+        return _iter_xlsx(stream)
+    return _iter_csv(stream)
+
+
+def _cell(value) -> str:
+    return "" if value is None else str(value).strip()
+
+
+def _date(value) -> datetime.date:
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    text = _cell(value)
+    try:
+        return parse_date(text)
+    except ValueError:
+        pass
+    try:
+        return datetime.date.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f"неверная дата «{text}»") from None
+
+
+def parse_rows(rows: Iterable[Tuple[int, list]], team: str) -> Iterator[Tuple[int, Optional[Leave], Optional[str]]]:
+    """
+    Разбирает строки таблицы в записи. Первая непустая строка — заголовок, если в ней есть
+    колонка ФИО/name. Для каждой строки — (номер, запись, None) или (номер, None, ошибка).
+    """
+    columns = None
+    for line, row in rows:
+        cells = [_cell(c) for c in row]
+        if not any(cells):
+            continue
+        if columns is None:
+            names = [COLUMN_ALIASES.get(c.casefold()) for c in cells]
+            if "name" in names:
+                columns = {col: i for i, col in enumerate(names) if col}
+                continue
+            columns = {"name": 0, "start": 1, "end": 2, "type": 3}
+        get = lambda col: row[columns[col]] if col in columns and columns[col] < len(row) else None
+        try:
+            row_team = _cell(get("team"))
+            if row_team and row_team != team:
+                raise ValueError(f"запись другой команды «{row_team}»")
+            name = " ".join(_cell(get("name")).split())
+            if not name:
+                raise ValueError("не указано ФИО")
+            start, end = _date(get("start")), _date(get("end"))
+            if end < start:
+                raise ValueError("дата окончания раньше начала")
+            raw_type = _cell(get("type")) or "Отпуск"
+            leave_type = TYPE_ALIASES.get(type_key(raw_type.casefold()))
+            if leave_type is None:
+                raise ValueError(f"неизвестный тип «{raw_type}»")
+        except ValueError as e:
+            yield line, None, str(e)
+            continue
+        yield line, Leave(name, start, end, leave_type), None
+
+
+def read_import(stream: BinaryIO, filename: str, team: str) -> Tuple[List[Tuple[int, Leave]], List[RowError]]:
+    """
+    Читает файл импорта: ([(строка, запись)], [ошибки разбора]). Не больше IMPORT_MAX_ROWS записей.
+    Нечитаемый файл целиком — ImportFileError.
+    """
+    parsed, errors = [], []
+    for line, rec, error in parse_rows(iter_rows(stream, filename), team):
+        if error:
+            errors.append(RowError(line, error))
+        elif len(parsed) >= IMPORT_MAX_ROWS:
+            errors.append(RowError(line, f"превышен предел {IMPORT_MAX_ROWS} строк, остаток не прочитан"))
+            break
+        else:
+            parsed.append((line, rec))
+    return parsed, errors
+
+
+def limit_errors(parsed: List[Tuple[int, Leave]], excess: dict) -> List[RowError]:
+    """Ошибки лимита по результату пакетной проверки {номер в пачке: (год, использовано, запрошено)}."""
+    return [
+        RowError(parsed[i][0], f"лимит {YEAR_LIMIT} дн./год: в {year} уже {used}, запрошено {days}")
+        for i, (year, used, days) in sorted(excess.items())
+    ]
+
+
+def import_records(team: str, stream: BinaryIO, filename: str) -> Tuple[List[Leave], List[RowError]]:
+    """
+    Синхронный импорт в команду (для командной строки): разбор, пакетная проверка лимита
+    и запись всех принятых строк одной транзакцией. Возвращает (добавленные, ошибки по строкам).
+    """
+    parsed, errors = read_import(stream, filename, team)
+    recs = [rec for _, rec in parsed]
+    checks = check_batch(team, recs)
+    added = STORE.extend(team, [rec for rec, excess in zip(recs, checks) if excess is None])
+    errors += limit_errors(parsed, {i: excess for i, excess in enumerate(checks) if excess})
+    return added, sorted(errors)
+
+
+def _export_rows(teams: Iterable[str], records: Callable[[str], List[Leave]]) -> Iterator[list]:
+    # команды читаются по одной — в памяти только записи текущей
+    for team in teams:
+        for rec in sorted(records(team), key=lambda r: (r.start, r.name)):
+            yield [team, rec.name, format_date(rec.start), format_date(rec.end), rec.leave_type]
+
+
+def export_csv(out: BinaryIO, teams: Iterable[str], records: Callable[[str], List[Leave]] = STORE.records) -> int:
+    """
+    Пишет записи команд в CSV построчно; возвращает число записей.
+    records(команда) отдаёт записи команды — в боте их получают через SERVICE.
+    """
+    text = io.TextIOWrapper(out, encoding="utf-8-sig", newline="", write_through=True)
+    writer = csv.writer(text)
+    writer.writerow(HEADER)
+    count = 0
+    for row in _export_rows(teams, records):
+        writer.writerow(row)
+        count += 1
+    text.detach()
+    return count
+
+
+def export_xlsx(out: BinaryIO, teams: Iterable[str], records: Callable[[str], List[Leave]] = STORE.records) -> int:
+    """То же в XLSX (нужен openpyxl): write_only-книга не держит строки в памяти."""
+    import openpyxl
+    book = openpyxl.Workbook(write_only=True)
+    sheet = book.create_sheet("leaves")
+    sheet.append(HEADER)
+    count = 0
+    for row in _export_rows(teams, records):
+        sheet.append(row)
+        count += 1
+    book.save(out)
+    return count
+
+
+def export(out: BinaryIO, teams: Iterable[str], filename: str = "leaves.csv",
+           records: Callable[[str], List[Leave]] = STORE.records) -> int:
+    if filename.lower().endswith(".xlsx"):
+        return export_xlsx(out, teams, records)
+    return export_csv(out, teams, records)
+
+
+def all_teams() -> List[str]:
+    return STORE.backend.teams()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Массовый импорт и экспорт записей")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="добавить записи из CSV/XLSX в команду")
+    imp.add_argument("team")
+    imp.add_argument("file")
+    exp = sub.add_parser("export", help="выгрузить записи в CSV/XLSX")
+    exp.add_argument("file")
+    exp.add_argument("--team", help="только эта команда (по умолчанию все)")
+    args = parser.parse_args()
+    if args.command == "import":
+        with open(args.file, "rb") as f:
+            try:
+                added, errors = import_records(args.team, f, args.file)
+            except ImportFileError as e:
+                raise SystemExit(f"❌ {e}")
+        for error in errors:
+            print(error)
+        print(f"✅ Добавлено записей: {len(added)}, ошибок: {len(errors)}")
+    else:
+        with open(args.file, "wb") as f:
+            count = export(f, [args.team] if args.team else all_teams(), args.file)
+        print(f"✅ Выгружено записей: {count}")
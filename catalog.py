@@ -0,0 +1,98 @@
+# catalog.py
+# Каталог команд: какие команды есть в хранилище и сколько в них записей.
+# Результат сканирования кэшируется в одном файле-манифесте вместе с метками
+# версий, поэтому при следующем запуске пересчитываются только изменившиеся команды.
+
+import os
+import json
+import logging
+import threading
+from typing import Dict
+
+from storage import STORE, Leave
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_PATH = os.environ.get("MANIFEST_PATH", "teams_manifest.json")
+MANIFEST_VERSION = 1
+
+
+def _plain(stamp):
+    # метки бэкендов — вложенные кортежи; в манифесте они становятся списками
+    return json.loads(json.dumps(stamp))
+
+
+class TeamCatalog:
+    """
+    Команды хранилища с числом записей.
+    scan() сверяет метки версий бэкенда с манифестом и пересчитывает только изменившиеся
+    команды; во время работы число записей поддерживается по событиям STORE.
+    """
+
+    def __init__(self, store=STORE, manifest_path: str = MANIFEST_PATH):
+        self.store = store
+        self.manifest_path = manifest_path
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def _read_manifest(self) -> dict:
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError):
+            logger.warning("Манифест %s не читается, команды будут пересчитаны", self.manifest_path)
+            return {}
+        if data.get("version") != MANIFEST_VERSION:
+            return {}
+        return data.get("teams", {})
+
+    def _write_manifest(self, teams: dict):
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "teams": teams}, f, ensure_ascii=False)
+        os.replace(tmp, self.manifest_path)
+
+    def scan(self) -> Dict[str, int]:
+        """Находит все команды хранилища; возвращает {команда: число записей}."""
+        manifest = self._read_manifest()
+        teams = {}
+        changed = 0
+        for team, stamp in self.store.backend.scan().items():
+            stamp = _plain(stamp)
+            cached = manifest.get(team)
+            if cached is not None and cached.get("stamp") == stamp:
+                count = cached["records"]
+            else:
+                count = len(self.store.fresh_records(team))
+                changed += 1
+            teams[team] = {"stamp": stamp, "records": count}
+        self._write_manifest(teams)
+        with self._lock:
+            for team, entry in teams.items():
+                # команды, уже загруженные в STORE, считаются по событиям — их не трогаем
+                self._counts.setdefault(team, entry["records"])
+        logger.info("Каталог: команд %d, пересчитано %d", len(teams), changed)
+        return {team: entry["records"] for team, entry in teams.items()}
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+    # события хранилища
+    def reset(self, team: str, records):
+        with self._lock:
+            self._counts[team] = len(records)
+
+    def added(self, team: str, rec: Leave):
+        with self._lock:
+            self._counts[team] = self._counts.get(team, 0) + 1
+
+    def removed(self, team: str, rec: Leave):
+        with self._lock:
+            self._counts[team] = self._counts.get(team, 0) - 1
+
+
+CATALOG = TeamCatalog()
+STORE.subscribe(CATALOG)
@@ -0,0 +1,164 @@
+# codec.py
+# Формат записи об отсутствии: 'Имя: ДД.ММ.ГГГГ – ДД.ММ.ГГГГ [Тип] #id'.
+# Разбор без strptime: строка точного формата разбирается одним регулярным выражением,
+# даты фиксированной длины режутся срезами, а одинаковые строки дат разбираются
+# один раз и дают один и тот же объект date. Строки, поправленные руками, идут
+# через медленный, но терпимый к отступлениям разбор.
+#
+#   python codec.py bench [--lines 100000]
+
+import re
+import datetime
+import zlib
+from typing import Iterable, Iterator, NamedTuple, Optional, Tuple
+
+DATE_FMT = "%d.%m.%Y"
+DASH = " – "
+
+_dates = {}  # 'ДД.ММ.ГГГГ' -> date; в данных всего несколько тысяч разных дат
+_DATES_MAX = 100_000
+
+
+class Leave(NamedTuple):
+    """Одна запись об отсутствии сотрудника."""
+    name: str
+    start: datetime.date
+    end: datetime.date
+    leave_type: str
+    rid: str = ""  # стабильный идентификатор записи внутри команды
+
+    @property
+    def days(self) -> int:
+        return (self.end - self.start).days + 1
+
+    def __str__(self) -> str:
+        return f"{self.name}: {format_date(self.start)}{DASH}{format_date(self.end)} [{self.leave_type}]"
+
+    def to_line(self) -> str:
+        """Строка для файла; в отличие от str() содержит идентификатор."""
+        return f"{self} #{self.rid}\n" if self.rid else f"{self}\n"
+
+    @property
+    def version(self) -> str:
+        """Короткий отпечаток содержимого: кнопка со старым отпечатком ссылается на устаревшую запись."""
+        return f"{zlib.crc32(self.to_line().encode('utf-8')):08x}"
+
+
+_LINE = re.compile(r"([^:]*): (\d\d\.\d\d\.\d{4}) – (\d\d\.\d\d\.\d{4}) \[([^\]]*)\] *#?(\S*)\s*$", re.ASCII)
+# Leave без проверки числа полей в NamedTuple.__new__ — заметная доля времени разбора
+_new = tuple.__new__
+
+
+def parse_date(text: str) -> datetime.date:
+    """'ДД.ММ.ГГГГ' -> date; иной формат или несуществующая дата — ValueError."""
+    day = _dates.get(text)
+    if day is not None:
+        return day
+    if len(text) != 10 or text[2] != "." or text[5] != ".":
+        raise ValueError(f"неверная дата: {text!r}")
+    digits = text[:2] + text[3:5] + text[6:]
+    # isdigit пропускает и не-ASCII цифры, int() на них всё равно даст ValueError
+    if not (digits.isascii() and digits.isdigit()):
+        raise ValueError(f"неверная дата: {text!r}")
+    day = datetime.date(int(text[6:]), int(text[3:5]), int(text[:2]))
+    if len(_dates) < _DATES_MAX:
+        _dates[text] = day
+    return day
+
+
+def format_date(day: datetime.date) -> str:
+    return f"{day.day:02d}.{day.month:02d}.{day.year:04d}"
+
+
+def _loose_date(text: str) -> datetime.date:
+    # в строках, поправленных руками, встречается и '1.2.2026'
+    if len(text) == 10:
+        return parse_date(text)
+    day, month, year = text.split(".")
+    return datetime.date(int(year), int(month), int(day))
+
+
+def _parse_loose(line: str) -> Leave:
+    # запасной разбор для строк, поправленных руками: лишние пробелы, пропущенный id и т. п.
+    name, period = line.split(":", 1)
+    s_str, rest = period.split("–", 1)
+    e_str, _, tail = rest.partition("[")
+    lt, _, rid = tail.partition("]")
+    return Leave(name, _loose_date(s_str.strip()), _loose_date(e_str.strip()), lt.strip() or "Отпуск",
+                 rid.strip().lstrip("#"))
+
+
+def parse_line(line: str) -> Optional[Leave]:
+    """Разбирает строку записи (id может не быть); битые строки -> None."""
+    m = _LINE.match(line)
+    if m is not None:
+        # быстрый путь — ровно тот формат, который пишет to_line()
+        name, s_str, e_str, lt, rid = m.groups()
+        try:
+            return _new(Leave, (name, parse_date(s_str), parse_date(e_str), lt.strip() or "Отпуск", rid))
+        except ValueError:
+            return None
+    try:
+        return _parse_loose(line)
+    except ValueError:
+        return None
+
+
+def parse_many(lines: Iterable[str], first_line: int = 1) -> Iterator[Tuple[int, str, Optional[Leave]]]:
+    """
+    Разбирает файл целиком: (номер строки, строка, запись или None для битой строки).
+    Пустые строки пропускаются.
+    """
+    parse = parse_line
+    for lineno, line in enumerate(lines, first_line):
+        if line.strip():
+            yield lineno, line, parse(line)
+
+
+def _bench(count: int):
+    import random
+    import time
+
+    def strptime_parse(line: str):
+        # разбор до появления кодека — для сравнения
+        try:
+            name, period = line.split(":", 1)
+            s_str, rest = period.split("–", 1)
+            e_str, _, tail = rest.partition("[")
+            lt, _, rid = tail.partition("]")
+            start = datetime.datetime.strptime(s_str.strip(), DATE_FMT).date()
+            end = datetime.datetime.strptime(e_str.strip(), DATE_FMT).date()
+        except ValueError:
+            return None
+        return Leave(name, start, end, lt.strip() or "Отпуск", rid.strip().lstrip("#"))
+
+    base = datetime.date(2020, 1, 1).toordinal()
+    lines = []
+    for i in range(count):
+        start = datetime.date.fromordinal(base + random.randrange(2500))
+        end = start + datetime.timedelta(days=random.randrange(28))
+        lines.append(Leave(f"Сотрудник {i % 3000}", start, end, "Отпуск", f"{i:012x}").to_line())
+
+    timings = {}
+    for label, run in (
+        ("strptime", lambda: [strptime_parse(line) for line in lines]),
+        ("codec", lambda: [rec for _, _, rec in parse_many(lines)]),
+    ):
+        _dates.clear()
+        began = time.perf_counter()
+        result = run()
+        timings[label] = time.perf_counter() - began
+        print(f"{label:>9}: {timings[label] * 1e3:8.1f} мс, {timings[label] / count * 1e6:.2f} мкс/строка")
+    print(f"ускорение: ×{timings['strptime'] / timings['codec']:.1f}")
+    assert [strptime_parse(line) for line in lines[:1000]] == result[:1000]
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Кодек строк записей")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("bench", help="сравнить скорость разбора со strptime")
+    bench.add_argument("--lines", type=int, default=100_000)
+    args = parser.parse_args()
+    if args.command == "bench":
+        _bench(args.lines)
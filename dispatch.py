@@ -0,0 +1,167 @@
+# dispatch.py
+# Параллельная обработка обновлений: разные чаты обрабатываются одновременно
+# (не больше UPDATE_WORKERS хендлеров сразу), а обновления одного чата — строго
+# по очереди, в порядке поступления: от этого зависят состояния ConversationHandler.
+
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+UPDATE_WORKERS = int(os.environ.get("UPDATE_WORKERS", "16"))
+# сколько обновлений может быть принято в обработку (идут + ждут своей очереди в чате);
+# дальше приём останавливается и обновления копятся у источника
+UPDATE_BACKLOG = int(os.environ.get("UPDATE_BACKLOG", "1000"))
+
+
+def chat_key(update: object):
+    """Ключ порядка: чат, а для обновлений без чата (inline-запросы и т. п.) — пользователь."""
+    if isinstance(update, Update):
+        if update.effective_chat is not None:
+            return "c", update.effective_chat.id
+        if update.effective_user is not None:
+            return "u", update.effective_user.id
+    return None
+
+
+class ChatOrderedProcessor(BaseUpdateProcessor):
+    """
+    Обновление сначала встаёт в очередь своего чата (asyncio.Lock выдаёт захват
+    в порядке ожидания), и только дойдя до её головы занимает один из workers слотов.
+    Поэтому поток сообщений из одного чата не занимает слоты, пока ждёт сам себя,
+    и не задерживает остальные чаты.
+
+    Семафор PTB ограничивает всё принятое в обработку (backlog); задачи, ждущие
+    на нём, тоже просыпаются по порядку, так что порядок внутри чата сохраняется.
+    Приём новых обновлений в BackpressureQueue ждёт, пока backlog не освободится.
+    """
+
+    def __init__(self, workers: int = UPDATE_WORKERS, backlog: int = UPDATE_BACKLOG, report_every: float = 60.0):
+        super().__init__(max_concurrent_updates=backlog)
+        self.workers = workers
+        self.backlog = backlog
+        self.report_every = report_every
+        self._slots = None
+        self._room = None
+        self._chats = {}  # ключ чата -> [asyncio.Lock, обновлений чата в обработке]
+        self.admitted = 0  # взято из очереди и ещё не обработано
+        self.running = 0
+        self.processed = 0
+        self.max_admitted = 0
+        self.wait_max = 0.0
+        self.queue = None
+        self._task = None
+
+    async def initialize(self):
+        self._slots = asyncio.Semaphore(self.workers)
+        self._room = asyncio.Event()
+        self._room.set()
+        self._task = asyncio.get_running_loop().create_task(self._report())
+
+    async def shutdown(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def admit(self):
+        """Ждёт свободного места в backlog и резервирует его под следующее обновление."""
+        while self.admitted >= self.backlog:
+            self._room.clear()
+            await self._room.wait()
+        self.admitted += 1
+        self.max_admitted = max(self.max_admitted, self.admitted)
+
+    def _release(self):
+        self.admitted -= 1
+        if self.admitted < self.backlog:
+            self._room.set()
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]):
+        key = chat_key(update)
+        entry = None
+        locked = False
+        try:
+            if key is not None:
+                entry = self._chats.get(key)
+                if entry is None:
+                    entry = self._chats[key] = [asyncio.Lock(), 0]
+                entry[1] += 1
+                await entry[0].acquire()
+                locked = True
+            before = time.monotonic()
+            async with self._slots:
+                self.wait_max = max(self.wait_max, time.monotonic() - before)
+                self.running += 1
+                try:
+                    await coroutine
+                finally:
+                    self.running -= 1
+                    self.processed += 1
+        finally:
+            if entry is not None:
+                if locked:
+                    entry[0].release()
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._chats[key]
+            self._release()
+
+    def snapshot(self) -> dict:
+        return {
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "admitted": self.admitted,
+            "running": self.running,
+            "chats": len(self._chats),
+            "processed": self.processed,
+            "max_admitted": self.max_admitted,
+            "slot_wait_max": self.wait_max,
+        }
+
+    async def _report(self):
+        while True:
+            await asyncio.sleep(self.report_every)
+            stats = self.snapshot()
+            log = logger.warning if stats["admitted"] >= self.backlog else logger.info
+            log(
+                "Обновления: в очереди %d, принято %d/%d (макс. %d), выполняется %d/%d, чатов %d, "
+                "обработано %d, ожидание слота до %.0f мс",
+                stats["queued"], stats["admitted"], self.backlog, stats["max_admitted"],
+                stats["running"], self.workers, stats["chats"], stats["processed"],
+                stats["slot_wait_max"] * 1000
+            )
+            self.max_admitted = self.admitted
+            self.wait_max = 0.0
+
+
+class BackpressureQueue(asyncio.Queue):
+    """
+    update_queue приложения: get() отдаёт следующее обновление только когда в backlog
+    процессора есть место. Пока его нет, очередь заполняется до maxsize, и тогда
+    put() источника (polling или webhook) тоже ждёт — Telegram придерживает обновления у себя.
+    """
+
+    def __init__(self, processor: ChatOrderedProcessor, maxsize: int = UPDATE_BACKLOG):
+        super().__init__(maxsize=maxsize)
+        self.processor = processor
+        processor.queue = self
+
+    async def get(self):
+        await self.processor.admit()
+        try:
+            item = await super().get()
+        except BaseException:
+            # ожидание отменили (остановка приложения) — зарезервированное место не понадобилось
+            self.processor._release()
+            raise
+        if not isinstance(item, Update):
+            # в очередь бота кладутся только Update; другой объект — сигнал, которым
+            # Application.stop() будит цикл приёма. Процессор его не получит, и место
+            # do_process_update не вернёт
+            self.processor._release()
+        return item
@@ -0,0 +1,570 @@
+# indexes.py
+# Индексы поверх storage.STORE: обновляются по событиям хранилища
+# (reset/added/removed), поэтому запросы к ним не трогают файлы команд.
+
+import datetime
+import random
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from storage import STORE, Leave
+
+LIMITED_TYPE = "Отпуск"
+YEAR_LIMIT = 28
+
+
+def days_by_year(start: datetime.date, end: datetime.date) -> Dict[int, int]:
+    """Раскладывает период по календарным годам: {год: число дней}."""
+    result = {}
+    for year in range(start.year, end.year + 1):
+        s = max(start, datetime.date(year, 1, 1))
+        e = min(end, datetime.date(year, 12, 31))
+        result[year] = (e - s).days + 1
+    return result
+
+
+class TotalsIndex:
+    """
+    Использованные дни отпуска по ключу (команда, сотрудник, год).
+    Отпуск, переходящий через Новый год, делится по календарным годам.
+    """
+
+    def __init__(self):
+        self._teams = {}  # team -> {(name, year): days}
+        self._lock = threading.Lock()
+        # (team, name, year) -> дни из архива закрытых лет; подключает archive.py
+        self.archived = None
+
+    @staticmethod
+    def build(records: Iterable[Leave]) -> Dict[Tuple[str, int], int]:
+        totals = defaultdict(int)
+        for rec in records:
+            if rec.leave_type == LIMITED_TYPE:
+                for year, days in days_by_year(rec.start, rec.end).items():
+                    totals[(rec.name, year)] += days
+        return dict(totals)
+
+    def _apply(self, team: str, rec: Leave, sign: int):
+        if rec.leave_type != LIMITED_TYPE:
+            return
+        totals = self._teams.setdefault(team, {})
+        for year, days in days_by_year(rec.start, rec.end).items():
+            key = (rec.name, year)
+            left = totals.get(key, 0) + sign * days
+            if left:
+                totals[key] = left
+            else:
+                totals.pop(key, None)
+
+    # события хранилища
+    def reset(self, team: str, records: Iterable[Leave]):
+        totals = self.build(records)
+        with self._lock:
+            self._teams[team] = totals
+
+    def added(self, team: str, rec: Leave):
+        with self._lock:
+            self._apply(team, rec, 1)
+
+    def removed(self, team: str, rec: Leave):
+        with self._lock:
+            self._apply(team, rec, -1)
+
+    def used(self, team: str, name: str, year: int) -> int:
+        with self._lock:
+            days = self._teams.get(team, {}).get((name, year), 0)
+        if self.archived is not None:
+            days += self.archived(team, name, year)
+        return days
+
+    def snapshot(self, team: str) -> Dict[Tuple[str, int], int]:
+        with self._lock:
+            return dict(self._teams.get(team, {}))
+
+
+TOTALS = TotalsIndex()
+STORE.subscribe(TOTALS)
+
+
+def total_days_this_year(team: str, name: str, year: int) -> int:
+    STORE.sync(team)
+    return TOTALS.used(team, name, year)
+
+
+def over_limit(team: str, name: str, start: datetime.date, end: datetime.date, old: Leave = None):
+    """
+    Проверяет лимит 28 дн./год по каждому календарному году периода.
+    При редактировании old — заменяемая запись, её дни не учитываются.
+    Возвращает (год, уже использовано, запрошено) для первого превышения или None.
+    """
+    old_days = days_by_year(old.start, old.end) if old is not None and old.leave_type == LIMITED_TYPE else {}
+    for year, days in days_by_year(start, end).items():
+        used = total_days_this_year(team, name, year) - old_days.get(year, 0)
+        if used + days > YEAR_LIMIT:
+            return year, used, days
+    return None
+
+
+def check_batch(team: str, recs: List[Leave]) -> List[Optional[Tuple[int, int, int]]]:
+    """
+    Проверяет лимит для пачки новых записей разом: каждая запись учитывает и хранилище,
+    и принятые до неё записи пачки. Для каждой записи — None или (год, использовано, запрошено).
+    """
+    STORE.sync(team)
+    pending = defaultdict(int)  # (сотрудник, год) -> дни, принятые в этой пачке
+    result = []
+    for rec in recs:
+        excess = None
+        if rec.leave_type == LIMITED_TYPE:
+            parts = days_by_year(rec.start, rec.end)
+            for year, days in parts.items():
+                used = TOTALS.used(team, rec.name, year) + pending[(rec.name, year)]
+                if used + days > YEAR_LIMIT:
+                    excess = year, used, days
+                    break
+            else:
+                for year, days in parts.items():
+                    pending[(rec.name, year)] += days
+        result.append(excess)
+    return result
+
+
+def check_totals(team: str, store=STORE, totals: TotalsIndex = TOTALS) -> Dict[Tuple[str, int], Tuple[int, int]]:
+    """
+    Сверяет живой индекс с пересчётом по данным команды, прочитанным из хранилища заново
+    (только на чтение). Возвращает расхождения {(сотрудник, год): (в индексе, по хранилищу)};
+    пустой словарь — всё сходится. Смысл сверка имеет только для индекса работающего бота,
+    который обновлялся событиями, — её периодически запускает service.TotalsAudit.
+    """
+    expected = TotalsIndex.build(store.fresh_records(team))
+    live = totals.snapshot(team)
+    return {
+        key: (live.get(key, 0), expected.get(key, 0))
+        for key in live.keys() | expected.keys()
+        if live.get(key, 0) != expected.get(key, 0)
+    }
+
+
+def normalize_name(name: str) -> str:
+    return " ".join(name.casefold().replace("ё", "е").split())
+
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Расстояние Левенштейна, считаемое только в полосе шириной limit вокруг диагонали;
+    всё, что больше limit, возвращается как limit + 1.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    over = limit + 1
+    prev = [j if j <= limit else over for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        ca = a[i - 1]
+        lo, hi = max(1, i - limit), min(len(b), i + limit)
+        cur = [over] * (len(b) + 1)
+        cur[0] = i if i <= limit else over
+        best = cur[0]
+        for j in range(lo, hi + 1):
+            v = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != b[j - 1]))
+            cur[j] = v
+            if v < best:
+                best = v
+        if best > limit:
+            return over
+        prev = cur
+    return min(prev[-1], over)
+
+
+class NameIndex:
+    """
+    Глобальный (по всем командам) инвертированный индекс: нормализованное имя -> записи по командам.
+    Поиск точный, по префиксу имени или любого его слова ("Ива" находит "Иванов Иван")
+    и нечёткий — по триграммам с проверкой расстояния Левенштейна до имени целиком
+    или до любого его слова ("Ивонов" находит "Иванов Иван").
+    """
+
+    def __init__(self):
+        self._postings = {}  # norm -> {team: [Leave]}
+        self._keys = []  # отсортированные (ключ, norm) для префиксного поиска
+        self._terms = defaultdict(set)  # имя целиком или одно его слово -> {norm}
+        self._grams = defaultdict(set)  # триграмма -> {слово или имя из _terms}
+        self._team_names = defaultdict(set)  # team -> {norm}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _prefix_keys(norm: str):
+        # ключи: имя целиком и каждый его «хвост», начинающийся со слова
+        words = norm.split(" ")
+        return [(" ".join(words[i:]), norm) for i in range(len(words))]
+
+    @staticmethod
+    def _fuzzy_terms(norm: str) -> set:
+        # нечёткий поиск сравнивает запрос с именем целиком и с каждым словом:
+        # чаще всего ищут по одной фамилии
+        return {norm, *norm.split(" ")}
+
+    def _add_name(self, norm: str):
+        for key in self._prefix_keys(norm):
+            insort(self._keys, key)
+        for term in self._fuzzy_terms(norm):
+            names = self._terms[term]
+            if not names:
+                for gram in trigrams(term):
+                    self._grams[gram].add(term)
+            names.add(norm)
+
+    def _drop_name(self, norm: str):
+        for key in self._prefix_keys(norm):
+            i = bisect_left(self._keys, key)
+            if i < len(self._keys) and self._keys[i] == key:
+                del self._keys[i]
+        for term in self._fuzzy_terms(norm):
+            names = self._terms.get(term)
+            if names is None:
+                continue
+            names.discard(norm)
+            if names:
+                continue
+            del self._terms[term]
+            for gram in trigrams(term):
+                terms = self._grams.get(gram)
+                if terms is not None:
+                    terms.discard(term)
+                    if not terms:
+                        del self._grams[gram]
+
+    def _add(self, team: str, rec: Leave):
+        norm = normalize_name(rec.name)
+        teams = self._postings.get(norm)
+        if teams is None:
+            teams = self._postings[norm] = {}
+            self._add_name(norm)
+        teams.setdefault(team, []).append(rec)
+        self._team_names[team].add(norm)
+
+    def _remove(self, team: str, rec: Leave):
+        norm = normalize_name(rec.name)
+        teams = self._postings.get(norm, {})
+        recs = teams.get(team)
+        if not recs or rec not in recs:
+            return
+        recs.remove(rec)
+        if not recs:
+            del teams[team]
+            self._team_names[team].discard(norm)
+        if not teams:
+            del self._postings[norm]
+            self._drop_name(norm)
+
+    def _drop_team(self, team: str):
+        for norm in self._team_names.pop(team, ()):
+            teams = self._postings.get(norm, {})
+            teams.pop(team, None)
+            if not teams:
+                self._postings.pop(norm, None)
+                self._drop_name(norm)
+
+    # события хранилища
+    def reset(self, team: str, records: Iterable[Leave]):
+        with self._lock:
+            self._drop_team(team)
+            for rec in records:
+                self._add(team, rec)
+
+    def added(self, team: str, rec: Leave):
+        with self._lock:
+            self._add(team, rec)
+
+    def removed(self, team: str, rec: Leave):
+        with self._lock:
+            self._remove(team, rec)
+
+    def _collect(self, norms) -> Dict[str, list]:
+        result = defaultdict(list)
+        for norm in sorted(norms):
+            for team, recs in self._postings.get(norm, {}).items():
+                result[team].extend(recs)
+        return dict(result)
+
+    def exact(self, name: str) -> Dict[str, list]:
+        with self._lock:
+            return self._collect([normalize_name(name)])
+
+    def prefix(self, query: str) -> Dict[str, list]:
+        q = normalize_name(query)
+        norms = set()
+        with self._lock:
+            i = bisect_left(self._keys, (q, ""))
+            while i < len(self._keys) and self._keys[i][0].startswith(q):
+                norms.add(self._keys[i][1])
+                i += 1
+            return self._collect(norms)
+
+    def fuzzy(self, query: str, max_distance: int = 2) -> Dict[str, list]:
+        q = normalize_name(query)
+        grams = trigrams(q)
+        # каждая правка портит не больше трёх триграмм, поэтому у подходящего слова или имени
+        # общих триграмм не меньше need, а значит, есть хотя бы одна из 3k+1 самых редких
+        need = len(grams) - 3 * max_distance
+        with self._lock:
+            rare = sorted(grams, key=lambda g: len(self._grams.get(g, ())))
+            if need > 0:
+                rare = rare[:3 * max_distance + 1]
+            candidates = set()
+            for gram in rare:
+                candidates.update(self._grams.get(gram, ()))
+            norms = set()
+            for term in candidates:
+                if len(trigrams(term) & grams) >= need and edit_distance(q, term, max_distance) <= max_distance:
+                    norms.update(self._terms[term])
+            return self._collect(norms)
+
+    def search(self, query: str) -> Dict[str, list]:
+        """Точное совпадение, затем префикс, затем нечёткий поиск — первое непустое."""
+        return self.exact(query) or self.prefix(query) or self.fuzzy(query)
+
+
+NAMES = NameIndex()
+STORE.subscribe(NAMES)
+
+
+def type_key(leave_type: str) -> str:
+    # "Отпуск за свой счет" и "...счёт" встречаются в данных в обоих написаниях
+    return leave_type.replace("ё", "е")
+
+
+class SortedIndex:
+    """
+    Записи каждой команды, заранее отсортированные по дате начала — все вместе и по типам.
+    Страница списка с фильтром по типу и периоду берётся срезом по bisect, без пересортировки.
+    """
+
+    def __init__(self):
+        self._lists = {}  # (team, type_key | None) -> отсортированные (начало, конец, rid)
+        self._records = {}  # team -> {rid: Leave}
+        self._max_days = {}  # team -> верхняя граница длительности записи
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(rec: Leave):
+        return rec.start.toordinal(), rec.end.toordinal(), rec.rid
+
+    def _add(self, team: str, rec: Leave):
+        key = self._key(rec)
+        for list_key in ((team, None), (team, type_key(rec.leave_type))):
+            insort(self._lists.setdefault(list_key, []), key)
+        self._records.setdefault(team, {})[rec.rid] = rec
+        self._max_days[team] = max(self._max_days.get(team, 0), rec.days)
+
+    def _remove(self, team: str, rec: Leave):
+        key = self._key(rec)
+        for list_key in ((team, None), (team, type_key(rec.leave_type))):
+            keys = self._lists.get(list_key, [])
+            i = bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                del keys[i]
+        self._records.get(team, {}).pop(rec.rid, None)
+
+    # события хранилища
+    def reset(self, team: str, records: Iterable[Leave]):
+        with self._lock:
+            for list_key in [k for k in self._lists if k[0] == team]:
+                del self._lists[list_key]
+            self._records.pop(team, None)
+            self._max_days.pop(team, None)
+            for rec in records:
+                self._add(team, rec)
+
+    def added(self, team: str, rec: Leave):
+        with self._lock:
+            self._add(team, rec)
+
+    def removed(self, team: str, rec: Leave):
+        with self._lock:
+            self._remove(team, rec)
+
+    def query(self, team: str, leave_type: str = None, start: datetime.date = None,
+              end: datetime.date = None, offset: int = 0, limit: int = 20):
+        """
+        Записи команды, пересекающиеся с периодом [start, end] (границы необязательны),
+        по возрастанию даты начала. Возвращает (всего подходящих, записи страницы).
+        """
+        with self._lock:
+            keys = self._lists.get((team, type_key(leave_type) if leave_type else None), [])
+            lo_day = start.toordinal() if start else 0
+            hi_day = end.toordinal() if end else datetime.date.max.toordinal()
+            lo = bisect_left(keys, (lo_day,))
+            hi = max(lo, bisect_left(keys, (hi_day + 1,)))
+            # начавшиеся раньше start, но ещё идущие: их ищем только в окне максимальной длительности
+            window = bisect_left(keys, (lo_day - self._max_days.get(team, 0) + 1,)) if start else lo
+            head = [k for k in keys[window:lo] if k[1] >= lo_day and k[0] <= hi_day]
+            total = len(head) + hi - lo
+            page = head[offset:offset + limit]
+            first = lo + max(0, offset - len(head))
+            page += keys[first:min(hi, first + limit - len(page))]
+            records = self._records.get(team, {})
+            return total, [records[k[2]] for k in page]
+
+
+LISTING = SortedIndex()
+STORE.subscribe(LISTING)
+
+
+class _Node:
+    __slots__ = ("key", "end", "max_end", "prio", "left", "right")
+
+    def __init__(self, key: tuple):
+        self.key = key
+        self.end = key[1]
+        self.max_end = key[1]
+        self.prio = random.random()
+        self.left = None
+        self.right = None
+
+    def fix(self):
+        self.max_end = max(self.end,
+                           self.left.max_end if self.left else self.end,
+                           self.right.max_end if self.right else self.end)
+
+
+class IntervalTree:
+    """
+    Декартово дерево по (начало, конец, rid) с максимумом конца в каждом поддереве.
+    Вставка и удаление — O(log n); поиск пересечений с отрезком отсекает
+    поддеревья, которые заканчиваются раньше или начинаются позже него.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    @staticmethod
+    def _split(node, key):
+        # (ключи < key, ключи >= key)
+        if node is None:
+            return None, None
+        if node.key < key:
+            node.right, right = IntervalTree._split(node.right, key)
+            node.fix()
+            return node, right
+        left, node.left = IntervalTree._split(node.left, key)
+        node.fix()
+        return left, node
+
+    @staticmethod
+    def _merge(left, right):
+        if left is None or right is None:
+            return left or right
+        if left.prio > right.prio:
+            left.right = IntervalTree._merge(left.right, right)
+            left.fix()
+            return left
+        right.left = IntervalTree._merge(left, right.left)
+        right.fix()
+        return right
+
+    def insert(self, key: tuple):
+        left, right = self._split(self.root, key)
+        self.root = self._merge(self._merge(left, _Node(key)), right)
+        self.size += 1
+
+    def delete(self, key: tuple):
+        left, right = self._split(self.root, key)
+        # ключи уникальны (rid входит в ключ), поэтому в right отделяется ровно одна вершина
+        mid, right = self._split(right, key[:2] + (key[2] + "\0",))
+        if mid is not None:
+            self.size -= 1
+        self.root = self._merge(left, right)
+
+    def overlapping(self, lo: int, hi: int) -> list:
+        """Ключи отрезков, пересекающихся с [lo, hi], по возрастанию начала."""
+        found = []
+        stack = []
+        node = self.root
+        # симметричный обход без рекурсии с отсечением по max_end и по началу
+        while stack or node is not None:
+            if node is not None and node.max_end >= lo:
+                stack.append(node)
+                node = node.left
+                continue
+            if not stack:
+                break
+            node = stack.pop()
+            if node.key[0] > hi:
+                break
+            if node.end >= lo:
+                found.append(node.key)
+            node = node.right
+        return found
+
+
+class AbsenceIndex:
+    """
+    Дерево отрезков отсутствий по каждой команде: кто отсутствует в день или период
+    и с чем пересекается новая запись. Обновляется по событиям хранилища.
+    """
+
+    def __init__(self):
+        self._trees = {}  # team -> IntervalTree
+        self._records = {}  # team -> {rid: Leave}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(rec: Leave):
+        return rec.start.toordinal(), rec.end.toordinal(), rec.rid
+
+    def _add(self, team: str, rec: Leave):
+        self._trees.setdefault(team, IntervalTree()).insert(self._key(rec))
+        self._records.setdefault(team, {})[rec.rid] = rec
+
+    # события хранилища
+    def reset(self, team: str, records: Iterable[Leave]):
+        with self._lock:
+            self._trees[team] = IntervalTree()
+            self._records[team] = {}
+            for rec in records:
+                self._add(team, rec)
+
+    def added(self, team: str, rec: Leave):
+        with self._lock:
+            self._add(team, rec)
+
+    def removed(self, team: str, rec: Leave):
+        with self._lock:
+            if team in self._trees:
+                self._trees[team].delete(self._key(rec))
+            self._records.get(team, {}).pop(rec.rid, None)
+
+    def absent(self, team: str, start: datetime.date, end: datetime.date = None) -> List[Leave]:
+        """Записи команды, пересекающиеся с днём start или периодом [start, end]."""
+        end = end or start
+        with self._lock:
+            tree = self._trees.get(team)
+            if tree is None:
+                return []
+            records = self._records[team]
+            return [records[k[2]] for k in tree.overlapping(start.toordinal(), end.toordinal())]
+
+    def overlaps(self, team: str, rec: Leave, exclude: Leave = None) -> Tuple[List[Leave], List[Leave]]:
+        """
+        Пересечения периода rec с записями команды: (свои записи того же сотрудника,
+        записи коллег). exclude — редактируемая запись, с собой её не сравниваем.
+        """
+        own, others = [], []
+        key = normalize_name(rec.name)
+        for other in self.absent(team, rec.start, rec.end):
+            if exclude is not None and other.rid == exclude.rid:
+                continue
+            (own if normalize_name(other.name) == key else others).append(other)
+        return own, others
+
+
+ABSENCES = AbsenceIndex()
+STORE.subscribe(ABSENCES)
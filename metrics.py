@@ -0,0 +1,417 @@
+# metrics.py
+# Метрики в текстовом формате Prometheus: задержки и ошибки хендлеров, время и объём
+# операций хранилища, число записей по командам и снимки мониторов (очередь обновлений,
+# отправка, event loop). Отдаются локальным HTTP-эндпоинтом /metrics без сторонних пакетов.
+#
+# Там же выборочный профилировщик, включаемый на ходу:
+#
+#   curl -X POST 127.0.0.1:9464/profile/start?interval=0.005
+#   curl 127.0.0.1:9464/profile          # горячие стеки в collapsed-формате (для flamegraph.pl)
+#   curl -X POST 127.0.0.1:9464/profile/stop
+
+import os
+import sys
+import time
+import math
+import asyncio
+import logging
+import functools
+import threading
+import traceback
+from collections import Counter as _Tally
+from typing import Callable, Dict, Iterable, Optional, Tuple
+from urllib.parse import urlsplit, parse_qs
+
+logger = logging.getLogger(__name__)
+
+METRICS_LISTEN = os.environ.get("METRICS_LISTEN", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9464"))  # 0 — эндпоинт выключен
+# профилировщик с запуска бота (иначе включается через /profile/start)
+METRICS_PROFILE = os.environ.get("METRICS_PROFILE", "") not in ("", "0")
+
+HANDLER_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STORAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0, 5.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        # хранилище пишет из потоков пула, хендлеры — из event loop
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(n, "") for n in self.labels)
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in sorted(items):
+            yield f"{self.name}{_labels(self.labels, key)} {_number(value)}"
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class GaugeFunc(_Metric):
+    """Значение считается при каждом запросе /metrics: fn() -> число или {значения меток: число}."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable, labels: Iterable[str] = ()):
+        super().__init__(name, help, labels)
+        self.fn = fn
+
+    def samples(self) -> Iterable[str]:
+        try:
+            values = self.fn()
+        except Exception:
+            logger.exception("Метрика %s", self.name)
+            return
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in sorted(values.items(), key=lambda kv: str(kv[0])):
+            key = key if isinstance(key, tuple) else (key,)
+            yield f"{self.name}{_labels(self.labels, key)} {_number(value)}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), buckets: Iterable[float] = HANDLER_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            items = [(key, (list(e[0]), e[1], e[2])) for key, e in self._values.items()]
+        for key, (counts, total, count) in sorted(items):
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = 'le="%s"' % _number(bound)
+                yield f"{self.name}_bucket{_labels(self.labels, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labels, key)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labels, key)} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def _add(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"метрика {metric.name} уже есть")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Iterable[str] = ()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Iterable[str] = ()) -> Gauge:
+        return self._add(Gauge(name, help, labels))
+
+    def gauge_func(self, name: str, help: str, fn: Callable, labels: Iterable[str] = ()) -> GaugeFunc:
+        return self._add(GaugeFunc(name, help, fn, labels))
+
+    def histogram(self, name: str, help: str, labels: Iterable[str] = (),
+                  buckets: Iterable[float] = HANDLER_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def snapshot(self, prefix: str, snapshot: Callable[[], dict], help: str):
+        """Каждое числовое поле snapshot() монитора — отдельная метрика prefix_поле."""
+        for key, value in snapshot().items():
+            if isinstance(value, (int, float)):
+                self.gauge_func(f"{prefix}_{key}", f"{help}: {key}", lambda key=key: snapshot()[key])
+
+    def render(self) -> str:
+        return "\n".join(m.render() for m in list(self._metrics.values())) + "\n"
+
+
+METRICS = Registry()
+
+HANDLER_SECONDS = METRICS.histogram(
+    "bot_handler_seconds", "Время работы хендлера", ("handler", "branch"))
+HANDLER_ERRORS = METRICS.counter(
+    "bot_handler_errors_total", "Исключения в хендлерах", ("handler", "branch", "error"))
+STORAGE_SECONDS = METRICS.histogram(
+    "bot_storage_seconds", "Время операции бэкенда хранилища", ("op",), STORAGE_BUCKETS)
+STORAGE_BYTES = METRICS.counter(
+    "bot_storage_bytes_total", "Объём прочитанных и записанных строк записей", ("op", "direction"))
+STORAGE_ERRORS = METRICS.counter(
+    "bot_storage_errors_total", "Исключения в операциях хранилища", ("op",))
+
+
+def timed_handler(callback, name: str = None, branch: Callable = None):
+    """
+    Обёртка хендлера: время — в bot_handler_seconds, исключения — в bot_handler_errors_total.
+    branch(update, context) уточняет метку для хендлеров с ветвлением внутри (роутер).
+    """
+    name = name or callback.__name__
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        label = branch(update, context) if branch is not None else ""
+        began = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception as e:
+            # ApplicationHandlerStop — управление потоком, а не ошибка
+            if type(e).__name__ != "ApplicationHandlerStop":
+                HANDLER_ERRORS.inc(handler=name, branch=label, error=type(e).__name__)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - began, handler=name, branch=label)
+
+    return wrapper
+
+
+def _handlers(handlers) -> Iterable:
+    for handler in handlers:
+        # ConversationHandler: хендлеры входа, состояний и fallbacks
+        if hasattr(handler, "entry_points"):
+            yield from _handlers(handler.entry_points)
+            for state in handler.states.values():
+                yield from _handlers(state)
+            yield from _handlers(handler.fallbacks)
+        else:
+            yield handler
+
+
+def instrument_handlers(app, branches: Dict[str, Callable] = None):
+    """Оборачивает callback каждого зарегистрированного хендлера приложения (вызывать после add_handler)."""
+    branches = branches or {}
+    for group in app.handlers.values():
+        for handler in _handlers(group):
+            callback = handler.callback
+            if not getattr(callback, "__wrapped__", None):
+                handler.callback = timed_handler(callback, branch=branches.get(callback.__name__))
+
+
+def _payload(recs) -> int:
+    return sum(len(rec.to_line().encode("utf-8")) for rec in recs or ())
+
+
+# операция бэкенда -> (направление, какие записи она читает или пишет; args без self).
+# У compact только время: текстовый бэкенд пишет снимок через replace, и объём
+# считается там; в SQLite compact ничего не пишет
+_STORAGE_OPS = {
+    "load": ("read", lambda args, result: result),
+    "append": ("write", lambda args, result: (args[1],)),
+    "extend": ("write", lambda args, result: args[1]),
+    "remove": ("write", lambda args, result: (args[1],)),
+    "update": ("write", lambda args, result: (args[2],)),
+    "replace": ("write", lambda args, result: args[1]),
+    "compact": ("write", None),
+}
+
+
+def instrument_storage(backend):
+    """
+    Подменяет методы экземпляра бэкенда на замеряющие время и объём. Объём — длина строк
+    записей в формате файла, одинаково для текстового и SQLite-бэкенда.
+    """
+    for op, (direction, recs) in _STORAGE_OPS.items():
+        method = getattr(backend, op)
+
+        @functools.wraps(method)
+        def wrapper(*args, _op=op, _method=method, _direction=direction, _recs=recs, **kwargs):
+            began = time.perf_counter()
+            try:
+                result = _method(*args, **kwargs)
+            except Exception:
+                STORAGE_ERRORS.inc(op=_op)
+                raise
+            finally:
+                STORAGE_SECONDS.observe(time.perf_counter() - began, op=_op)
+            if _recs is not None:
+                STORAGE_BYTES.inc(_payload(_recs(args, result)), op=_op, direction=_direction)
+            return result
+
+        setattr(backend, op, wrapper)
+
+
+class SamplingProfiler:
+    """
+    Раз в interval секунд снимает стеки всех потоков (sys._current_frames) и считает,
+    сколько раз встретился каждый стек. Накладные расходы — один обход кадров на выборку,
+    поэтому его можно держать включённым на работающем боте.
+    """
+
+    def __init__(self, interval: float = 0.01, depth: int = 64):
+        self.interval = interval
+        self.depth = depth
+        self.stacks = _Tally()
+        self.samples = 0
+        self._stop = threading.Event()
+        # stacks пополняет поток профилировщика, а читает обработчик /profile
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, interval: float = None):
+        if self._thread is not None:
+            return
+        if interval:
+            self.interval = interval
+        with self._lock:
+            self.stacks.clear()
+            self.samples = 0
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        logger.info("Профилировщик включён, шаг %.1f мс", self.interval * 1000)
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        logger.info("Профилировщик выключен: %d выборок", self.samples)
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            names.update((t.ident, t.name) for t in threading.enumerate())
+            keys = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = traceback.extract_stack(frame, limit=self.depth)
+                keys.append(";".join([names.get(ident, str(ident))] + [
+                    f"{f.name} ({os.path.basename(f.filename)}:{f.lineno})" for f in stack
+                ]))
+            with self._lock:
+                self.stacks.update(keys)
+                self.samples += 1
+
+    def collapsed(self, top: Optional[int] = None) -> str:
+        """Стеки в формате 'поток;внешний;…;внутренний число' — вход для flamegraph.pl и speedscope."""
+        with self._lock:
+            stacks = _Tally(self.stacks)
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common(top))
+
+
+PROFILER = SamplingProfiler()
+
+
+class MetricsServer:
+    """
+    Минимальный HTTP/1.0-сервер на asyncio: GET /metrics, GET /profile[?top=N],
+    POST /profile/start[?interval=сек], POST /profile/stop. Слушает по умолчанию только localhost.
+    """
+
+    def __init__(self, registry: Registry = METRICS, profiler: SamplingProfiler = PROFILER,
+                 listen: str = METRICS_LISTEN, port: int = METRICS_PORT):
+        self.registry = registry
+        self.profiler = profiler
+        self.listen = listen
+        self.port = port
+        self._server = None
+
+    def route(self, method: str, target: str) -> Tuple[int, str]:
+        url = urlsplit(target)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        if url.path == "/metrics" and method == "GET":
+            return 200, self.registry.render()
+        if url.path == "/profile" and method == "GET":
+            top = int(query["top"]) if "top" in query else None
+            return 200, self.profiler.collapsed(top)
+        if url.path == "/profile/start" and method == "POST":
+            self.profiler.start(float(query["interval"]) if "interval" in query else None)
+            return 200, "started\n"
+        if url.path == "/profile/stop" and method == "POST":
+            self.profiler.stop()
+            return 200, f"stopped, {self.profiler.samples} samples\n"
+        return 404, "not found\n"
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+                pass  # заголовки не нужны
+            try:
+                method, target, _ = request.decode("latin-1").split(" ", 2)
+                # профилировщик останавливается с join — не в event loop
+                status, body = await asyncio.get_running_loop().run_in_executor(None, self.route, method, target)
+            except ValueError:
+                status, body = 400, "bad request\n"
+            payload = body.encode("utf-8")
+            writer.write(
+                f"HTTP/1.0 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(payload)}\r\n\r\n".encode("latin-1") + payload
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.listen, self.port)
+        logger.info("Метрики: http://%s:%d/metrics", self.listen, self.port)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        self.profiler.stop()
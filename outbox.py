@@ -0,0 +1,197 @@
+# outbox.py
+# Исходящие сообщения: ограничение частоты запросов к Bot API (token bucket на весь бот
+# и на каждый чат), повтор при RetryAfter с разбросом и слияние нескольких ответов
+# подряд в одно сообщение.
+
+import os
+import time
+import random
+import asyncio
+import datetime
+import logging
+from typing import Any, Callable, Coroutine, Dict, List, Optional
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# лимиты Telegram: ~30 сообщений/с на бота, ~1/с в личный чат, 20/мин в группу
+SEND_GLOBAL_RATE = float(os.environ.get("SEND_GLOBAL_RATE", "30"))
+SEND_CHAT_RATE = float(os.environ.get("SEND_CHAT_RATE", "1"))
+SEND_GROUP_RATE = float(os.environ.get("SEND_GROUP_RATE", str(20 / 60)))
+SEND_MAX_RETRIES = int(os.environ.get("SEND_MAX_RETRIES", "3"))
+
+MESSAGE_LIMIT = 4096  # максимальная длина текста сообщения
+
+
+class TokenBucket:
+    """
+    Ведро на rate токенов в секунду с запасом capacity. reserve() сразу списывает токен
+    (баланс может уйти в минус) и возвращает, сколько ждать до его появления, —
+    поэтому ждущие обслуживаются в порядке обращения без повторных проверок.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def pause(self, seconds: float):
+        """Отодвигает следующий токен на seconds (после RetryAfter)."""
+        self.reserve()
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+    @property
+    def idle(self) -> bool:
+        return self.tokens + (time.monotonic() - self.updated) * self.rate >= self.capacity
+
+
+def _retry_after(error: RetryAfter) -> float:
+    delay = error.retry_after
+    return delay.total_seconds() if isinstance(delay, datetime.timedelta) else float(delay)
+
+
+class SendLimiter(BaseRateLimiter[int]):
+    """
+    Ограничитель для ApplicationBuilder.rate_limiter(): каждый запрос к Bot API ждёт токен
+    своего чата (если в запросе есть chat_id), затем общий токен. На RetryAfter ведро
+    чата (или общее) ставится на паузу, и запрос повторяется через указанное время
+    плюс случайный разброс, чтобы повторы не пришли разом. Время ожидания в очереди
+    копится и раз в report_every секунд пишется в лог.
+    """
+
+    def __init__(self, global_rate: float = SEND_GLOBAL_RATE, chat_rate: float = SEND_CHAT_RATE,
+                 group_rate: float = SEND_GROUP_RATE, max_retries: int = SEND_MAX_RETRIES,
+                 report_every: float = 60.0):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self.report_every = report_every
+        self._chats = {}  # chat_id -> TokenBucket
+        self._task = None
+        self._reset()
+        self.retries = 0
+
+    def _reset(self):
+        self.sent = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    async def initialize(self):
+        self._task = asyncio.get_running_loop().create_task(self._report())
+
+    async def shutdown(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _bucket(self, chat_id) -> Optional[TokenBucket]:
+        if chat_id is None:
+            return None
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            # отрицательные id — группы и каналы, у них лимит строже
+            group = isinstance(chat_id, int) and chat_id < 0 or str(chat_id).startswith(("-", "@"))
+            rate = self.group_rate if group else self.chat_rate
+            bucket = self._chats[chat_id] = TokenBucket(rate, 3)
+        return bucket
+
+    async def _wait(self, bucket: Optional[TokenBucket]):
+        if bucket is not None:
+            delay = bucket.reserve()
+            if delay:
+                await asyncio.sleep(delay)
+        delay = self.global_bucket.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Any]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int],
+    ):
+        if endpoint == "getUpdates":
+            # long polling сам по себе не отправляет сообщений
+            return await callback(*args, **kwargs)
+        bucket = self._bucket(data.get("chat_id"))
+        max_retries = self.max_retries if rate_limit_args is None else rate_limit_args
+        attempt = 0
+        while True:
+            queued = time.monotonic()
+            await self._wait(bucket)
+            waited = time.monotonic() - queued
+            self.sent += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt >= max_retries:
+                    raise
+                attempt += 1
+                self.retries += 1
+                delay = _retry_after(e)
+                (bucket or self.global_bucket).pause(delay)
+                logger.warning("%s: RetryAfter %.1f с (попытка %d/%d)", endpoint, delay, attempt, max_retries)
+                await asyncio.sleep(delay + random.uniform(0, 0.1 * delay + 0.5))
+
+    def snapshot(self) -> dict:
+        return {
+            "sent": self.sent,
+            "wait_avg": self.wait_total / self.sent if self.sent else 0.0,
+            "wait_max": self.wait_max,
+            "retries": self.retries,
+            "chats": len(self._chats),
+        }
+
+    async def _report(self):
+        while True:
+            await asyncio.sleep(self.report_every)
+            stats = self.snapshot()
+            if stats["sent"]:
+                logger.info(
+                    "Отправка: %d запросов, ожидание в очереди ср. %.0f мс, макс. %.0f мс, повторов %d",
+                    stats["sent"], stats["wait_avg"] * 1000, stats["wait_max"] * 1000, stats["retries"]
+                )
+            self._reset()
+            # вёдра молчащих чатов полны — хранить их незачем
+            for chat_id in [c for c, b in self._chats.items() if b.idle]:
+                del self._chats[chat_id]
+
+
+def merge_texts(parts: List[str], limit: int = MESSAGE_LIMIT) -> List[str]:
+    """Склеивает тексты подряд идущих ответов в как можно меньше сообщений не длиннее limit."""
+    messages = []
+    for part in filter(None, parts):
+        while len(part) > limit:
+            # слишком длинный сам по себе ответ режем по переводу строки
+            cut = part.rfind("\n", 0, limit)
+            cut = cut if cut > 0 else limit
+            messages.append(part[:cut])
+            part = part[cut:].lstrip("\n")
+        if messages and len(messages[-1]) + 2 + len(part) <= limit:
+            messages[-1] += "\n\n" + part
+        else:
+            messages.append(part)
+    return messages
+
+
+async def reply_merged(message, parts: List[str], reply_markup=None):
+    """Отправляет ответы одним сообщением (или несколькими, если не влезают); клавиатура — у последнего."""
+    texts = merge_texts(parts)
+    for i, text in enumerate(texts):
+        await message.reply_text(text, reply_markup=reply_markup if i == len(texts) - 1 else None)
@@ -0,0 +1,239 @@
+# reminders.py
+# Напоминания накануне начала отсутствия и еженедельная сводка по команде.
+# Файлы не сканируются по расписанию: планировщик подписан на события хранилища
+# и держит одну кучу ближайших срабатываний, а между ними просто спит.
+
+import os
+import heapq
+import asyncio
+import datetime
+import logging
+import itertools
+import threading
+from typing import Callable, Dict, Iterable, List, Optional
+
+from telegram.error import TelegramError
+
+from storage import STORE, Leave
+from indexes import ABSENCES
+
+logger = logging.getLogger(__name__)
+
+REMINDERS = os.environ.get("REMINDERS", "1") == "1"
+REMINDER_HOUR = int(os.environ.get("REMINDER_HOUR", "9"))  # накануне начала, по местному времени
+DIGEST_WEEKDAY = int(os.environ.get("DIGEST_WEEKDAY", "0"))  # 0 — понедельник
+DIGEST_HOUR = int(os.environ.get("DIGEST_HOUR", "9"))
+DIGEST_DAYS = int(os.environ.get("DIGEST_DAYS", "7"))
+
+REMIND = "remind"
+DIGEST = "digest"
+
+
+def remind_at(rec: Leave) -> datetime.datetime:
+    return datetime.datetime.combine(rec.start - datetime.timedelta(days=1), datetime.time(REMINDER_HOUR))
+
+
+def next_digest(now: datetime.datetime) -> datetime.datetime:
+    days = (DIGEST_WEEKDAY - now.weekday()) % 7
+    when = datetime.datetime.combine(now.date() + datetime.timedelta(days=days), datetime.time(DIGEST_HOUR))
+    return when if when > now else when + datetime.timedelta(days=7)
+
+
+def reminder_text(recs: List[Leave]) -> str:
+    lines = "".join(f"{r}\n" for r in sorted(recs, key=lambda r: (r.start, r.name)))
+    return f"📣 Завтра начинается:\n{lines}"
+
+
+def digest_text(start: datetime.date, end: datetime.date, recs: List[Leave]) -> str:
+    title = f"🗓 Отсутствия {start.strftime('%d.%m')} – {end.strftime('%d.%m.%Y')}"
+    if not recs:
+        return f"{title}: никого."
+    return f"{title}:\n" + "".join(f"{r}\n" for r in sorted(recs, key=lambda r: (r.start, r.name)))
+
+
+class ReminderScheduler:
+    """
+    Куча (время, порядковый номер, вид, команда, rid) на все команды. Подписчик хранилища:
+    reset/added/removed пересчитывают срабатывание только изменившихся записей.
+    Удалённые и перенесённые записи из кучи не вынимаются — при срабатывании запись
+    сверяется с _pending и устаревшая пропускается; когда таких накапливается много,
+    куча пересобирается.
+
+    События хранилища приходят из потоков пула, поэтому куча под threading.Lock,
+    а спящий цикл будится через call_soon_threadsafe, если новое срабатывание раньше
+    того, до которого он спит.
+    """
+
+    def __init__(self, chats: Dict[str, str] = None, clock: Callable[[], datetime.datetime] = datetime.datetime.now):
+        self.chats = chats if chats is not None else {}  # chat_id -> команда (TEAM_NAMES)
+        self.clock = clock
+        self._heap = []
+        self._seq = itertools.count()
+        self._pending = {}  # team -> {rid: (время напоминания, запись)}
+        self._done = {}  # (team, rid) -> дата начала, о которой уже напомнили
+        self._lock = threading.Lock()
+        self._loop = None
+        self._wake = None
+        self._sleeping_until = None
+        self._task = None
+        self.bot = None
+        self.sync = None
+        self.sent = 0
+
+    # события хранилища
+    def reset(self, team: str, records: Iterable[Leave]):
+        now = self.clock()
+        with self._lock:
+            old = self._pending.get(team, {})
+            pending = self._pending[team] = {}
+            for rec in records:
+                kept = old.get(rec.rid)
+                if kept is not None and kept[1].start == rec.start:
+                    # перечитывание (например, после сжатия журнала) не сдвигает уже назначенное
+                    pending[rec.rid] = (kept[0], rec)
+                elif remind_at(rec) > now:
+                    # прошедшие при загрузке не досылаем: их могли отправить до перезапуска
+                    self._push(team, rec, remind_at(rec))
+            self._compact()
+        self._poke()
+
+    def added(self, team: str, rec: Leave):
+        now = self.clock()
+        if rec.start <= now.date():
+            return
+        with self._lock:
+            if self._done.get((team, rec.rid)) == rec.start:
+                # правка конца или типа после напоминания — повторно не напоминаем
+                return
+            # запись на завтра, добавленная после REMINDER_HOUR, напоминается сразу
+            self._push(team, rec, max(remind_at(rec), now))
+        self._poke()
+
+    def removed(self, team: str, rec: Leave):
+        with self._lock:
+            self._pending.get(team, {}).pop(rec.rid, None)
+
+    def _push(self, team: str, rec: Leave, when: datetime.datetime):
+        self._pending.setdefault(team, {})[rec.rid] = (when, rec)
+        heapq.heappush(self._heap, (when, next(self._seq), REMIND, team, rec.rid))
+
+    def _compact(self):
+        live = sum(len(p) for p in self._pending.values())
+        if len(self._heap) > 2 * live + 64:
+            self._heap = [e for e in self._heap if e[2] != REMIND or self._live(e)]
+            heapq.heapify(self._heap)
+
+    def _live(self, entry) -> bool:
+        when, _, _, team, rid = entry
+        pending = self._pending.get(team, {}).get(rid)
+        return pending is not None and pending[0] == when
+
+    def _poke(self):
+        # будим цикл, только если появилось что-то раньше текущего сна
+        if self._loop is None:
+            return
+        with self._lock:
+            head = self._heap[0][0] if self._heap else None
+        if head is not None and (self._sleeping_until is None or head < self._sleeping_until):
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def due(self, now: datetime.datetime) -> Dict[str, List[Leave]]:
+        """Снимает с кучи всё, что наступило к now: {команда: записи к напоминанию}; сводки — под ключом None."""
+        fired = {}
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                entry = heapq.heappop(self._heap)
+                kind, team, rid = entry[2:]
+                if kind == DIGEST:
+                    fired.setdefault(None, []).append(entry[0])
+                    heapq.heappush(self._heap, (next_digest(now), next(self._seq), DIGEST, None, None))
+                elif self._live(entry):
+                    rec = self._pending[team].pop(rid)[1]
+                    self._done[(team, rid)] = rec.start
+                    fired.setdefault(team, []).append(rec)
+            today = now.date()
+            for key in [k for k, start in self._done.items() if start <= today]:
+                del self._done[key]
+        return fired
+
+    def teams_with_chats(self) -> Dict[str, List[int]]:
+        teams = {}
+        for chat_id, team in list(self.chats.items()):
+            teams.setdefault(team, []).append(int(chat_id))
+        return teams
+
+    async def _send(self, chat_ids: List[int], text: str):
+        for chat_id in chat_ids:
+            try:
+                await self.bot.send_message(chat_id, text)
+                self.sent += 1
+            except TelegramError as e:
+                # бота удалили из чата и т. п. — остальным чатам команды всё равно отправляем
+                logger.warning("Напоминание в чат %s не отправлено: %s", chat_id, e)
+
+    async def fire(self, now: datetime.datetime):
+        fired = self.due(now)
+        if not fired:
+            return
+        teams = self.teams_with_chats()
+        for team, recs in fired.items():
+            if team is not None and team in teams:
+                await self._send(teams[team], reminder_text(recs))
+        if None in fired:
+            start = now.date()
+            end = start + datetime.timedelta(days=DIGEST_DAYS - 1)
+            for team, chat_ids in teams.items():
+                if self.sync is not None:
+                    # файл мог поменяться руками, а команда — быть ещё не загруженной
+                    await self.sync(team)
+                await self._send(chat_ids, digest_text(start, end, ABSENCES.absent(team, start, end)))
+
+    async def _run(self):
+        while True:
+            now = self.clock()
+            await self.fire(now)
+            with self._lock:
+                head = self._heap[0][0] if self._heap else None
+            # не дольше часа: часы могли перевести, а сон на asyncio идёт по monotonic
+            limit = now + datetime.timedelta(hours=1)
+            self._sleeping_until = min(head, limit) if head else limit
+            self._wake.clear()
+            delay = max(0.0, (self._sleeping_until - self.clock()).total_seconds())
+            try:
+                await asyncio.wait_for(self._wake.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self, bot, sync: Optional[Callable] = None):
+        """
+        Запускает цикл в текущем event loop. sync(team) — корутина загрузки команды:
+        команды с привязанными чатами загружаются, даже если прогрев при старте выключен.
+        """
+        self.bot = bot
+        self.sync = sync
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        with self._lock:
+            heapq.heappush(self._heap, (next_digest(self.clock()), next(self._seq), DIGEST, None, None))
+        self._task = self._loop.create_task(self._run())
+        if sync is not None:
+            for team in set(self.chats.values()):
+                self._loop.create_task(sync(team))
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._loop = None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "heap": len(self._heap),
+                "pending": sum(len(p) for p in self._pending.values()),
+                "sent": self.sent,
+            }
+
+
+SCHEDULER = ReminderScheduler()
+STORE.subscribe(SCHEDULER)
@@ -0,0 +1,372 @@
+# service.py
+# Асинхронный доступ к хранилищу для хендлеров бота: все обращения к диску/базе
+# выполняются в ограниченном пуле потоков, а не в event loop. Здесь же —
+# замер задержки event loop, по которому видно, что loop не блокируется.
+
+import os
+import time
+import asyncio
+import datetime
+import functools
+import contextlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Collection, Dict, List, NamedTuple, Optional, Tuple
+
+from storage import STORE, Leave
+from indexes import LIMITED_TYPE, NAMES, LISTING, ABSENCES, over_limit, check_batch, check_totals
+from catalog import CATALOG
+from archive import ARCHIVE, ARCHIVE_ENABLED, cutoff_year
+
+logger = logging.getLogger(__name__)
+
+IO_WORKERS = int(os.environ.get("IO_WORKERS", "8"))
+LOCK_WAIT_WARN = float(os.environ.get("LOCK_WAIT_WARN", "0.5"))
+WARM_TEAMS = os.environ.get("WARM_TEAMS", "1") == "1"
+TOTALS_CHECK_INTERVAL = float(os.environ.get("TOTALS_CHECK_INTERVAL", "3600"))  # 0 — не сверять
+
+_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="storage-io")
+
+
+async def run_io(func, *args, **kwargs):
+    """Выполняет блокирующий вызов в пуле ввода-вывода."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+class TeamLocks:
+    """
+    asyncio.Lock на каждую команду для всех изменений её данных.
+    Пока изменение ждёт блокировку, оно не занимает поток пула, поэтому очередь
+    правок одной команды не может вытеснить из пула остальные команды.
+    Время ожидания копится по командам — по нему видно, где конкуренция.
+    """
+
+    def __init__(self, warn_after: float = LOCK_WAIT_WARN):
+        self.warn_after = warn_after
+        self._locks = {}
+        self._waits = {}  # team -> [захватов, суммарное ожидание, максимальное ожидание]
+
+    @contextlib.asynccontextmanager
+    async def hold(self, team: str):
+        lock = self._locks.get(team)
+        if lock is None:
+            lock = self._locks[team] = asyncio.Lock()
+        before = time.monotonic()
+        async with lock:
+            waited = time.monotonic() - before
+            stats = self._waits.setdefault(team, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += waited
+            stats[2] = max(stats[2], waited)
+            if waited >= self.warn_after:
+                logger.warning("Команда %s: ожидание блокировки записи %.0f мс", team, waited * 1000)
+            yield
+
+    def stats(self) -> dict:
+        """{команда: {"acquired", "wait_total", "wait_max"}}"""
+        return {
+            team: {"acquired": n, "wait_total": total, "wait_max": worst}
+            for team, (n, total, worst) in self._waits.items()
+        }
+
+
+class SearchResult(NamedTuple):
+    found: Dict[str, List[Leave]]  # команда -> записи из рабочих данных
+    archived: Dict[str, dict]  # команда -> {ФИО: {год: {тип: дни}}} по сводкам архива
+    missing: List[str]  # шарды, не ответившие вовремя (только в режиме SHARDS)
+
+
+class LeaveService:
+    """
+    Асинхронный фасад над STORE и индексами.
+    Блокировки в STORE — по командам, поэтому долгая перезапись одной команды
+    занимает один поток пула и не задерживает изменения в других командах.
+    Изменения одной команды дополнительно выстраиваются в очередь на TeamLocks.
+    """
+
+    def __init__(self, store=STORE):
+        self.store = store
+        self.locks = TeamLocks()
+        self._compacting = {}  # team -> фоновая задача сжатия журнала
+
+    def _after_write(self, team: str):
+        # журнал команды разросся — сворачиваем его в снимок в фоне, под той же блокировкой
+        if team not in self._compacting and self.store.backend.wants_compaction(team):
+            self._compacting[team] = asyncio.get_running_loop().create_task(self._compact(team))
+
+    async def _compact(self, team: str):
+        try:
+            async with self.locks.hold(team):
+                # перенос закрытых лет сам пересобирает снимок — тогда сжимать уже нечего
+                moved = await run_io(ARCHIVE.archive, team, self.store) if ARCHIVE_ENABLED else 0
+                if not moved:
+                    await run_io(self.store.compact, team)
+        except Exception:
+            logger.exception("Команда %s: не удалось свернуть журнал", team)
+        finally:
+            self._compacting.pop(team, None)
+
+    async def records(self, team: str) -> List[Leave]:
+        return await run_io(self.store.records, team)
+
+    async def get(self, team: str, rid: str):
+        return await run_io(self.store.get, team, rid)
+
+    async def sync(self, team: str):
+        """Подтягивает изменения команды с диска, чтобы индексы были актуальны."""
+        await run_io(self.store.sync, team)
+
+    async def add(self, team: str, rec: Leave, check_limit: bool = False):
+        """
+        Добавляет запись. При check_limit лимит Отпуска проверяется под той же блокировкой;
+        если он превышен, ничего не пишется и возвращается (год, использовано, запрошено).
+        """
+        async with self.locks.hold(team):
+            result = await run_io(self._add, team, rec, check_limit)
+        self._after_write(team)
+        return result
+
+    def _add(self, team: str, rec: Leave, check_limit: bool):
+        if check_limit and rec.leave_type == LIMITED_TYPE:
+            excess = over_limit(team, rec.name, rec.start, rec.end)
+            if excess:
+                return excess
+        self.store.append(team, rec)
+        return None
+
+    async def add_many(self, team: str, recs: List[Leave], check_limit: bool = False):
+        """
+        Добавляет пачку записей одной транзакцией хранилища. С check_limit записи сверх лимита
+        Отпуска отбрасываются, остальные пишутся. Возвращает (добавленные, {номер в пачке: превышение}).
+        """
+        async with self.locks.hold(team):
+            result = await run_io(self._add_many, team, recs, check_limit)
+        self._after_write(team)
+        return result
+
+    def _add_many(self, team: str, recs: List[Leave], check_limit: bool):
+        checks = check_batch(team, recs) if check_limit else [None] * len(recs)
+        accepted = [rec for rec, excess in zip(recs, checks) if excess is None]
+        added = self.store.extend(team, accepted)
+        return added, {i: excess for i, excess in enumerate(checks) if excess}
+
+    async def remove(self, team: str, rec: Leave):
+        async with self.locks.hold(team):
+            await run_io(self.store.remove, team, rec)
+        self._after_write(team)
+
+    async def update(self, team: str, old: Leave, new: Leave, check_limit: bool = False):
+        """Заменяет запись old на new; с check_limit — как add(), без учёта дней old."""
+        async with self.locks.hold(team):
+            result = await run_io(self._update, team, old, new, check_limit)
+        self._after_write(team)
+        return result
+
+    def _update(self, team: str, old: Leave, new: Leave, check_limit: bool):
+        if check_limit and new.leave_type == LIMITED_TYPE:
+            excess = over_limit(team, new.name, new.start, new.end, old=old)
+            if excess:
+                return excess
+        self.store.update(team, old, new)
+        return None
+
+    async def replace(self, team: str, records: List[Leave]):
+        async with self.locks.hold(team):
+            await run_io(self.store.replace, team, records)
+
+    async def archive(self, team: str) -> int:
+        """Переносит записи закрытых лет команды в архив; возвращает их число."""
+        async with self.locks.hold(team):
+            return await run_io(ARCHIVE.archive, team, self.store)
+
+    async def forget(self, team: str):
+        """Выгружает команду из кэша и индексов процесса (команда переезжает в другой шард)."""
+        async with self.locks.hold(team):
+            await run_io(self.store.forget, team)
+
+    # запросы для хендлеров: в режиме SHARDS их же выполняют процессы-шарды
+    async def search(self, query: str, teams: Optional[Collection[str]] = None) -> SearchResult:
+        """
+        Глобальный поиск по ФИО; teams ограничивает команды (шард отвечает только за свои).
+        Архив закрытых лет смотрится, только если в рабочих данных никого не нашлось.
+        """
+        found = NAMES.search(query)
+        archived = {} if found else ARCHIVE.search(query)
+        if teams is not None:
+            found = {t: recs for t, recs in found.items() if t in teams}
+            archived = {t: people for t, people in archived.items() if t in teams}
+        return SearchResult(found, archived, [])
+
+    async def listing(self, team: str, leave_type: str = None, start: datetime.date = None,
+                      end: datetime.date = None, offset: int = 0, limit: int = 20) -> Tuple[int, List[Leave]]:
+        await self.sync(team)
+        return LISTING.query(team, leave_type, start, end, offset, limit)
+
+    async def absent(self, team: str, start: datetime.date, end: datetime.date = None) -> List[Leave]:
+        """Кто отсутствует в день или период, включая архивные годы."""
+        await self.sync(team)
+        return ABSENCES.absent(team, start, end) + await run_io(ARCHIVE.query, team, start, end)
+
+    async def overlaps(self, team: str, rec: Leave, exclude: Leave = None) -> Tuple[List[Leave], List[Leave]]:
+        await self.sync(team)
+        return ABSENCES.overlaps(team, rec, exclude)
+
+    async def archive_query(self, team: str, start: datetime.date, end: datetime.date = None) -> List[Leave]:
+        return await run_io(ARCHIVE.query, team, start, end)
+
+    async def coverage(self, team: str, start: datetime.date, end: datetime.date):
+        """Отчёт о покрытии (текст, CSV, PNG); без numpy — ImportError."""
+        import staffing
+        records = await self.records(team)
+        if ARCHIVE_ENABLED and start.year < cutoff_year():
+            # закрытые годы — в архиве, как и для списка отсутствующих
+            records = records + await run_io(ARCHIVE.query, team, start, end)
+        # расчёт и отрисовка — в пуле, чтобы не держать event loop
+        return await run_io(staffing.report, records, start, end)
+
+    async def check_totals(self, team: str) -> Dict[Tuple[str, int], Tuple[int, int]]:
+        """
+        Сверяет живой индекс остатков команды с пересчётом по хранилищу (indexes.check_totals).
+        Под блокировкой записи команды: изменение между чтением и сверкой дало бы ложное расхождение.
+        """
+        async with self.locks.hold(team):
+            await self.sync(team)
+            return await run_io(check_totals, team, self.store)
+
+    async def known_teams(self) -> List[str]:
+        """Все команды в хранилище (для выгрузки всех команд)."""
+        return await run_io(self.store.backend.teams)
+
+    async def exists(self, team: str) -> bool:
+        return await run_io(self.store.exists, team)
+
+    async def ensure(self, team: str):
+        async with self.locks.hold(team):
+            await run_io(self.store.ensure, team)
+
+
+SERVICE = LeaveService()
+
+
+async def discover_teams(teams: set, warm: bool = WARM_TEAMS):
+    """
+    Фоновое сканирование хранилища при старте: найденные команды добавляются в teams.
+    С warm команды по одной подгружаются в STORE, чтобы глобальный поиск видел их сразу.
+    """
+    found = await run_io(CATALOG.scan)
+    teams.update(found)
+    if warm:
+        archived = 0
+        for team in sorted(found):
+            await run_io(STORE.sync, team)
+            if ARCHIVE_ENABLED:
+                # после Нового года закрытый год уходит в архив при первом же запуске
+                try:
+                    archived += await SERVICE.archive(team)
+                except Exception:
+                    logger.exception("Команда %s: не удалось перенести закрытые годы в архив", team)
+        logger.info("Загружено команд: %d, записей: %d", len(found), sum(CATALOG.counts().values()))
+        if archived:
+            logger.info("В архив перенесено записей: %d", archived)
+
+
+class LoopLagMonitor:
+    """
+    Задержка event loop: раз в interval секунд засыпает на interval и смотрит,
+    насколько позже проснулся. Раз в report_every секунд пишет в лог среднее и максимум.
+    """
+
+    def __init__(self, interval: float = 0.1, report_every: float = 60.0):
+        self.interval = interval
+        self.report_every = report_every
+        self.last = 0.0
+        self.max = 0.0
+        self._sum = 0.0
+        self._count = 0
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def snapshot(self) -> dict:
+        avg = self._sum / self._count if self._count else 0.0
+        return {"last": self.last, "avg": avg, "max": self.max, "samples": self._count}
+
+    def _reset(self):
+        self.max = 0.0
+        self._sum = 0.0
+        self._count = 0
+
+    async def _run(self):
+        reported = time.monotonic()
+        while True:
+            before = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.last = max(0.0, now - before - self.interval)
+            self.max = max(self.max, self.last)
+            self._sum += self.last
+            self._count += 1
+            if now - reported >= self.report_every:
+                stats = self.snapshot()
+                logger.info(
+                    "Задержка event loop: ср. %.1f мс, макс. %.1f мс (%d замеров)",
+                    stats["avg"] * 1000, stats["max"] * 1000, stats["samples"]
+                )
+                self._reset()
+                reported = now
+
+
+LOOP_LAG = LoopLagMonitor()
+
+
+class TotalsAudit:
+    """
+    Раз в interval секунд сверяет индекс остатков каждой команды с хранилищем. Индекс
+    обновляется событиями added/removed, и ошибку в этом пути видно только в живом процессе:
+    расхождения пишутся в лог, их число по командам — в метрики.
+    """
+
+    def __init__(self, interval: float = TOTALS_CHECK_INTERVAL):
+        self.interval = interval
+        self.mismatches = {}  # команда -> число расходящихся пар (сотрудник, год)
+        self._task = None
+
+    def start(self, service, teams: set):
+        """service — LeaveService или ShardRouter: в режиме SHARDS сверку выполняет шард-владелец."""
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.get_running_loop().create_task(self._run(service, teams))
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def check(self, service, teams: Collection[str]) -> int:
+        """Одна сверка всех команд; возвращает число команд с расхождениями."""
+        for team in sorted(teams):
+            try:
+                mismatch = await service.check_totals(team)
+            except Exception:
+                logger.exception("Команда %s: не удалось сверить индекс остатков", team)
+                continue
+            self.mismatches[team] = len(mismatch)
+            for (name, year), (live, expected) in sorted(mismatch.items()):
+                logger.warning("Команда %s: %s, %d — в индексе остатков %d дн., по данным %d дн.",
+                               team, name, year, live, expected)
+        return sum(1 for n in self.mismatches.values() if n)
+
+    async def _run(self, service, teams: set):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.check(service, list(teams))
+
+
+TOTALS_AUDIT = TotalsAudit()
@@ -0,0 +1,455 @@
+# shards.py
+# Режим нескольких процессов: команды распределяются по SHARDS процессам-шардам
+# рандеву-хешированием, каждый шард держит хранилище, кэш и индексы только своих команд.
+# Основной процесс принимает обновления и выполняет хендлеры, а вместо LeaveService
+# использует ShardRouter с тем же интерфейсом: вызов по команде уходит её шарду через
+# Unix-сокет, поиск рассылается всем шардам и собирается с таймаутом на каждый.
+#
+# Напоминания и сводки в этом режиме отправляют шарды: основной процесс раз в
+# SHARD_BIND_INTERVAL секунд сообщает каждому привязки чатов к его командам.
+
+import os
+import signal
+import pickle
+import struct
+import asyncio
+import logging
+import tempfile
+import functools
+import itertools
+import multiprocessing
+from hashlib import blake2b
+from typing import Collection, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SHARDS = int(os.environ.get("SHARDS", "0"))  # 0 или 1 — всё в одном процессе
+SHARD_SEARCH_TIMEOUT = float(os.environ.get("SHARD_SEARCH_TIMEOUT", "2"))
+SHARD_CALL_TIMEOUT = float(os.environ.get("SHARD_CALL_TIMEOUT", "60"))
+SHARD_BIND_INTERVAL = float(os.environ.get("SHARD_BIND_INTERVAL", "60"))
+
+# операции LeaveService, которые выполняет шард-владелец команды (первый аргумент — команда)
+TEAM_OPS = {
+    "records", "get", "sync", "add", "add_many", "remove", "update", "replace", "exists", "ensure",
+    "archive", "listing", "absent", "overlaps", "archive_query", "coverage", "check_totals",
+}
+_FRAME = struct.Struct("!I")
+
+
+def owner(team: str, shard_ids: Collection[int]) -> int:
+    """
+    Рандеву-хеширование: у команды побеждает шард с наибольшим хешем (шард, команда).
+    При добавлении шарда переезжает только примерно 1/N команд — те, что выиграл новый.
+    """
+    return max(shard_ids, key=lambda sid: blake2b(f"{sid}:{team}".encode("utf-8"), digest_size=8).digest())
+
+
+async def _send(writer: asyncio.StreamWriter, message):
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    writer.write(_FRAME.pack(len(data)) + data)
+    await writer.drain()
+
+
+async def _receive(reader: asyncio.StreamReader):
+    size, = _FRAME.unpack(await reader.readexactly(_FRAME.size))
+    return pickle.loads(await reader.readexactly(size))
+
+
+# процесс-шард
+
+class _Worker:
+    """Сервер шарда: исполняет операции LeaveService над своими командами."""
+
+    def __init__(self, shard_id: int, token: str):
+        from service import SERVICE
+        self.shard_id = shard_id
+        self.token = token
+        self.service = SERVICE
+        self.stopped = asyncio.Event()
+        self.bot = None
+        self._connections = {}  # writer -> задача-обработчик соединения
+
+    async def own(self, teams: List[str]):
+        """Прогревает доставшиеся шарду команды и переносит их закрытые годы в архив."""
+        from archive import ARCHIVE_ENABLED
+        for team in teams:
+            await self.service.sync(team)
+            if ARCHIVE_ENABLED:
+                await self.service.archive(team)
+
+    async def bind(self, chats: Dict[str, str]):
+        from reminders import SCHEDULER
+        SCHEDULER.chats.clear()
+        SCHEDULER.chats.update(chats)
+
+    async def stop(self):
+        self.stopped.set()
+
+    async def stats(self) -> dict:
+        return {"locks": self.service.locks.stats()}
+
+    async def dispatch(self, op: str, args, kwargs):
+        if op in TEAM_OPS or op in ("search", "forget"):
+            return await getattr(self.service, op)(*args, **kwargs)
+        if op in ("own", "bind", "stop", "stats"):
+            return await getattr(self, op)(*args, **kwargs)
+        raise ValueError(f"неизвестная операция {op}")
+
+    async def _answer(self, writer, lock: asyncio.Lock, req_id: int, op: str, args, kwargs):
+        try:
+            reply = (req_id, True, await self.dispatch(op, args, kwargs))
+        except Exception as e:
+            # исключения (RecordNotFound и т. п.) передаются как есть — хендлеры их ловят
+            reply = (req_id, False, e)
+        async with lock:
+            try:
+                await _send(writer, reply)
+            except pickle.PicklingError:
+                await _send(writer, (req_id, False, RuntimeError(repr(reply[2]))))
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        lock = asyncio.Lock()
+        tasks = set()
+        self._connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                req_id, op, args, kwargs = await _receive(reader)
+                task = asyncio.get_running_loop().create_task(self._answer(writer, lock, req_id, op, args, kwargs))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._connections.pop(writer, None)
+            writer.close()
+
+    async def start_reminders(self):
+        from reminders import SCHEDULER, REMINDERS
+        from outbox import SendLimiter, SEND_GLOBAL_RATE
+        if not REMINDERS or not self.token:
+            return
+        from telegram import Bot
+        # общий лимит бота делится между процессами
+        self.bot = Bot(self.token, rate_limiter=SendLimiter(global_rate=SEND_GLOBAL_RATE / max(SHARDS, 1)))
+        await self.bot.initialize()
+        SCHEDULER.start(self.bot, self.service.sync)
+
+    async def serve(self, path: str):
+        from service import LOOP_LAG
+        server = await asyncio.start_unix_server(self.handle, path)
+        LOOP_LAG.start()
+        await self.start_reminders()
+        logger.info("Шард %d слушает %s", self.shard_id, path)
+        try:
+            await self.stopped.wait()
+        finally:
+            from reminders import SCHEDULER
+            SCHEDULER.stop()
+            if self.bot is not None:
+                await self.bot.shutdown()
+            server.close()
+            # закрытие соединения завершает чтение в handle без отмены задачи
+            handlers = list(self._connections.values())
+            for writer in list(self._connections):
+                writer.close()
+            await asyncio.gather(*handlers, return_exceptions=True)
+            await server.wait_closed()
+            LOOP_LAG.stop()
+
+
+def worker_main(shard_id: int, path: str, token: str):
+    """Точка входа процесса-шарда (multiprocessing, метод spawn)."""
+    logging.basicConfig(
+        format=f'%(asctime)s - shard{shard_id} - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    # останавливает шард основной процесс; Ctrl+C в терминале приходит всей группе
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    async def run():
+        await _Worker(shard_id, token).serve(path)
+
+    asyncio.run(run())
+
+
+# основной процесс
+
+class ShardClient:
+    """Соединение с одним шардом: запросы мультиплексируются по номеру, ответы разбирает фоновая задача."""
+
+    def __init__(self, shard_id: int, path: str, process):
+        self.shard_id = shard_id
+        self.path = path
+        self.process = process
+        self._reader = None
+        self._writer = None
+        self._pending = {}  # req_id -> Future
+        self._ids = itertools.count()
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    async def connect(self, timeout: float = 30.0):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            try:
+                self._reader, self._writer = await asyncio.open_unix_connection(self.path)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if loop.time() > deadline or not self.process.is_alive():
+                    raise RuntimeError(f"шард {self.shard_id} не запустился")
+                await asyncio.sleep(0.05)
+        self._task = loop.create_task(self._read())
+
+    async def _read(self):
+        try:
+            while True:
+                req_id, ok, result = await _receive(self._reader)
+                future = self._pending.pop(req_id, None)
+                if future is None or future.done():
+                    continue
+                if ok:
+                    future.set_result(result)
+                else:
+                    future.set_exception(result)
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError(f"шард {self.shard_id} недоступен: {e}"))
+            self._pending.clear()
+
+    async def call(self, op: str, *args, timeout: float = SHARD_CALL_TIMEOUT, **kwargs):
+        req_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[req_id] = future
+        try:
+            async with self._lock:
+                await _send(self._writer, (req_id, op, args, kwargs))
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(req_id, None)
+
+    async def close(self, timeout: float = 10.0):
+        try:
+            await self.call("stop", timeout=timeout)
+        except Exception:
+            pass
+        if self._writer is not None:
+            self._writer.close()
+        if self._task is not None:
+            self._task.cancel()
+        await asyncio.get_running_loop().run_in_executor(None, self.process.join, timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class ShardRouter:
+    """
+    Заменяет LeaveService в основном процессе. Операции по команде уходят её шарду;
+    на время переезда команды (rebalance) новые вызовы ждут, пока старый шард не
+    доработает начатые и не выгрузит команду, а новый её не загрузит.
+    """
+
+    def __init__(self, count: int, token: str, teams: set, chats: Dict[str, str]):
+        self.count = count
+        self.token = token
+        self.teams = teams  # все известные команды (TEAMS основного процесса)
+        self.chats = chats  # TEAM_NAMES: chat_id -> команда
+        self.shards = {}  # shard_id -> ShardClient
+        self._dir = tempfile.mkdtemp(prefix="vacabot-shards-")
+        self._ctx = multiprocessing.get_context("spawn")
+        self._gates = {}  # команда -> asyncio.Event, пока команда переезжает
+        self._inflight = {}  # команда -> число выполняющихся вызовов
+        self._idle = {}  # команда -> asyncio.Event «вызовов нет»
+        self._bind_task = None
+        self._rebalancing = asyncio.Lock()
+        self._stats = {}  # shard_id -> последний ответ шарда на stats
+        self._tasks = set()  # фоновые вызовы (прогрев): ссылка держится до завершения
+
+    async def _spawn(self, shard_id: int) -> ShardClient:
+        path = os.path.join(self._dir, f"shard{shard_id}.sock")
+        process = self._ctx.Process(
+            target=worker_main, args=(shard_id, path, self.token), name=f"shard{shard_id}", daemon=True
+        )
+        process.start()
+        client = ShardClient(shard_id, path, process)
+        await client.connect()
+        return client
+
+    def owner(self, team: str) -> ShardClient:
+        return self.shards[owner(team, self.shards)]
+
+    def owned(self) -> Dict[int, List[str]]:
+        result = {sid: [] for sid in self.shards}
+        for team in self.teams:
+            result[owner(team, self.shards)].append(team)
+        return result
+
+    async def start(self):
+        for sid in range(self.count):
+            self.shards[sid] = await self._spawn(sid)
+        for sid, teams in self.owned().items():
+            # прогрев — в фоне шарда, запуск бота его не ждёт
+            self._background(sid, self.shards[sid].call("own", sorted(teams), timeout=None))
+        await self.bind()
+        self._bind_task = asyncio.get_running_loop().create_task(self._bind_loop())
+        logger.info("Запущено шардов: %d, команд: %d", len(self.shards), len(self.teams))
+
+    def _background(self, sid: int, call):
+        task = asyncio.get_running_loop().create_task(call)
+        self._tasks.add(task)
+
+        def done(task: asyncio.Task):
+            self._tasks.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                logger.error("Шард %d: фоновый вызов не выполнен: %r", sid, task.exception())
+
+        task.add_done_callback(done)
+
+    async def stop(self):
+        if self._bind_task is not None:
+            self._bind_task.cancel()
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*(client.close() for client in self.shards.values()))
+        self.shards.clear()
+
+    async def bind(self):
+        """Отдаёт каждому шарду привязки чатов к его командам (для напоминаний)."""
+        ids = list(self.shards)
+        chats = {sid: {} for sid in ids}
+        for chat_id, team in list(self.chats.items()):
+            chats[owner(team, ids)][chat_id] = team
+        await asyncio.gather(*(self.shards[sid].call("bind", chats[sid]) for sid in ids), return_exceptions=True)
+
+    async def collect(self):
+        """Забирает у шардов статистику для метрик основного процесса."""
+        ids = list(self.shards)
+        replies = await asyncio.gather(*(self.shards[sid].call("stats") for sid in ids), return_exceptions=True)
+        for sid, reply in zip(ids, replies):
+            if isinstance(reply, BaseException):
+                logger.warning("Шард %d не отдал статистику: %r", sid, reply)
+            else:
+                self._stats[sid] = reply
+
+    def lock_stats(self) -> dict:
+        """Ожидание блокировок записи по командам, как LeaveService.locks.stats(), — сумма по шардам."""
+        result = {}
+        for sid, stats in list(self._stats.items()):
+            if sid not in self.shards:
+                continue
+            for team, s in stats["locks"].items():
+                # после переезда команда есть и у старого, и у нового шарда
+                total = result.setdefault(team, {"acquired": 0, "wait_total": 0.0, "wait_max": 0.0})
+                total["acquired"] += s["acquired"]
+                total["wait_total"] += s["wait_total"]
+                total["wait_max"] = max(total["wait_max"], s["wait_max"])
+        return result
+
+    async def _bind_loop(self):
+        # привязки чатов и статистика шардов обновляются с одним интервалом
+        while True:
+            await asyncio.sleep(SHARD_BIND_INTERVAL)
+            await self.bind()
+            await self.collect()
+
+    async def _call_team(self, op: str, team: str, *args, **kwargs):
+        gate = self._gates.get(team)
+        while gate is not None:
+            await gate.wait()
+            gate = self._gates.get(team)
+        self._inflight[team] = self._inflight.get(team, 0) + 1
+        self._idle.setdefault(team, asyncio.Event()).clear()
+        try:
+            return await self.owner(team).call(op, team, *args, **kwargs)
+        finally:
+            self._inflight[team] -= 1
+            if not self._inflight[team]:
+                del self._inflight[team]
+                self._idle.pop(team).set()
+
+    def __getattr__(self, op: str):
+        if op in TEAM_OPS:
+            return functools.partial(self._call_team, op)
+        raise AttributeError(op)
+
+    async def forget(self, team: str):
+        await self.owner(team).call("forget", team)
+
+    async def known_teams(self) -> List[str]:
+        # список команд основной процесс собрал при запуске, до раздачи по шардам
+        return sorted(self.teams)
+
+    async def search(self, query: str, teams: Optional[Collection[str]] = None):
+        """Рассылает поиск всем шардам; не ответившие за SHARD_SEARCH_TIMEOUT попадают в missing."""
+        from service import SearchResult
+        owned = self.owned()
+        sids = list(self.shards)
+        replies = await asyncio.gather(*(
+            self.shards[sid].call("search", query, owned[sid], timeout=SHARD_SEARCH_TIMEOUT) for sid in sids
+        ), return_exceptions=True)
+        found, archived, missing = {}, {}, []
+        for sid, reply in zip(sids, replies):
+            if isinstance(reply, BaseException):
+                logger.warning("Поиск: шард %d не ответил: %r", sid, reply)
+                missing.append(f"shard{sid}")
+                continue
+            found.update(reply.found)
+            archived.update(reply.archived)
+        # как и в одном процессе: архив показывается, только если в рабочих данных никого нет
+        return SearchResult(found, {} if found else archived, missing)
+
+    async def resize(self, count: int):
+        """
+        Доводит число шардов до count и переселяет команды, у которых сменился владелец.
+        Сначала запускаются все новые шарды — до этого маршрутизация идёт по старому
+        набору. Затем без единого await закрываются ворота переезжающих команд и набор
+        шардов подменяется целиком. После этого по каждой команде: начатые вызовы
+        дорабатывают, старый шард выгружает команду (данные уже на диске), новый её
+        загружает — и ворота открываются.
+        """
+        async with self._rebalancing:
+            before = dict(self.shards)
+            after = {sid: client for sid, client in before.items() if sid < count}
+            try:
+                for sid in range(len(before), count):
+                    after[sid] = await self._spawn(sid)
+            except Exception:
+                # набор шардов ещё не подменён — запущенные новые просто останавливаем
+                await asyncio.gather(*(after[sid].close() for sid in after if sid not in before))
+                raise
+            removed = [sid for sid in before if sid not in after]
+            moves = []
+            for team in sorted(self.teams):
+                old = owner(team, before)
+                new = owner(team, after)
+                if old != new:
+                    moves.append((team, old, new))
+            for team, _, _ in moves:
+                self._gates[team] = asyncio.Event()
+            self.shards = after
+            try:
+                for team, old, new in moves:
+                    idle = self._idle.get(team)
+                    if idle is not None:
+                        await idle.wait()
+                    await before[old].call("forget", team)
+                    await after[new].call("own", [team])
+                    self._gates.pop(team).set()
+            finally:
+                for gate in self._gates.values():
+                    gate.set()
+                self._gates.clear()
+            await asyncio.gather(*(before[sid].close() for sid in removed))
+            self.count = count
+            await self.bind()
+            logger.info("Шардов: %d, переехало команд: %d", count, len(moves))
+            return len(moves)
+
+    def snapshot(self) -> dict:
+        return {
+            "shards": len(self.shards),
+            "alive": sum(c.process.is_alive() for c in self.shards.values()),
+            "moving": len(self._gates),
+            "inflight": sum(self._inflight.values()),
+        }
@@ -0,0 +1,207 @@
+# staffing.py
+# Покрытие команды по дням: сколько человек отсутствует в каждый день периода,
+# какие типы отсутствий, какие дни остаются с минимальным составом.
+# Считается массивами NumPy через разностные массивы и накопленные суммы —
+# без цикла по записям × дням. Отчёт — текстовый календарь, CSV и PNG.
+#
+#   python staffing.py КОМАНДА 01.01.2026 31.03.2026 [--csv out.csv] [--png out.png] [--min-present 0.7]
+
+import os
+import io
+import csv
+import argparse
+import datetime
+from typing import List, NamedTuple
+
+import numpy as np
+
+from storage import Leave, read_vacations
+from indexes import type_key
+
+# доля команды, которая должна быть на месте; ниже — день считается неукомплектованным
+MIN_PRESENT = float(os.environ.get("COVERAGE_MIN_PRESENT", "0.7"))
+# самый длинный период отчёта в боте: календарь за год ещё влезает в одно сообщение
+MAX_DAYS = int(os.environ.get("COVERAGE_MAX_DAYS", "366"))
+FIGURE_MAX_WIDTH = 24  # дюймов: дальше столбики дней всё равно сливаются
+
+# порядок колонок по типам; "за свой счет" и "счёт" сводятся к одному ключу
+TYPES = ["Отпуск", "Отгулы", "Отпуск за свой счет", "Командировка"]
+TYPE_SHORT = ["Отп", "Отг", "ОЗС", "Ком"]
+
+
+class Coverage(NamedTuple):
+    start: datetime.date
+    names: List[str]  # сотрудники команды, строки матрицы
+    occupancy: np.ndarray  # bool [сотрудник, день] — отсутствует ли
+    by_type: np.ndarray  # int [тип, день] — сколько отсутствует по типу
+    absent: np.ndarray  # int [день] — сколько человек отсутствует
+    team_size: int
+
+    @property
+    def days(self) -> int:
+        return len(self.absent)
+
+    def date(self, i: int) -> datetime.date:
+        return self.start + datetime.timedelta(days=int(i))
+
+    @property
+    def present(self) -> np.ndarray:
+        return self.team_size - self.absent
+
+    def understaffed(self, min_present: float = MIN_PRESENT) -> np.ndarray:
+        """Индексы дней, когда на месте меньше min_present доли команды."""
+        return np.flatnonzero(self.present < min_present * self.team_size)
+
+    def minimum_days(self) -> np.ndarray:
+        """Индексы дней с наименьшим числом присутствующих."""
+        if not self.days:
+            return np.array([], dtype=int)
+        return np.flatnonzero(self.absent == self.absent.max())
+
+
+def coverage(records: List[Leave], start: datetime.date, end: datetime.date, team_size: int = None) -> Coverage:
+    """
+    Строит покрытие за [start, end]. Каждая запись — +1 в день начала и −1 в день
+    после окончания разностного массива; накопленная сумма по дням даёт занятость.
+    Размер команды по умолчанию — число разных сотрудников в записях.
+    """
+    names = sorted({r.name for r in records})
+    emp = {n: i for i, n in enumerate(names)}
+    type_idx = {type_key(t): i for i, t in enumerate(TYPES)}
+    n_days = (end - start).days + 1
+    base = start.toordinal()
+
+    recs = [r for r in records if r.end >= start and r.start <= end]
+    rows = np.fromiter((emp[r.name] for r in recs), dtype=np.intp, count=len(recs))
+    types = np.fromiter((type_idx.get(type_key(r.leave_type), 0) for r in recs), dtype=np.intp, count=len(recs))
+    # обрезаем записи по границам периода: индексы дней в [0, n_days]
+    first = np.fromiter((r.start.toordinal() - base for r in recs), dtype=np.int64, count=len(recs)).clip(0, n_days)
+    last = np.fromiter((r.end.toordinal() - base + 1 for r in recs), dtype=np.int64, count=len(recs)).clip(0, n_days)
+
+    diff = np.zeros((len(names), n_days + 1), dtype=np.int32)
+    np.add.at(diff, (rows, first), 1)
+    np.add.at(diff, (rows, last), -1)
+    # пересекающиеся записи одного сотрудника не считаем дважды
+    occupancy = np.cumsum(diff[:, :-1], axis=1) > 0
+
+    type_diff = np.zeros((len(TYPES), n_days + 1), dtype=np.int32)
+    np.add.at(type_diff, (types, first), 1)
+    np.add.at(type_diff, (types, last), -1)
+    by_type = np.cumsum(type_diff[:, :-1], axis=1)
+
+    absent = occupancy.sum(axis=0)
+    return Coverage(start, names, occupancy, by_type, absent, team_size or len(names))
+
+
+def quarter_range(day: datetime.date):
+    first = datetime.date(day.year, (day.month - 1) // 3 * 3 + 1, 1)
+    last_month = first.replace(month=first.month + 2)
+    nxt = (last_month + datetime.timedelta(days=32)).replace(day=1)
+    return first, nxt - datetime.timedelta(days=1)
+
+
+def _cell(n: int) -> str:
+    return str(n) if n < 10 else "+"
+
+
+def to_text(cov: Coverage, min_present: float = MIN_PRESENT) -> str:
+    """
+    Компактный календарь: строка на месяц, по символу на день — число отсутствующих
+    («·» — никого, «+» — 10 и больше); ниже — дни с минимальным составом и тревоги.
+    """
+    lines = [f"Состав: {cov.team_size} чел.", "      " + "".join(_cell(d % 10) if d % 5 == 0 else " " for d in range(1, 32))]
+    i = 0
+    while i < cov.days:
+        day = cov.date(i)
+        month_days = (day.replace(day=28) + datetime.timedelta(days=4)).replace(day=1) - day
+        n = min(month_days.days, cov.days - i)
+        cells = "".join("·" if a == 0 else _cell(a) for a in cov.absent[i:i + n])
+        lines.append(f"{day.strftime('%m.%y')} " + " " * (day.day - 1) + cells)
+        i += n
+
+    peak = cov.minimum_days()
+    if len(peak) and cov.absent.max() > 0:
+        dates = ", ".join(cov.date(i).strftime("%d.%m") for i in peak[:10])
+        more = f" и ещё {len(peak) - 10}" if len(peak) > 10 else ""
+        lines.append(f"Минимум на месте: {cov.team_size - cov.absent.max()} чел. — {dates}{more}")
+    alert = cov.understaffed(min_present)
+    if len(alert):
+        dates = ", ".join(cov.date(i).strftime("%d.%m") for i in alert[:10])
+        more = f" и ещё {len(alert) - 10}" if len(alert) > 10 else ""
+        lines.append(f"⚠️ На месте меньше {min_present:.0%} команды: {len(alert)} дн. — {dates}{more}")
+    return "\n".join(lines)
+
+
+def to_csv(cov: Coverage) -> str:
+    """CSV по дням: дата, отсутствуют, на месте, разбивка по типам, кто отсутствует."""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["date", "absent", "present"] + TYPES + ["names"])
+    for i in range(cov.days):
+        who = [cov.names[e] for e in np.flatnonzero(cov.occupancy[:, i])]
+        writer.writerow([cov.date(i).isoformat(), int(cov.absent[i]), int(cov.present[i])]
+                        + [int(x) for x in cov.by_type[:, i]] + ["; ".join(who)])
+    return out.getvalue()
+
+
+def to_png(cov: Coverage, min_present: float = MIN_PRESENT) -> bytes:
+    """
+    Столбики отсутствующих по дням с разбивкой по типам и линия порога.
+    Нужен matplotlib; без него возвращает b"".
+    """
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        return b""
+    dates = [cov.date(i) for i in range(cov.days)]
+    fig, ax = plt.subplots(figsize=(min(max(6, cov.days / 12), FIGURE_MAX_WIDTH), 3.5), dpi=100)
+    bottom = np.zeros(cov.days)
+    for t, label in enumerate(TYPE_SHORT):
+        ax.bar(dates, cov.by_type[t], bottom=bottom, width=1.0, label=label)
+        bottom += cov.by_type[t]
+    limit = cov.team_size * (1 - min_present)
+    ax.axhline(limit, color="red", linestyle="--", linewidth=1, label=f"порог ({min_present:.0%} на месте)")
+    ax.set_ylabel("отсутствуют")
+    ax.set_ylim(0, max(limit, cov.by_type.sum(axis=0).max(initial=0)) + 1)
+    ax.legend(loc="upper right", fontsize="small", ncol=5)
+    fig.autofmt_xdate()
+    fig.tight_layout()
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png")
+    plt.close(fig)
+    return buf.getvalue()
+
+
+def report(records: List[Leave], start: datetime.date, end: datetime.date, min_present: float = MIN_PRESENT,
+           team_size: int = None):
+    """Текст, CSV и PNG одного отчёта."""
+    cov = coverage(records, start, end, team_size)
+    return to_text(cov, min_present), to_csv(cov), to_png(cov, min_present)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Покрытие команды по дням")
+    parser.add_argument("team")
+    parser.add_argument("start", help="ДД.ММ.ГГГГ")
+    parser.add_argument("end", help="ДД.ММ.ГГГГ")
+    parser.add_argument("--csv", help="куда записать CSV")
+    parser.add_argument("--png", help="куда записать PNG")
+    parser.add_argument("--min-present", type=float, default=MIN_PRESENT)
+    parser.add_argument("--team-size", type=int)
+    args = parser.parse_args()
+    parse = lambda s: datetime.datetime.strptime(s, "%d.%m.%Y").date()
+    start, end = parse(args.start), parse(args.end)
+    records = read_vacations(args.team)
+    from archive import ARCHIVE_ENABLED, ARCHIVE, cutoff_year
+    if ARCHIVE_ENABLED and start.year < cutoff_year():
+        records = records + ARCHIVE.query(args.team, start, end)
+    text, table, image = report(records, start, end, args.min_present, args.team_size)
+    print(text)
+    if args.csv:
+        with open(args.csv, "w", encoding="utf-8", newline="") as f:
+            f.write(table)
+    if args.png and image:
+        with open(args.png, "wb") as f:
+            f.write(image)
@@ -0,0 +1,629 @@
+# storage.py
+# Хранение записей об отсутствиях: файлы vacations_{team}.txt (формат строк — в codec.py),
+# интерфейс бэкендов хранения и общий для процесса кэш распарсенных записей.
+
+import os
+import datetime
+import logging
+import threading
+import time
+import secrets
+import itertools
+import zlib
+from typing import Collection, Dict, List, Optional
+
+from codec import Leave, parse_line, parse_many
+
+logger = logging.getLogger(__name__)
+
+VACATION_PATH = "vacations_{}.txt"
+SQLITE_PATH = "vacations.db"
+
+FSYNC_MODE = os.environ.get("FSYNC_MODE", "off")  # off | always | batch
+FSYNC_INTERVAL = float(os.environ.get("FSYNC_INTERVAL", "1.0"))
+LOG_COMPACT_ENTRIES = int(os.environ.get("LOG_COMPACT_ENTRIES", "1000"))
+LOG_COMPACT_BYTES = int(os.environ.get("LOG_COMPACT_BYTES", str(1 << 20)))
+
+GEN_PREFIX = "#gen "
+BATCH_SEP = "\x1e"  # разделитель записей внутри пакетной записи журнала
+
+
+def new_rid() -> str:
+    return secrets.token_hex(6)
+
+
+def _log_entry(op: str, payload: str) -> str:
+    body = f"{op} {payload}"
+    return f"{zlib.crc32(body.encode('utf-8')):08x} {body}\n"
+
+
+def _parse_log_entry(raw: bytes):
+    """Запись журнала '<crc32> <op> <payload>\\n' -> (op, payload); оборванная или испорченная -> None."""
+    if not raw.endswith(b"\n"):
+        return None
+    crc, _, body = raw[:-1].partition(b" ")
+    if crc != b"%08x" % zlib.crc32(body):
+        return None
+    try:
+        op, _, payload = body.decode("utf-8").partition(" ")
+    except UnicodeDecodeError:
+        return None
+    return op, payload
+
+
+class RecordNotFound(LookupError):
+    """Запись уже удалена или изменена кем-то другим."""
+
+
+class RecordChanged(RecordNotFound):
+    """Запись с этим rid есть, но уже не такая, какой её видел пользователь."""
+
+
+def _fsync_path(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class FsyncPolicy:
+    """
+    Когда сбрасывать записанное на диск (FSYNC_MODE):
+    off — полагаемся на ОС; always — fsync после каждой записи;
+    batch — изменённые файлы копятся и сбрасываются фоновым потоком раз в interval секунд.
+    """
+
+    def __init__(self, mode: str = FSYNC_MODE, interval: float = FSYNC_INTERVAL):
+        if mode not in ("off", "always", "batch"):
+            raise ValueError(f"Неизвестный FSYNC_MODE: {mode}")
+        self.mode = mode
+        self.interval = interval
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def written(self, f, path: str):
+        """Вызывается после записи в открытый файл f (до его закрытия)."""
+        if self.mode == "always":
+            f.flush()
+            os.fsync(f.fileno())
+        elif self.mode == "batch":
+            self._mark(path)
+
+    def replaced(self, path: str):
+        """Вызывается после os.replace: чтобы переименование пережило сбой, сбрасываем каталог."""
+        folder = os.path.dirname(os.path.abspath(path))
+        if self.mode == "always":
+            _fsync_path(folder)
+        elif self.mode == "batch":
+            self._mark(folder)
+
+    def _mark(self, path: str):
+        with self._lock:
+            self._dirty.add(path)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="fsync-batch", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        for path in dirty:
+            try:
+                _fsync_path(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                logger.exception("Не удалось выполнить fsync для %s", path)
+
+
+class Storage:
+    """
+    Интерфейс бэкенда хранения записей.
+    append() присваивает записи идентификатор (rid) и возвращает её.
+    В remove/update/replace передаётся и полный актуальный список записей команды —
+    на случай, если бэкенду проще записать его целиком; обычно меняется одна запись.
+    """
+
+    def stamp(self, team: str):
+        """Метка версии данных команды; меняется при любой записи, в том числе извне."""
+        raise NotImplementedError
+
+    def load(self, team: str) -> List[Leave]:
+        raise NotImplementedError
+
+    def append(self, team: str, rec: Leave) -> Leave:
+        raise NotImplementedError
+
+    def extend(self, team: str, recs: List[Leave]) -> List[Leave]:
+        """Добавляет пачку записей одной транзакцией: либо все, либо ни одной."""
+        raise NotImplementedError
+
+    def remove(self, team: str, rec: Leave, records: Collection[Leave]):
+        raise NotImplementedError
+
+    def update(self, team: str, old: Leave, new: Leave, records: Collection[Leave]):
+        raise NotImplementedError
+
+    def replace(self, team: str, records: List[Leave]):
+        raise NotImplementedError
+
+    def wants_compaction(self, team: str) -> bool:
+        return False
+
+    def compact(self, team: str, records: List[Leave]):
+        """Сворачивает накопленные изменения; records — актуальное состояние команды."""
+
+    def exists(self, team: str) -> bool:
+        raise NotImplementedError
+
+    def ensure(self, team: str):
+        """Заводит пустую команду, если её ещё нет."""
+        raise NotImplementedError
+
+    def teams(self) -> List[str]:
+        raise NotImplementedError
+
+    def scan(self) -> Dict[str, object]:
+        """{команда: метка версии} по всем командам хранилища."""
+        return {team: self.stamp(team) for team in self.teams()}
+
+    def reader(self) -> "Storage":
+        """Бэкенд для проверочных чтений: load() через него ничего не меняет в хранилище."""
+        return self
+
+
+class TextStorage(Storage):
+    """
+    Снимок vacations_{team}.txt (по строке на запись) и журнал изменений vacations_{team}.log.
+    Добавление, правка и удаление дописывают в журнал одну запись — O(1) вместо перезаписи
+    файла; при чтении журнал накатывается на снимок. Когда журнал разрастается, compact()
+    сворачивает его в новый снимок.
+
+    Первая строка снимка и журнала — поколение '#gen N'. Журнал накатывается, только если
+    его поколение совпадает со снимком, поэтому сбой посреди сжатия не применит уже учтённый
+    журнал повторно. Каждая запись журнала несёт crc32: оборванная последняя запись
+    (сбой во время дозаписи) отбрасывается и обрезается.
+
+    С read_only загрузка ничего не чинит на диске (для проверок admin.py check):
+    устаревший журнал не удаляется, оборванная запись не обрезается.
+    """
+
+    def __init__(self, path_template: str = VACATION_PATH, fsync: FsyncPolicy = None,
+                 compact_entries: int = LOG_COMPACT_ENTRIES, compact_bytes: int = LOG_COMPACT_BYTES,
+                 read_only: bool = False):
+        self.path_template = path_template
+        self.read_only = read_only
+        self.fsync = fsync or FsyncPolicy()
+        self.compact_entries = compact_entries
+        self.compact_bytes = compact_bytes
+        self._gen = {}  # team -> поколение снимка
+        self._entries = {}  # team -> записей в журнале
+
+    def reader(self) -> "TextStorage":
+        if self.read_only:
+            return self
+        return TextStorage(self.path_template, read_only=True)
+
+    def path(self, team: str) -> str:
+        return self.path_template.format(team)
+
+    def log_path(self, team: str) -> str:
+        return os.path.splitext(self.path(team))[0] + ".log"
+
+    @staticmethod
+    def _file_stamp(path: str):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def stamp(self, team: str):
+        snapshot = self._file_stamp(self.path(team))
+        if snapshot is None:
+            return None
+        return snapshot, self._file_stamp(self.log_path(team))
+
+    def _read_gen(self, team: str) -> int:
+        gen = self._gen.get(team)
+        if gen is None:
+            try:
+                with open(self.path(team), "r", encoding="utf-8") as f:
+                    first = f.readline()
+            except FileNotFoundError:
+                first = ""
+            gen = int(first[len(GEN_PREFIX):]) if first.startswith(GEN_PREFIX) else 0
+            self._gen[team] = gen
+        return gen
+
+    def load(self, team: str) -> List[Leave]:
+        records = {}  # rid -> Leave, в порядке добавления
+        gen = 0
+        path = self.path(team)
+        invented = 0  # записей, которым id пришлось придумать
+        broken = []
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                first = f.readline()
+                if first.startswith(GEN_PREFIX):
+                    gen = int(first[len(GEN_PREFIX):])
+                    lines, first_line = f, 2
+                else:
+                    lines, first_line = itertools.chain([first], f), 1
+                for lineno, line, rec in parse_many(lines, first_line):
+                    if rec is None:
+                        logger.warning("Пропущена битая строка %s:%d: %r", path, lineno, line)
+                        broken.append(line)
+                        continue
+                    if not rec.rid:
+                        # старые строки без id: по номеру строки на них ссылается текущий журнал
+                        rec = rec._replace(rid=f"L{lineno}")
+                        invented += 1
+                    if rec.rid in records:
+                        rec = rec._replace(rid=new_rid())
+                        invented += 1
+                    records[rec.rid] = rec
+        except FileNotFoundError:
+            pass
+        self._gen[team] = gen
+        self._entries[team] = self._replay(team, gen, records)
+        if invented and not self.read_only:
+            self._pin_rids(team, list(records.values()), broken)
+        return list(records.values())
+
+    def _pin_rids(self, team: str, records: List[Leave], broken: List[str]):
+        """
+        Придуманные при загрузке id сразу записываются в новый снимок: иначе после правки
+        снимка руками или перезапуска записи журнала попали бы на другую запись.
+        Журнал к этому моменту уже накатан, новый снимок его заменяет. Битые строки
+        новый снимок не содержит — они дописываются в vacations_{команда}.txt.bad.
+        """
+        if broken:
+            with open(self.path(team) + ".bad", "a", encoding="utf-8") as f:
+                f.writelines(broken)
+        self.replace(team, records)
+        logger.info("Команда %s: снимок пересобран с постоянными id записей", team)
+
+    def _replay(self, team: str, gen: int, records: dict) -> int:
+        path = self.log_path(team)
+        try:
+            with open(path, "rb") as f:
+                lines = f.read().splitlines(keepends=True)
+        except FileNotFoundError:
+            return 0
+        if not lines or lines[0] != f"{GEN_PREFIX}{gen}\n".encode():
+            # журнал от прошлого поколения: сжатие успело записать снимок, но не удалить журнал
+            if self.read_only:
+                logger.warning("Устаревший журнал %s не применяется", path)
+                return 0
+            logger.info("Удалён устаревший журнал %s", path)
+            os.remove(path)
+            return 0
+        applied = 0
+        offset = len(lines[0])
+        for i, raw in enumerate(lines[1:], 1):
+            entry = _parse_log_entry(raw)
+            if entry is None:
+                if i == len(lines) - 1:
+                    logger.warning("Отброшена оборванная запись в конце %s", path)
+                    if not self.read_only:
+                        os.truncate(path, offset)
+                    break
+                logger.error("Пропущена испорченная запись %s:%d", path, i + 1)
+                offset += len(raw)
+                continue
+            offset += len(raw)
+            op, payload = entry
+            if op == "-":
+                records.pop(payload, None)
+            elif op == "*":
+                # пакет записей пишется одной записью журнала с общей контрольной суммой
+                batch = [parse_line(line) for line in payload.split(BATCH_SEP)]
+                if not all(rec is not None and rec.rid for rec in batch):
+                    logger.error("Пропущен непонятный пакет %s:%d", path, i + 1)
+                    continue
+                records.update((rec.rid, rec) for rec in batch)
+                applied += len(batch) - 1
+            else:
+                rec = parse_line(payload)
+                if rec is None or not rec.rid:
+                    logger.error("Пропущена непонятная запись %s:%d", path, i + 1)
+                    continue
+                records[rec.rid] = rec
+            applied += 1
+        return applied
+
+    def _log(self, team: str, op: str, payload: str):
+        gen = self._read_gen(team)
+        if not os.path.exists(self.path(team)):
+            self.ensure(team)
+        path = self.log_path(team)
+        with open(path, "a", encoding="utf-8") as f:
+            if f.tell() == 0:
+                f.write(f"{GEN_PREFIX}{gen}\n")
+            f.write(_log_entry(op, payload))
+            self.fsync.written(f, path)
+        self._entries[team] = self._entries.get(team, 0) + 1
+
+    def append(self, team: str, rec: Leave) -> Leave:
+        if not rec.rid:
+            rec = rec._replace(rid=new_rid())
+        self._log(team, "+", rec.to_line().rstrip("\n"))
+        return rec
+
+    def extend(self, team: str, recs: List[Leave]) -> List[Leave]:
+        recs = [rec if rec.rid else rec._replace(rid=new_rid()) for rec in recs]
+        if recs:
+            self._log(team, "*", BATCH_SEP.join(rec.to_line().rstrip("\n") for rec in recs))
+            # для порога сжатия пакет весит как отдельные записи
+            self._entries[team] += len(recs) - 1
+        return recs
+
+    def remove(self, team: str, rec: Leave, records: Collection[Leave]):
+        self._log(team, "-", rec.rid)
+
+    def update(self, team: str, old: Leave, new: Leave, records: Collection[Leave]):
+        self._log(team, "=", new.to_line().rstrip("\n"))
+
+    def replace(self, team: str, records: List[Leave]):
+        # новый снимок следующего поколения пишем во временный файл и атомарно подменяем;
+        # после этого старый журнал уже не применяется и его можно удалить
+        path = self.path(team)
+        gen = self._read_gen(team) + 1
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(f"{GEN_PREFIX}{gen}\n")
+            f.writelines(r.to_line() for r in records)
+            self.fsync.written(f, path)
+        os.replace(tmp, path)
+        self.fsync.replaced(path)
+        self._gen[team] = gen
+        try:
+            os.remove(self.log_path(team))
+        except FileNotFoundError:
+            pass
+        self._entries[team] = 0
+
+    def wants_compaction(self, team: str) -> bool:
+        if self._entries.get(team, 0) >= self.compact_entries:
+            return True
+        log = self._file_stamp(self.log_path(team))
+        return log is not None and log[1] >= self.compact_bytes
+
+    def compact(self, team: str, records: List[Leave]):
+        self.replace(team, records)
+        logger.info("Команда %s: журнал свёрнут в снимок (%d записей)", team, len(records))
+
+    def exists(self, team: str) -> bool:
+        return os.path.exists(self.path(team))
+
+    def ensure(self, team: str):
+        open(self.path(team), "a").close()
+
+    def teams(self) -> List[str]:
+        return sorted(self.scan())
+
+    def scan(self) -> Dict[str, object]:
+        # один проход os.scandir: метки снимков и журналов без отдельного stat на файл
+        folder, pattern = os.path.split(self.path_template)
+        prefix, _, suffix = pattern.partition("{}")
+        log_suffix = os.path.splitext(suffix)[0] + ".log"
+        snapshots, logs = {}, {}
+        try:
+            with os.scandir(folder or ".") as entries:
+                for entry in entries:
+                    name = entry.name
+                    if not name.startswith(prefix):
+                        continue
+                    for tail, found in ((suffix, snapshots), (log_suffix, logs)):
+                        if name.endswith(tail) and len(name) > len(prefix) + len(tail):
+                            st = entry.stat()
+                            found[name[len(prefix):len(name) - len(tail)]] = (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return {}
+        return {team: (stamp, logs.get(team)) for team, stamp in snapshots.items()}
+
+
+class LeaveStore:
+    """
+    Общий для процесса кэш записей по командам поверх бэкенда Storage.
+    Данные команды загружаются и парсятся один раз; повторно они перечитываются только
+    если у бэкенда сменилась метка версии (для файлов — mtime или размер, например,
+    если файл поправили руками). Запись идёт через сам кэш, поэтому после неё
+    перечитывать данные не нужно.
+
+    Записи команды лежат в словаре по rid: удаление и правка — O(1) по ключу.
+    Они оптимистичны: запись меняется, только если в кэше она всё ещё равна той,
+    которую видел пользователь, иначе — RecordChanged.
+
+    Индексы подписываются через subscribe() и получают события
+    reset(team, records), added(team, rec) и removed(team, rec).
+    """
+
+    def __init__(self, backend: Storage):
+        self.backend = backend
+        self._teams = {}  # team -> (stamp, {rid: Leave}) в порядке добавления
+        self._lock = threading.Lock()  # защищает словари кэша и список подписчиков
+        self._team_locks = {}  # team -> threading.Lock: команды не ждут друг друга
+        self._listeners = []
+
+    def _locked(self, team: str) -> threading.Lock:
+        with self._lock:
+            lock = self._team_locks.get(team)
+            if lock is None:
+                lock = self._team_locks[team] = threading.Lock()
+            return lock
+
+    def _notify(self, event: str, team: str, *args):
+        for listener in self._listeners:
+            getattr(listener, event)(team, *args)
+
+    def _sync(self, team: str) -> Dict[str, Leave]:
+        """Возвращает актуальные записи команды {rid: Leave}, при необходимости перечитав их."""
+        stamp = self.backend.stamp(team)
+        cached = self._teams.get(team)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        records = {rec.rid: rec for rec in self.backend.load(team)}
+        with self._lock:
+            self._teams[team] = (stamp, records)
+        self._notify("reset", team, list(records.values()))
+        return records
+
+    def _saved(self, team: str, records: Dict[str, Leave]):
+        stamp = self.backend.stamp(team)
+        with self._lock:
+            self._teams[team] = (stamp, records)
+
+    def _current(self, records: Dict[str, Leave], rec: Leave) -> Leave:
+        # оптимистичная проверка: запись должна быть такой же, какой её видел пользователь
+        current = records.get(rec.rid)
+        if current is None:
+            raise RecordNotFound(rec)
+        if current != rec:
+            raise RecordChanged(current)
+        return current
+
+    def subscribe(self, listener):
+        with self._lock:
+            self._listeners.append(listener)
+            for team, (_, records) in self._teams.items():
+                listener.reset(team, list(records.values()))
+
+    def sync(self, team: str):
+        """Проверяет, что кэш команды (и индексы) соответствуют хранилищу."""
+        with self._locked(team):
+            self._sync(team)
+
+    def records(self, team: str) -> List[Leave]:
+        with self._locked(team):
+            return list(self._sync(team).values())
+
+    def get(self, team: str, rid: str) -> Optional[Leave]:
+        with self._locked(team):
+            return self._sync(team).get(rid)
+
+    def append(self, team: str, rec: Leave):
+        with self._locked(team):
+            records = self._sync(team)
+            rec = self.backend.append(team, rec)
+            records[rec.rid] = rec
+            self._saved(team, records)
+            self._notify("added", team, rec)
+            return rec
+
+    def extend(self, team: str, recs: List[Leave]) -> List[Leave]:
+        with self._locked(team):
+            records = self._sync(team)
+            recs = self.backend.extend(team, recs)
+            records.update((rec.rid, rec) for rec in recs)
+            self._saved(team, records)
+            for rec in recs:
+                self._notify("added", team, rec)
+            return recs
+
+    def remove(self, team: str, rec: Leave):
+        with self._locked(team):
+            records = self._sync(team)
+            self._current(records, rec)
+            del records[rec.rid]
+            self.backend.remove(team, rec, records.values())
+            self._saved(team, records)
+            self._notify("removed", team, rec)
+
+    def update(self, team: str, old: Leave, new: Leave):
+        new = new._replace(rid=old.rid)
+        with self._locked(team):
+            records = self._sync(team)
+            self._current(records, old)
+            records[old.rid] = new
+            self.backend.update(team, old, new, records.values())
+            self._saved(team, records)
+            self._notify("removed", team, old)
+            self._notify("added", team, new)
+            return new
+
+    def replace(self, team: str, records: List[Leave]):
+        with self._locked(team):
+            self.backend.replace(team, list(records))
+            # записи без rid получают его только в бэкенде — перечитываем
+            records = {rec.rid: rec for rec in self.backend.load(team)}
+            self._saved(team, records)
+            self._notify("reset", team, list(records.values()))
+
+    def compact(self, team: str):
+        with self._locked(team):
+            records = self._sync(team)
+            self.backend.compact(team, list(records.values()))
+            self._saved(team, records)
+
+    def forget(self, team: str):
+        """Забывает команду: кэш сбрасывается, индексы получают reset с пустым списком."""
+        with self._locked(team):
+            with self._lock:
+                self._teams.pop(team, None)
+            self._notify("reset", team, [])
+
+    def fresh_records(self, team: str) -> List[Leave]:
+        """
+        Читает данные команды из бэкенда заново, мимо кэша (для проверок согласованности).
+        Чтение только проверочное: журнал не обрезается, снимок не пересобирается.
+        """
+        with self._locked(team):
+            return self.backend.reader().load(team)
+
+    def exists(self, team: str) -> bool:
+        return self.backend.exists(team)
+
+    def ensure(self, team: str):
+        with self._locked(team):
+            self.backend.ensure(team)
+            self._sync(team)
+
+    def invalidate(self, team: str = None):
+        with self._lock:
+            if team is None:
+                self._teams.clear()
+            else:
+                self._teams.pop(team, None)
+
+
+def make_storage() -> Storage:
+    """Бэкенд выбирается переменной окружения STORAGE_BACKEND: text (по умолчанию) или sqlite."""
+    kind = os.environ.get("STORAGE_BACKEND", "text")
+    if kind == "sqlite":
+        from storage_sqlite import SqliteStorage
+        return SqliteStorage(os.environ.get("SQLITE_PATH", SQLITE_PATH))
+    if kind != "text":
+        raise ValueError(f"Неизвестный STORAGE_BACKEND: {kind}")
+    return TextStorage()
+
+
+STORE = LeaveStore(make_storage())
+
+
+def write_vacation(team: str, name: str, start: datetime.date, end: datetime.date, leave_type: str) -> Leave:
+    return STORE.append(team, Leave(name, start, end, leave_type))
+
+
+def read_vacations(team: str) -> List[Leave]:
+    return STORE.records(team)
+
+
+def save_vacations(team: str, records: List[Leave]):
+    STORE.replace(team, records)
+
+
+def delete_vacation(team: str, rec: Leave):
+    STORE.remove(team, rec)
+
+
+def update_vacation(team: str, old: Leave, new: Leave):
+    STORE.update(team, old, new)
@@ -0,0 +1,174 @@
+# storage_sqlite.py
+# SQLite-бэкенд хранения записей (stdlib sqlite3, журнал WAL) и
+# одноразовый перенос существующих файлов vacations_*.txt в базу.
+#
+#   python storage_sqlite.py migrate [--db vacations.db] [--path "vacations_{}.txt"]
+
+import argparse
+import datetime
+import logging
+import sqlite3
+import threading
+from typing import Collection, Dict, List
+
+from storage import Storage, TextStorage, Leave, VACATION_PATH, SQLITE_PATH
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS teams (
+    team    TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS leaves (
+    id         INTEGER PRIMARY KEY,
+    team       TEXT NOT NULL,
+    name       TEXT NOT NULL,
+    start      TEXT NOT NULL,
+    end        TEXT NOT NULL,
+    leave_type TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS leaves_team_name ON leaves (team, name);
+CREATE INDEX IF NOT EXISTS leaves_team_start ON leaves (team, start);
+"""
+
+
+def _row(team: str, rec: Leave) -> tuple:
+    return team, rec.name, rec.start.isoformat(), rec.end.isoformat(), rec.leave_type
+
+
+def _row_id(rec: Leave):
+    # rid записи в базе — её id; записи из других бэкендов получают новый id
+    return int(rec.rid) if rec.rid.isdigit() else None
+
+
+class SqliteStorage(Storage):
+    """
+    Записи в одной таблице leaves с индексами (team, name) и (team, start).
+    Идентификатор записи (rid) — id строки; удаление и редактирование меняют
+    одну строку по первичному ключу, без перезаписи команды.
+    Метка версии команды — счётчик в teams, увеличивается в той же транзакции.
+    """
+
+    def __init__(self, db_path: str = SQLITE_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        # своё соединение на поток: WAL позволяет читать параллельно с записью
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _bump(conn: sqlite3.Connection, team: str):
+        conn.execute(
+            "INSERT INTO teams (team, version) VALUES (?, 1) "
+            "ON CONFLICT (team) DO UPDATE SET version = version + 1",
+            (team,)
+        )
+
+    def stamp(self, team: str):
+        row = self._conn().execute("SELECT version FROM teams WHERE team = ?", (team,)).fetchone()
+        return row[0] if row else None
+
+    def load(self, team: str) -> List[Leave]:
+        rows = self._conn().execute(
+            "SELECT id, name, start, end, leave_type FROM leaves WHERE team = ? ORDER BY id", (team,)
+        )
+        return [
+            Leave(name, datetime.date.fromisoformat(s), datetime.date.fromisoformat(e), lt, str(row_id))
+            for row_id, name, s, e, lt in rows
+        ]
+
+    def append(self, team: str, rec: Leave) -> Leave:
+        with self._conn() as conn:
+            cur = conn.execute(
+                "INSERT INTO leaves (team, name, start, end, leave_type) VALUES (?, ?, ?, ?, ?)",
+                _row(team, rec)
+            )
+            self._bump(conn, team)
+        return rec._replace(rid=str(cur.lastrowid))
+
+    def extend(self, team: str, recs: List[Leave]) -> List[Leave]:
+        added = []
+        with self._conn() as conn:
+            for rec in recs:
+                cur = conn.execute(
+                    "INSERT INTO leaves (team, name, start, end, leave_type) VALUES (?, ?, ?, ?, ?)",
+                    _row(team, rec)
+                )
+                added.append(rec._replace(rid=str(cur.lastrowid)))
+            self._bump(conn, team)
+        return added
+
+    def remove(self, team: str, rec: Leave, records: Collection[Leave]):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM leaves WHERE team = ? AND id = ?", (team, _row_id(rec)))
+            self._bump(conn, team)
+
+    def update(self, team: str, old: Leave, new: Leave, records: Collection[Leave]):
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE leaves SET name = ?, start = ?, end = ?, leave_type = ? WHERE team = ? AND id = ?",
+                _row(team, new)[1:] + (team, _row_id(old))
+            )
+            self._bump(conn, team)
+
+    def replace(self, team: str, records: List[Leave]):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM leaves WHERE team = ?", (team,))
+            conn.executemany(
+                "INSERT INTO leaves (id, team, name, start, end, leave_type) VALUES (?, ?, ?, ?, ?, ?)",
+                [(_row_id(r),) + _row(team, r) for r in records]
+            )
+            self._bump(conn, team)
+
+    def exists(self, team: str) -> bool:
+        return self.stamp(team) is not None
+
+    def ensure(self, team: str):
+        with self._conn() as conn:
+            conn.execute("INSERT OR IGNORE INTO teams (team) VALUES (?)", (team,))
+
+    def teams(self) -> List[str]:
+        return [t for (t,) in self._conn().execute("SELECT team FROM teams ORDER BY team")]
+
+    def scan(self) -> Dict[str, object]:
+        return dict(self._conn().execute("SELECT team, version FROM teams"))
+
+
+def migrate(db_path: str = SQLITE_PATH, path_template: str = VACATION_PATH) -> dict:
+    """
+    Переносит все файлы vacations_*.txt в базу: данные каждой команды заменяются
+    содержимым её файла, поэтому повторный запуск безопасен. Возвращает {команда: число записей}.
+    """
+    src = TextStorage(path_template)
+    dst = SqliteStorage(db_path)
+    counts = {}
+    for team in src.teams():
+        # идентификаторы текстового хранилища в базе не нужны — строки получат свои id
+        records = [r._replace(rid="") for r in src.load(team)]
+        dst.replace(team, records)
+        counts[team] = len(records)
+        logger.info("Команда %s: перенесено %d записей", team, len(records))
+    return counts
+
+
+if __name__ == "__main__":
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    parser = argparse.ArgumentParser(description="SQLite-хранилище бота отпусков")
+    sub = parser.add_subparsers(dest="command", required=True)
+    mig = sub.add_parser("migrate", help="перенести vacations_*.txt в базу")
+    mig.add_argument("--db", default=SQLITE_PATH)
+    mig.add_argument("--path", default=VACATION_PATH, help="шаблон имени файла команды")
+    args = parser.parse_args()
+    if args.command == "migrate":
+        counts = migrate(args.db, args.path)
+        print(f"✅ Перенесено команд: {len(counts)}, записей: {sum(counts.values())}")
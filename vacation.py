@@ -6,11 +6,32 @@
 import os
 import logging
 import datetime
+import io
 import asyncio
+import html
+import tempfile
+import signal
+import contextlib
+import functools
+import math
 from telegram import Update, ReplyKeyboardMarkup, InlineKeyboardMarkup, InlineKeyboardButton
+from telegram.error import BadRequest
 from telegram.ext import (
     ApplicationBuilder, CommandHandler, MessageHandler,
-    ContextTypes, filters, ConversationHandler, CallbackQueryHandler
+    ContextTypes, filters, ConversationHandler, CallbackQueryHandler,
+    PicklePersistence, PersistenceInput
+)
+from storage import STORE, Leave, RecordNotFound
+from catalog import CATALOG
+from service import SERVICE, LOOP_LAG, TOTALS_AUDIT, discover_teams, run_io
+import bulk
+from webhook import WebhookServer, WEBHOOK_URL
+from dispatch import ChatOrderedProcessor, BackpressureQueue
+from outbox import SendLimiter, reply_merged
+from reminders import SCHEDULER, REMINDERS
+from shards import SHARDS, ShardRouter
+from metrics import (
+    METRICS, PROFILER, METRICS_PORT, METRICS_PROFILE, MetricsServer, instrument_handlers, instrument_storage
 )
 
 # Команда /vacabot — регистрация или показ меню
@@ -34,69 +55,41 @@ logging.basicConfig(
 TOKEN = "YOUR_TELEGRAM_BOT_TOKEN"
 TEAM_NAMES = {}  # chat_id -> active team
 TEAMS = set()  # known teams
-VACATION_PATH = "vacations_{}.txt"
+# Привязки чатов, список команд, user_data и состояния разговоров переживают перезапуск:
+# они лежат в STATE_PATH и сбрасываются на диск пачкой раз в PERSIST_INTERVAL секунд
+STATE_PATH = os.environ.get("STATE_PATH", "bot_state.pickle")
+PERSIST_INTERVAL = float(os.environ.get("PERSIST_INTERVAL", "30"))
 
 # Conversation states
 NAME, START_DATE, END_DATE = range(3)
 DEL_NAME, DEL_SELECT, DEL_CONFIRM = range(3)
 EDIT_NAME, EDIT_SELECT, EDIT_NEW_START, EDIT_NEW_END = range(4)
 SEARCH_NAME = 0
+IMPORT_FILE = 0
 
 
 # Utility functions
 
-def write_vacation(team: str, name: str, start: datetime.date, end: datetime.date, leave_type: str):
-    with open(VACATION_PATH.format(team), "a", encoding="utf-8") as f:
-        f.write(f"{name}: {start.strftime('%d.%m.%Y')} – {end.strftime('%d.%m.%Y')} [{leave_type}]\n")
-
-
-def read_vacations(team: str) -> list:
-    try:
-        with open(VACATION_PATH.format(team), "r", encoding="utf-8") as f:
-            return f.readlines()
-    except FileNotFoundError:
-        return []
-
-
-def save_vacations(team: str, lines: list):
-    with open(VACATION_PATH.format(team), "w", encoding="utf-8") as f:
-        f.writelines(lines)
-
-
 def calculate_days(start: datetime.date, end: datetime.date) -> int:
     return (end - start).days + 1
 
 
-def total_days_this_year(team: str, name: str, year: int) -> int:
-    total = 0
-    for line in read_vacations(team):
-        if line.startswith(name + ":"):
-            try:
-                period = line.split(":", 1)[1]
-                s_str, e_str = period.split("–")
-                s = datetime.datetime.strptime(s_str.strip(), "%d.%m.%Y").date()
-                e = datetime.datetime.strptime(e_str.split('[')[0].strip(), "%d.%m.%Y").date()
-                if s.year == year:
-                    total += calculate_days(s, e)
-            except:
-                continue
-    return total
-
-
 # Keyboards
 
 def get_main_menu() -> ReplyKeyboardMarkup:
     buttons = [
         ["➕ Отпуск", "➕ Отгулы", "➕ ОЗС", "➕ Командировка"],
         ["📅 Отпуска", "✏️ Редактировать", "❌ Удалить", "ℹ️ Помощь"],
-        ["🔄 Сменить команду", "🔍 Поиск"]
+        ["🔄 Сменить команду", "🔍 Поиск", "👥 Кто отсутствует"]
     ]
     return ReplyKeyboardMarkup(buttons, resize_keyboard=True)
 
 
-async def show_main_menu(update: Update):
+async def show_main_menu(update: Update, *notes: str):
     """
     Показывает приветственное сообщение с инструкцией и главное меню бота.
+    notes — итог предыдущего шага (сохранено, удалено, результаты поиска…): он уходит
+    в том же сообщении, что и меню, а не отдельными сообщениями перед ним.
     """
     # Инструкция по использованию
     help_text = (
@@ -110,14 +103,11 @@ async def show_main_menu(update: Update):
         "❌ Удалить — удалить запись;\n"
         "ℹ️ Помощь — показать этот список команд;\n"
         "🔄 Сменить команду — переключиться между командами;\n"
-        "🔍 Поиск — глобальный поиск по имени коллеги."
-    )
-    # Показываем инструкцию и меню
-    await update.message.reply_text(help_text)
-    await update.message.reply_text(
-        "Выберите действие:",
-        reply_markup=get_main_menu()
+        "🔍 Поиск — глобальный поиск по имени коллеги;\n"
+        "👥 Кто отсутствует — кто из команды отсутствует сегодня (/absent ДД.ММ.ГГГГ — в другой день)."
     )
+    # Показываем инструкцию и меню одним сообщением (длинное делится по границе частей)
+    await reply_merged(update.message, [*notes, help_text, "Выберите действие:"], reply_markup=get_main_menu())
 
 
 # Add flow
@@ -172,17 +162,18 @@ async def add_end(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
             return ConversationHandler.END
         lt = context.user_data.get('leave_type', 'Отпуск')
         days = calculate_days(start, end)
-        # enforce limit only for regular vacations
-        if lt == 'Отпуск':
-            used = total_days_this_year(team, name, start.year)
-            if used + days > 28:
-                await update.message.reply_text(f"🚫 Лимит 28 дн./год. Уже {used}, запрошено {days}.")
-                context.user_data.pop('leave_type', None)
-                return ConversationHandler.END
-        write_vacation(team, name, start, end, lt)
-        await update.message.reply_text(f"✅ {lt} сохранён ({days} дн.)")
+        rec = Leave(name, start, end, lt)
+        # пересечения не запрещают запись — только предупреждаем
+        warning = await overlap_warning(team, rec)
+        # лимит проверяется только для обычного отпуска — внутри add, под блокировкой команды
+        excess = await SERVICE.add(team, rec, check_limit=True)
+        if excess:
+            year, used, requested = excess
+            await update.message.reply_text(f"🚫 Лимит 28 дн./год. В {year} уже {used}, запрошено {requested}.")
+            context.user_data.pop('leave_type', None)
+            return ConversationHandler.END
         context.user_data.pop('leave_type', None)
-        await show_main_menu(update)
+        await show_main_menu(update, f"✅ {lt} сохранён ({days} дн.)", warning)
         return ConversationHandler.END
     except ValueError:
         await update.message.reply_text("Неверный формат. Повторите дату окончания:")
@@ -191,6 +182,19 @@ async def add_end(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         return END_DATE
 
 
+# Кнопки выбора записи: "<действие>:<rid>:<отпечаток>" — запись ищется по rid,
+# а отпечаток отсекает кнопки, нажатые после того, как запись изменили
+def record_data(action: str, rec: Leave) -> str:
+    return f"{action}:{rec.rid}:{rec.version}"
+
+
+async def pick_record(update: Update):
+    """Запись по нажатой кнопке или None, если её удалили или изменили после показа кнопок."""
+    _, rid, version = update.callback_query.data.split(":")
+    rec = await SERVICE.get(TEAM_NAMES[str(update.effective_chat.id)], rid)
+    return rec if rec is not None and rec.version == version else None
+
+
 # Delete flow
 async def start_delete(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     await update.message.reply_text("Введите ФИО для удаления:")
@@ -200,12 +204,11 @@ async def start_delete(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
 async def delete_by_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     name = update.message.text.strip()
     team = TEAM_NAMES[str(update.effective_chat.id)]
-    opts = [v for v in read_vacations(team) if v.startswith(name + ":")]
+    opts = [r for r in await SERVICE.records(team) if r.name == name]
     if not opts:
         await update.message.reply_text("Не найдено.")
         return ConversationHandler.END
-    context.user_data['del_opts'] = opts
-    kb = [[InlineKeyboardButton(opt.strip(), callback_data=str(i))] for i, opt in enumerate(opts)]
+    kb = [[InlineKeyboardButton(str(opt), callback_data=record_data("d", opt))] for opt in opts]
     await update.message.reply_text("Выберите запись:", reply_markup=InlineKeyboardMarkup(kb))
     return DEL_SELECT
 
@@ -213,9 +216,12 @@ async def delete_by_name(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 async def confirm_delete(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     q = update.callback_query
     await q.answer()
-    idx = int(q.data)
-    context.user_data['del_idx'] = idx
-    await q.edit_message_text(f"Удалить? {context.user_data['del_opts'][idx]}")
+    rec = await pick_record(update)
+    if rec is None:
+        await q.edit_message_text("⚠️ Запись уже изменена или удалена.")
+        return ConversationHandler.END
+    context.user_data['del_rec'] = rec
+    await q.edit_message_text(f"Удалить? {rec}")
     await q.message.reply_text("да/нет")
     return DEL_CONFIRM
 
@@ -224,15 +230,14 @@ async def finish_delete(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     ans = update.message.text.strip().lower()
     team = TEAM_NAMES[str(update.effective_chat.id)]
     if ans == 'да':
-        opts = context.user_data['del_opts']
-        idx = context.user_data['del_idx']
-        lines = read_vacations(team)
-        lines.remove(opts[idx])
-        save_vacations(team, lines)
-        await update.message.reply_text("✅ Удалено")
+        try:
+            await SERVICE.remove(team, context.user_data.pop('del_rec'))
+            result = "✅ Удалено"
+        except RecordNotFound:
+            result = "⚠️ Запись уже изменена или удалена."
     else:
-        await update.message.reply_text("❌ Отмена")
-    await show_main_menu(update)
+        result = "❌ Отмена"
+    await show_main_menu(update, result)
     return ConversationHandler.END
 
 
@@ -245,12 +250,11 @@ async def start_edit(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 async def edit_by_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     name = update.message.text.strip()
     team = TEAM_NAMES[str(update.effective_chat.id)]
-    opts = [v for v in read_vacations(team) if v.startswith(name + ":")]
+    opts = [r for r in await SERVICE.records(team) if r.name == name]
     if not opts:
         await update.message.reply_text("Не найдено.")
         return ConversationHandler.END
-    context.user_data['edit_opts'] = opts
-    kb = [[InlineKeyboardButton(opt.strip(), callback_data=str(i))] for i, opt in enumerate(opts)]
+    kb = [[InlineKeyboardButton(str(opt), callback_data=record_data("e", opt))] for opt in opts]
     await update.message.reply_text("Выберите запись:", reply_markup=InlineKeyboardMarkup(kb))
     return EDIT_SELECT
 
@@ -258,7 +262,11 @@ async def edit_by_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
 async def ask_new_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     q = update.callback_query
     await q.answer()
-    context.user_data['edit_idx'] = int(q.data)
+    rec = await pick_record(update)
+    if rec is None:
+        await q.edit_message_text("⚠️ Запись уже изменена или удалена.")
+        return ConversationHandler.END
+    context.user_data['edit_rec'] = rec
     await q.edit_message_text("Новая дата начала (ДД.MM.YYYY):")
     return EDIT_NEW_START
 
@@ -280,30 +288,24 @@ async def finish_edit(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
         if end < start:
             await update.message.reply_text("Ошибка: дата окончания раньше начала.")
             return EDIT_NEW_END
-        opts = context.user_data['edit_opts']
-        idx = context.user_data['edit_idx']
-        old = opts[idx]
-        name = old.split(":", 1)[0]
+        old = context.user_data['edit_rec']
+        name = old.name
         team = TEAM_NAMES[str(update.effective_chat.id)]
-        lt = context.user_data.get('leave_type', 'Отпуск')
-        if lt == 'Отпуск':
-            period = old.split(":", 1)[1]
-            s_str, e_str = period.split("–")
-            old_s = datetime.datetime.strptime(s_str.strip(), "%d.%m.%Y").date()
-            old_e = datetime.datetime.strptime(e_str.split('[')[0].strip(), "%d.%m.%Y").date()
-            used = total_days_this_year(team, name, start.year) - calculate_days(old_s, old_e)
-            new_days = calculate_days(start, end)
-            if used + new_days > 28:
-                await update.message.reply_text("🚫 Лимит 28 дн./год превышен.")
-                context.user_data.pop('leave_type', None)
-                return ConversationHandler.END
-        lines = read_vacations(team)
-        lines.remove(old)
-        write_vacation(team, name, start, end, lt)
-        save_vacations(team, lines)
-        await update.message.reply_text("✅ Обновлено")
+        # тип записи при редактировании дат не меняется
+        lt = old.leave_type
+        new = Leave(name, start, end, lt)
+        warning = await overlap_warning(team, new, exclude=old)
+        try:
+            excess = await SERVICE.update(team, old, new, check_limit=True)
+        except RecordNotFound:
+            await show_main_menu(update, "⚠️ Запись уже изменена или удалена.")
+            return ConversationHandler.END
+        if excess:
+            await update.message.reply_text("🚫 Лимит 28 дн./год превышен.")
+            context.user_data.pop('leave_type', None)
+            return ConversationHandler.END
         context.user_data.pop('leave_type', None)
-        await show_main_menu(update)
+        await show_main_menu(update, "✅ Обновлено", warning)
         return ConversationHandler.END
     except ValueError:
         await update.message.reply_text("Неверный формат. Повторите дату окончания:")
@@ -318,122 +320,352 @@ async def start_search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
 
 async def finish_search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     name = update.message.text.strip()
-    results = []
-    for team in sorted(TEAMS):
-        lines = [l for l in read_vacations(team) if l.startswith(name + ":")]
-        if lines:
-            results.append(f"Команда {team}:\n{''.join(lines)}")
+    # индекс покрывает все загруженные команды: точное совпадение, префикс, затем нечёткий поиск
+    result = await SERVICE.search(name)
+    found, archived = result.found, result.archived
+    results = [
+        f"Команда {team}:\n" + "".join(f"{r}\n" for r in found[team])
+        for team in sorted(found)
+    ]
+    # закрытые годы — по сводкам архива, без распаковки сегментов
+    results += [
+        f"🗄 Архив команды {team}:\n" + "".join(
+            f"{person}: " + "; ".join(
+                f"{year} — " + ", ".join(f"{lt} {days} дн." for lt, days in sorted(types.items()))
+                for year, types in sorted(years.items())
+            ) + "\n"
+            for person, years in sorted(archived[team].items())
+        )
+        for team in sorted(archived)
+    ]
     if not results:
-        await update.message.reply_text(f"Не найдено записей для {name}.")
-    else:
-        await update.message.reply_text("\n".join(results))
-    await show_main_menu(update)
+        results = [f"Не найдено записей для {name}."]
+    if result.missing:
+        results.append("⚠️ Часть команд не ответила вовремя — результаты неполные.")
+    await show_main_menu(update, "\n".join(results))
     return ConversationHandler.END
 
 
-# Message router
-async def message_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    cid = str(update.effective_chat.id)
-    txt = update.message.text.strip()
+# Listing
+LISTING_PAGE_SIZE = 20
+ARCHIVE_SHOWN = 50  # записей из архива под списком за прошлый период
+# коды фильтра по типу в callback_data -> (подпись кнопки, тип записи)
+LISTING_TYPES = {
+    "": ("Все", None),
+    "v": ("Отпуск", "Отпуск"),
+    "o": ("Отгулы", "Отгулы"),
+    "u": ("ОЗС", "Отпуск за свой счёт"),
+    "k": ("Командир.", "Командировка"),
+}
+MONTHS = [
+    "январь", "февраль", "март", "апрель", "май", "июнь",
+    "июль", "август", "сентябрь", "октябрь", "ноябрь", "декабрь"
+]
+
+
+def month_range(day: datetime.date):
+    first = day.replace(day=1)
+    nxt = (first + datetime.timedelta(days=32)).replace(day=1)
+    return first, nxt - datetime.timedelta(days=1)
+
+
+def listing_data(page: int, lt: str, d_from: datetime.date = None, d_to: datetime.date = None) -> str:
+    # ls:<страница>:<тип>:<с ГГГГММДД>:<по ГГГГММДД> — укладывается в 64 байта callback_data
+    fmt = lambda d: d.strftime("%Y%m%d") if d else ""
+    return f"ls:{page}:{lt}:{fmt(d_from)}:{fmt(d_to)}"
+
+
+def parse_listing_data(data: str):
+    _, page, lt, d_from, d_to = data.split(":")
+    parse = lambda s: datetime.datetime.strptime(s, "%Y%m%d").date() if s else None
+    return int(page), lt, parse(d_from), parse(d_to)
+
+
+async def render_listing(team: str, page: int = 0, lt: str = "", d_from: datetime.date = None,
+                         d_to: datetime.date = None):
+    """Отрисовывает одну страницу списка из заранее отсортированного индекса; возвращает (текст, клавиатура)."""
+    leave_type = LISTING_TYPES[lt][1]
+    total, recs = await SERVICE.listing(team, leave_type, d_from, d_to, page * LISTING_PAGE_SIZE, LISTING_PAGE_SIZE)
+    pages = max(1, math.ceil(total / LISTING_PAGE_SIZE))
+    if page >= pages:
+        page = pages - 1
+        total, recs = await SERVICE.listing(
+            team, leave_type, d_from, d_to, page * LISTING_PAGE_SIZE, LISTING_PAGE_SIZE
+        )
 
-    # Шаг 1. Если ждём ввода названия команды
-    if context.user_data.get('register_team'):
-        team = txt
-        path = VACATION_PATH.format(team)
-        # Если такая команда уже известна или есть файл — просто присоединяемся
-        if team in TEAMS or os.path.exists(path):
-            TEAMS.add(team)
-            TEAM_NAMES[cid] = team
-            open(path, 'a').close()
-            await update.message.reply_text(f"✅ Присоединились к команде '{team}'")
-            context.user_data.pop('register_team')
-            await show_main_menu(update)
-        else:
-            # Иначе предлагаем создать
-            await update.message.reply_text(f"Команда '{team}' не найдена. Создать? (да/нет)")
-            context.user_data['confirm_team'] = team
-            context.user_data.pop('register_team')
+    if d_from and d_to and (d_from, d_to) == month_range(d_from):
+        period = f"{MONTHS[d_from.month - 1]} {d_from.year}"
+    elif d_from or d_to:
+        period = f"{d_from.strftime('%d.%m.%Y') if d_from else '…'} – {d_to.strftime('%d.%m.%Y') if d_to else '…'}"
+    else:
+        period = None
+    title = "📅 Отпуска"
+    filters_text = ", ".join(x for x in (leave_type, period) if x)
+    if filters_text:
+        title += f" ({filters_text})"
+    if not recs:
+        text = f"{title}:\nСписок пуст."
+    else:
+        text = f"{title}, стр. {page + 1}/{pages}:\n" + "".join(f"{r}\n" for r in recs)
+
+    type_row = [
+        InlineKeyboardButton(("• " if code == lt else "") + label, callback_data=listing_data(0, code, d_from, d_to))
+        for code, (label, _) in LISTING_TYPES.items()
+    ]
+    base = d_from or datetime.date.today()
+    prev_month = month_range(base.replace(day=1) - datetime.timedelta(days=1))
+    next_month = month_range(month_range(base)[1] + datetime.timedelta(days=1))
+    if period:
+        middle = InlineKeyboardButton(f"✖ {period}", callback_data=listing_data(0, lt))
+    else:
+        middle = InlineKeyboardButton("📆 Этот месяц", callback_data=listing_data(0, lt, *month_range(base)))
+    month_row = [
+        InlineKeyboardButton("◀ мес.", callback_data=listing_data(0, lt, *prev_month)),
+        middle,
+        InlineKeyboardButton("мес. ▶", callback_data=listing_data(0, lt, *next_month)),
+    ]
+    rows = [type_row, month_row]
+    if pages > 1:
+        rows.append([
+            InlineKeyboardButton("◀", callback_data=listing_data(max(page - 1, 0), lt, d_from, d_to)),
+            InlineKeyboardButton(f"{page + 1}/{pages}", callback_data="ls:noop"),
+            InlineKeyboardButton("▶", callback_data=listing_data(min(page + 1, pages - 1), lt, d_from, d_to)),
+        ])
+    return text, InlineKeyboardMarkup(rows)
+
+
+async def listing_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    q = update.callback_query
+    await q.answer()
+    team = TEAM_NAMES.get(str(update.effective_chat.id))
+    if q.data == "ls:noop" or not team:
         return
+    text, markup = await render_listing(team, *parse_listing_data(q.data))
+    try:
+        await q.edit_message_text(text, reply_markup=markup)
+    except BadRequest as e:
+        # та же страница (например, ▶ на последней) — сообщение не изменилось
+        if "not modified" not in str(e):
+            raise
 
-    # Шаг 2. Обработка ответа на предложение создания новой команды
-    if context.user_data.get('confirm_team'):
-        ans = txt.lower()
-        team = context.user_data.pop('confirm_team')
-        if ans in ['да', 'yes']:
-            TEAMS.add(team)
-            TEAM_NAMES[cid] = team
-            # создаём файл на диске сразу
-            open(VACATION_PATH.format(team), 'a').close()
-            await update.message.reply_text(f"✅ Команда '{team}' создана и выбрана")
-            await show_main_menu(update)
+
+# /leaves [ММ.ГГГГ | ДД.ММ.ГГГГ ДД.ММ.ГГГГ] — список за месяц или период
+async def leaves_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    team = TEAM_NAMES.get(str(update.effective_chat.id))
+    if not team:
+        await update.message.reply_text("Введите /vacabot для регистрации или выбора команды.")
+        return
+    args = context.args or []
+    try:
+        if len(args) == 1:
+            d_from, d_to = month_range(datetime.datetime.strptime(args[0], "%m.%Y").date())
+        elif len(args) == 2:
+            d_from, d_to = (datetime.datetime.strptime(a, "%d.%m.%Y").date() for a in args)
         else:
-            # повторный ввод
-            await update.message.reply_text("Хорошо, введите название команды снова:")
-            context.user_data['register_team'] = True
+            d_from = d_to = None
+    except ValueError:
+        await update.message.reply_text("Формат: /leaves ММ.ГГГГ или /leaves ДД.ММ.ГГГГ ДД.ММ.ГГГГ")
         return
-
-    # Если пользователь вообще не в команде
-    if cid not in TEAM_NAMES:
+    text, markup = await render_listing(team, 0, "", d_from, d_to)
+    # период из закрытых лет — записи из архива (распаковываются только нужные сегменты)
+    cold = await SERVICE.archive_query(team, d_from, d_to) if d_from else []
+    if cold:
+        text += "\n🗄 Из архива:\n" + "".join(f"{r}\n" for r in cold[:ARCHIVE_SHOWN])
+        if len(cold) > ARCHIVE_SHOWN:
+            text += f"… и ещё {len(cold) - ARCHIVE_SHOWN}\n"
+    await update.message.reply_text(text, reply_markup=markup)
+
+
+# /coverage [ММ.ГГГГ | ДД.ММ.ГГГГ ДД.ММ.ГГГГ] — покрытие команды по дням, по умолчанию за текущий квартал
+async def coverage_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    team = TEAM_NAMES.get(str(update.effective_chat.id))
+    if not team:
         await update.message.reply_text("Введите /vacabot для регистрации или выбора команды.")
         return
-
-    # Далее уже стандартные действия по кнопкам…
-    if txt == "🔄 Сменить команду":
-        # "выходим" из текущей, но не удаляем её
-        TEAM_NAMES.pop(cid, None)
-        context.user_data['register_team'] = True
-        await update.message.reply_text("🔄 Введите название команды для переключения:")
+    try:
+        import staffing
+    except ImportError:
+        await update.message.reply_text("Отчёт о покрытии недоступен: не установлен numpy.")
+        return
+    args = context.args or []
+    try:
+        if len(args) == 1:
+            d_from, d_to = month_range(datetime.datetime.strptime(args[0], "%m.%Y").date())
+        elif len(args) == 2:
+            d_from, d_to = (datetime.datetime.strptime(a, "%d.%m.%Y").date() for a in args)
+        else:
+            d_from, d_to = staffing.quarter_range(datetime.date.today())
+    except ValueError:
+        await update.message.reply_text("Формат: /coverage ММ.ГГГГ или /coverage ДД.ММ.ГГГГ ДД.ММ.ГГГГ")
         return
+    if d_to < d_from:
+        await update.message.reply_text("Дата окончания раньше начала.")
+        return
+    if (d_to - d_from).days + 1 > staffing.MAX_DAYS:
+        await update.message.reply_text(f"Период не длиннее {staffing.MAX_DAYS} дн. Разбейте его на части.")
+        return
+    text, table, image = await SERVICE.coverage(team, d_from, d_to)
+    period = f"{d_from.strftime('%d.%m.%Y')} – {d_to.strftime('%d.%m.%Y')}"
+    await update.message.reply_text(
+        f"📊 Покрытие {team}, {period}:\n<pre>{html.escape(text)}</pre>", parse_mode="HTML"
+    )
+    stem = f"coverage_{team}_{d_from:%Y%m%d}_{d_to:%Y%m%d}"
+    await update.message.reply_document(document=table.encode("utf-8"), filename=f"{stem}.csv")
+    if image:
+        await update.message.reply_photo(photo=image)
+
+
+# Who is out
+async def overlap_warning(team: str, rec: Leave, exclude: Leave = None) -> str:
+    own, others = await SERVICE.overlaps(team, rec, exclude)
+    lines = []
+    if own:
+        lines.append("⚠️ Пересекается с вашими записями:\n" + "".join(f"{r}\n" for r in own))
+    if others:
+        lines.append("👥 В этот период также отсутствуют:\n" + "".join(f"{r}\n" for r in others))
+    return "\n".join(lines)
+
+
+async def render_absent(team: str, start: datetime.date, end: datetime.date = None):
+    """Кто отсутствует в день start или в период [start, end]; для одного дня — кнопки соседних дней."""
+    recs = await SERVICE.absent(team, start, end)
+    if end and end != start:
+        title = f"👥 Отсутствуют {start.strftime('%d.%m.%Y')} – {end.strftime('%d.%m.%Y')}"
+    else:
+        title = f"👥 Отсутствуют {start.strftime('%d.%m.%Y')}"
+    text = f"{title}:\n" + ("".join(f"{r}\n" for r in recs) if recs else "никого.")
+    if end and end != start:
+        return text, None
+    day = datetime.timedelta(days=1)
+    markup = InlineKeyboardMarkup([[
+        InlineKeyboardButton("◀", callback_data=f"ab:{(start - day).strftime('%Y%m%d')}"),
+        InlineKeyboardButton("Сегодня", callback_data=f"ab:{datetime.date.today().strftime('%Y%m%d')}"),
+        InlineKeyboardButton("▶", callback_data=f"ab:{(start + day).strftime('%Y%m%d')}"),
+    ]])
+    return text, markup
+
+
+async def absent_day(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    q = update.callback_query
+    await q.answer()
+    team = TEAM_NAMES.get(str(update.effective_chat.id))
+    if not team:
+        return
+    day = datetime.datetime.strptime(q.data[3:], "%Y%m%d").date()
+    text, markup = await render_absent(team, day)
+    try:
+        await q.edit_message_text(text, reply_markup=markup)
+    except BadRequest as e:
+        if "not modified" not in str(e):
+            raise
 
-    leave_map = {
-        "➕ Отпуск": "Отпуск",
-        "➕ Отгулы": "Отгулы",
-        "➕ ОЗС": "Отпуск за свой счёт",
-        "➕ Командировка": "Командировка"
-    }
-    if txt in leave_map:
-        context.user_data['leave_type'] = leave_map[txt]
-        return await start_add(update, context)
 
-    if txt == "📅 Отпуска":
-        team = TEAM_NAMES[cid]
-        vs = read_vacations(team)
-        if not vs:
-            await update.message.reply_text("Список пуст.")
-        else:
-            sorted_vs = sorted(
-                vs,
-                key=lambda l: datetime.datetime.strptime(
-                    l.split(":",1)[1].split("–")[0].strip(), "%d.%m.%Y"
-                )
-            )
-            await update.message.reply_text("📅 Отпуска:\n" + "".join(sorted_vs))
+# /absent [ДД.ММ.ГГГГ [ДД.ММ.ГГГГ]] — кто отсутствует сегодня, в день или в период
+async def absent_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    team = TEAM_NAMES.get(str(update.effective_chat.id))
+    if not team:
+        await update.message.reply_text("Введите /vacabot для регистрации или выбора команды.")
         return
+    args = context.args or []
+    try:
+        dates = [datetime.datetime.strptime(a, "%d.%m.%Y").date() for a in args[:2]]
+    except ValueError:
+        await update.message.reply_text("Формат: /absent ДД.ММ.ГГГГ или /absent ДД.ММ.ГГГГ ДД.ММ.ГГГГ")
+        return
+    start = dates[0] if dates else datetime.date.today()
+    end = dates[1] if len(dates) > 1 else None
+    if end and end < start:
+        await update.message.reply_text("Дата окончания раньше начала.")
+        return
+    text, markup = await render_absent(team, start, end)
+    await update.message.reply_text(text, reply_markup=markup)
 
-    if txt == "✏️ Редактировать":
-        return await start_edit(update, context)
 
-    if txt == "❌ Удалить":
-        return await start_delete(update, context)
+# Bulk import / export
+IMPORT_REPORT_LINES = 20
 
-    if txt == "ℹ️ Помощь":
-        help_text = (
-            "ℹ️ Команды:\n"
-            "➕ Отпуск/Отгулы/ОЗС/Командировка — добавить запись\n"
-            "📅 Отпуска — список по дате\n"
-            "✏️ Редактировать — изменить запись\n"
-            "❌ Удалить — удалить запись\n"
-            "🔄 Сменить команду — переключиться\n"
-            "🔍 Поиск — глобальный поиск по имени"
-        )
-        await update.message.reply_text(help_text)
+
+async def start_import(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    if str(update.effective_chat.id) not in TEAM_NAMES:
+        await update.message.reply_text("Введите /vacabot для регистрации или выбора команды.")
+        return ConversationHandler.END
+    await update.message.reply_text(
+        "Пришлите файл CSV или XLSX: ФИО, начало, окончание, тип (ДД.ММ.ГГГГ; тип по умолчанию — Отпуск)."
+    )
+    return IMPORT_FILE
+
+
+async def finish_import(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    doc = update.message.document
+    filename = doc.file_name or ""
+    if not filename.lower().endswith((".csv", ".xlsx")):
+        await update.message.reply_text("Нужен файл .csv или .xlsx. Пришлите другой файл:")
+        return IMPORT_FILE
+    team = TEAM_NAMES[str(update.effective_chat.id)]
+    buf = io.BytesIO()
+    await (await doc.get_file()).download_to_memory(buf)
+    buf.seek(0)
+    try:
+        parsed, errors = await run_io(bulk.read_import, buf, filename, team)
+    except ImportError:
+        await update.message.reply_text("XLSX недоступен: не установлен openpyxl. Сохраните таблицу как CSV.")
+        return ConversationHandler.END
+    except bulk.ImportFileError as e:
+        await update.message.reply_text(f"Не удалось прочитать файл: {e}. Пришлите другой файл:")
+        return IMPORT_FILE
+    # лимит проверяется для всей пачки сразу, принятые строки пишутся одной транзакцией
+    added, excess = await SERVICE.add_many(team, [rec for _, rec in parsed], check_limit=True)
+    errors = sorted(errors + bulk.limit_errors(parsed, excess))
+    summary = f"✅ Импортировано записей: {len(added)}, с ошибками: {len(errors)}"
+    shown = "\n".join(str(e) for e in errors[:IMPORT_REPORT_LINES])
+    if len(errors) > IMPORT_REPORT_LINES:
+        shown += f"\n… и ещё {len(errors) - IMPORT_REPORT_LINES}, полный список в файле"
+        report = "".join(f"{e.line};{e.message}\n" for e in errors)
+        await update.message.reply_document(document=report.encode("utf-8-sig"), filename="import_errors.csv")
+    await show_main_menu(update, summary, shown)
+    return ConversationHandler.END
+
+
+# /export [all] [xlsx] — выгрузка записей команды или всех команд
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    team = TEAM_NAMES.get(str(update.effective_chat.id))
+    args = [a.lower() for a in context.args or []]
+    if not team and "all" not in args:
+        await update.message.reply_text("Введите /vacabot для регистрации или выбора команды.")
         return
+    teams = await SERVICE.known_teams() if "all" in args else [team]
+    filename = f"leaves_{'all' if 'all' in args else team}.{'xlsx' if 'xlsx' in args else 'csv'}"
+    loop = asyncio.get_running_loop()
+
+    def records(t: str):
+        # записи отдаёт SERVICE (в режиме SHARDS — шард-владелец), а не STORE этого процесса
+        return asyncio.run_coroutine_threadsafe(SERVICE.records(t), loop).result()
+
+    # таблица пишется построчно во временный файл, а не собирается в памяти; поток —
+    # не из пула хранилища, иначе он ждал бы SERVICE.records, занимая место в том же пуле
+    out = tempfile.TemporaryFile()
+    try:
+        count = await loop.run_in_executor(None, functools.partial(bulk.export, out, teams, filename, records))
+    except ImportError:
+        out.close()
+        await update.message.reply_text("XLSX недоступен: не установлен openpyxl. Используйте /export без xlsx.")
+        return
+    out.seek(0)
+    with out:
+        await update.message.reply_document(document=out, filename=filename, caption=f"Записей: {count}")
+
+
+def router_branch(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
+    """Метка ветки роутера для метрик: шаг регистрации или нажатая кнопка меню."""
+    if context.user_data.get('register_team'):
+        return "register"
+    if context.user_data.get('confirm_team'):
+        return "confirm_team"
+    txt = update.message.text.strip() if update.message and update.message.text else ""
+    buttons = {button.text for row in get_main_menu().keyboard for button in row}
+    return txt if txt in buttons else "other"
 
-    if txt == "🔍 Поиск":
-        return await start_search(update, context)
 
-    # Всё остальное игнорируем
-    return
 # Message router
 async def message_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
     cid = str(update.effective_chat.id)
@@ -442,15 +674,13 @@ async def message_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Шаг 1. Если ждём ввода названия команды
     if context.user_data.get('register_team'):
         team = txt
-        path = VACATION_PATH.format(team)
-        # Если такая команда уже известна или есть файл — просто присоединяемся
-        if team in TEAMS or os.path.exists(path):
+        # Если такая команда уже известна или есть в хранилище — просто присоединяемся
+        if team in TEAMS or await SERVICE.exists(team):
             TEAMS.add(team)
             TEAM_NAMES[cid] = team
-            open(path, 'a').close()
-            await update.message.reply_text(f"✅ Присоединились к команде '{team}'")
+            await SERVICE.ensure(team)
             context.user_data.pop('register_team')
-            await show_main_menu(update)
+            await show_main_menu(update, f"✅ Присоединились к команде '{team}'")
         else:
             # Иначе предлагаем создать
             await update.message.reply_text(f"Команда '{team}' не найдена. Создать? (да/нет)")
@@ -465,10 +695,9 @@ async def message_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if ans in ['да', 'yes']:
             TEAMS.add(team)
             TEAM_NAMES[cid] = team
-            # создаём файл на диске сразу
-            open(VACATION_PATH.format(team), 'a').close()
-            await update.message.reply_text(f"✅ Команда '{team}' создана и выбрана")
-            await show_main_menu(update)
+            # создаём команду в хранилище сразу
+            await SERVICE.ensure(team)
+            await show_main_menu(update, f"✅ Команда '{team}' создана и выбрана")
         else:
             # повторный ввод
             await update.message.reply_text("Хорошо, введите название команды снова:")
@@ -499,18 +728,8 @@ async def message_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return await start_add(update, context)
 
     if txt == "📅 Отпуска":
-        team = TEAM_NAMES[cid]
-        vs = read_vacations(team)
-        if not vs:
-            await update.message.reply_text("Список пуст.")
-        else:
-            sorted_vs = sorted(
-                vs,
-                key=lambda l: datetime.datetime.strptime(
-                    l.split(":",1)[1].split("–")[0].strip(), "%d.%m.%Y"
-                )
-            )
-            await update.message.reply_text("📅 Отпуска:\n" + "".join(sorted_vs))
+        text, markup = await render_listing(TEAM_NAMES[cid])
+        await update.message.reply_text(text, reply_markup=markup)
         return
 
     if txt == "✏️ Редактировать":
@@ -523,11 +742,14 @@ async def message_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
         help_text = (
             "ℹ️ Команды:\n"
             "➕ Отпуск/Отгулы/ОЗС/Командировка — добавить запись\n"
-            "📅 Отпуска — список по дате\n"
+            "📅 Отпуска — список по дате (/leaves ММ.ГГГГ — за месяц)\n"
             "✏️ Редактировать — изменить запись\n"
             "❌ Удалить — удалить запись\n"
             "🔄 Сменить команду — переключиться\n"
-            "🔍 Поиск — глобальный поиск по имени"
+            "🔍 Поиск — глобальный поиск по имени\n"
+            "👥 Кто отсутствует — сегодня (/absent ДД.ММ.ГГГГ [ДД.ММ.ГГГГ] — день или период)\n"
+            "/coverage [ММ.ГГГГ] — покрытие команды по дням (по умолчанию квартал)\n"
+            "/import — загрузить записи из CSV/XLSX, /export [all] [xlsx] — выгрузить"
         )
         await update.message.reply_text(help_text)
         return
@@ -535,15 +757,30 @@ async def message_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if txt == "🔍 Поиск":
         return await start_search(update, context)
 
+    if txt == "👥 Кто отсутствует":
+        text, markup = await render_absent(TEAM_NAMES[cid], datetime.date.today())
+        await update.message.reply_text(text, reply_markup=markup)
+        return
+
     # Всё остальное игнорируем
     return
 
 
 
-# Entry point
-async def main():
-    app = ApplicationBuilder().token(TOKEN).build()
+def restore_registry(app):
+    """
+    Привязки чатов к командам и список команд хранятся в bot_data.
+    Модульные TEAM_NAMES/TEAMS становятся теми же объектами, поэтому их изменения
+    попадают на диск при очередном сбросе состояния без отдельных вызовов.
+    """
+    TEAM_NAMES.update(app.bot_data.get("team_names", {}))
+    TEAMS.update(app.bot_data.get("teams", ()))
+    app.bot_data["team_names"] = TEAM_NAMES
+    app.bot_data["teams"] = TEAMS
+
 
+def add_handlers(app):
+    """Все хендлеры бота; их же подключает к приложению-стенду webhook.py serve."""
     # Хендлер старта бота
     app.add_handler(CommandHandler("vacabot", start))
 
@@ -556,7 +793,9 @@ async def main():
                 START_DATE: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_start)],
                 END_DATE: [MessageHandler(filters.TEXT & ~filters.COMMAND, add_end)],
             },
-            fallbacks=[]
+            fallbacks=[],
+            name="add_leave",
+            persistent=True
         )
     )
 
@@ -566,10 +805,12 @@ async def main():
             entry_points=[MessageHandler(filters.Regex("❌ Удалить"), start_delete)],
             states={
                 DEL_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, delete_by_name)],
-                DEL_SELECT: [CallbackQueryHandler(confirm_delete, pattern="^\\d+$")],
+                DEL_SELECT: [CallbackQueryHandler(confirm_delete, pattern="^d:")],
                 DEL_CONFIRM: [MessageHandler(filters.Regex("^(да|нет)$"), finish_delete)],
             },
-            fallbacks=[]
+            fallbacks=[],
+            name="delete_leave",
+            persistent=True
         )
     )
 
@@ -579,11 +820,13 @@ async def main():
             entry_points=[MessageHandler(filters.Regex("✏️ Редактировать"), start_edit)],
             states={
                 EDIT_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, edit_by_name)],
-                EDIT_SELECT: [CallbackQueryHandler(ask_new_start, pattern="^\\d+$")],
+                EDIT_SELECT: [CallbackQueryHandler(ask_new_start, pattern="^e:")],
                 EDIT_NEW_START: [MessageHandler(filters.TEXT & ~filters.COMMAND, ask_new_end)],
                 EDIT_NEW_END: [MessageHandler(filters.TEXT & ~filters.COMMAND, finish_edit)],
             },
-            fallbacks=[]
+            fallbacks=[],
+            name="edit_leave",
+            persistent=True
         )
     )
 
@@ -592,18 +835,143 @@ async def main():
         ConversationHandler(
             entry_points=[MessageHandler(filters.Regex("🔍 Поиск"), start_search)],
             states={SEARCH_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, finish_search)]},
-            fallbacks=[]
+            fallbacks=[],
+            name="search",
+            persistent=True
         )
     )
 
+    # Постраничный список отпусков
+    app.add_handler(CommandHandler("leaves", leaves_command))
+    app.add_handler(CallbackQueryHandler(listing_page, pattern="^ls:"))
+
+    # Кто отсутствует
+    app.add_handler(CommandHandler("absent", absent_command))
+    app.add_handler(CallbackQueryHandler(absent_day, pattern="^ab:"))
+
+    # Покрытие команды по дням
+    app.add_handler(CommandHandler("coverage", coverage_command))
+
+    # Массовый импорт и экспорт
+    app.add_handler(
+        ConversationHandler(
+            entry_points=[CommandHandler("import", start_import)],
+            states={IMPORT_FILE: [MessageHandler(filters.Document.ALL, finish_import)]},
+            fallbacks=[],
+            name="import",
+            persistent=True
+        )
+    )
+    app.add_handler(CommandHandler("export", export_command))
+
     # Роутер на все остальные входящие сообщения
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, message_router))
 
+
+# Entry point
+async def main():
+    global SERVICE
+    persistence = PicklePersistence(
+        filepath=STATE_PATH,
+        store_data=PersistenceInput(chat_data=False),
+        update_interval=PERSIST_INTERVAL
+    )
+    # чаты обрабатываются параллельно, обновления одного чата — по порядку
+    processor = ChatOrderedProcessor()
+    limiter = SendLimiter()
+    app = (
+        ApplicationBuilder().token(TOKEN).persistence(persistence)
+        .concurrent_updates(processor).update_queue(BackpressureQueue(processor))
+        # исходящие запросы — в пределах лимитов Telegram, с повтором после RetryAfter
+        .rate_limiter(limiter)
+        .build()
+    )
+
+    add_handlers(app)
+
+    # Метрики: время и ошибки всех хендлеров выше, операции хранилища, мониторы
+    router = None
+    if SHARDS > 1:
+        # данные, индексы и напоминания — в процессах-шардах, здесь только хендлеры
+        router = SERVICE = ShardRouter(SHARDS, TOKEN, TEAMS, TEAM_NAMES)
+    instrument_handlers(app, {"message_router": router_branch})
+    if router is None:
+        # с шардами хранилище этого процесса не используется — его операции мерить незачем
+        instrument_storage(STORE.backend)
+    METRICS.gauge_func("bot_team_records", "Записей в команде", CATALOG.counts, ("team",))
+    METRICS.snapshot("bot_updates", processor.snapshot, "Обработка обновлений")
+    METRICS.snapshot("bot_send", limiter.snapshot, "Отправка сообщений")
+    METRICS.snapshot("bot_loop_lag", LOOP_LAG.snapshot, "Задержка event loop, с")
+    # конкуренция за блокировку записи по командам; с шардами — собранная с них раз в SHARD_BIND_INTERVAL
+    lock_stats = router.lock_stats if router else SERVICE.locks.stats
+    for key, help_text in (("acquired", "Захватов блокировки записи команды"),
+                           ("wait_total", "Суммарное ожидание блокировки записи команды, с"),
+                           ("wait_max", "Максимальное ожидание блокировки записи команды, с")):
+        METRICS.gauge_func(f"bot_team_lock_{key}", help_text,
+                           lambda key=key: {team: s[key] for team, s in lock_stats().items()}, ("team",))
+    METRICS.snapshot("bot_reminders", SCHEDULER.snapshot, "Напоминания и сводки")
+    METRICS.gauge_func("bot_totals_mismatch", "Расхождений индекса остатков с хранилищем",
+                       lambda: dict(TOTALS_AUDIT.mismatches), ("team",))
+    if router:
+        METRICS.snapshot("bot_shards", router.snapshot, "Процессы-шарды")
+    metrics_server = MetricsServer() if METRICS_PORT else None
+    if METRICS_PROFILE:
+        PROFILER.start()
+
     print("✅ Бот запущен...")
+    LOOP_LAG.start()
     await app.initialize()
+    restore_registry(app)
     await app.start()
-    await app.updater.start_polling()
-    await asyncio.Event().wait()
+    if metrics_server:
+        await metrics_server.start()
+    loop = asyncio.get_running_loop()
+    if router:
+        # команды нужно знать до раздачи по шардам; загружают их сами шарды
+        await discover_teams(TEAMS, warm=False)
+        await router.start()
+        # kill -USR1 — добавить шард и переселить на него часть команд
+        with contextlib.suppress(NotImplementedError):
+            loop.add_signal_handler(
+                signal.SIGUSR1, lambda: app.create_task(router.resize(len(router.shards) + 1))
+            )
+    else:
+        # поиск команд на диске не задерживает запуск бота
+        app.create_task(discover_teams(TEAMS))
+        # напоминания накануне и еженедельные сводки — во все чаты, привязанные к команде
+        SCHEDULER.chats = TEAM_NAMES
+        if REMINDERS:
+            SCHEDULER.start(app.bot, SERVICE.sync)
+    # живой индекс остатков сверяется с данными там, где он обновляется событиями
+    TOTALS_AUDIT.start(SERVICE, TEAMS)
+    # WEBHOOK_URL задан — обновления приходят на встроенный сервер, иначе long polling
+    server = WebhookServer(app) if WEBHOOK_URL else None
+    if server:
+        await server.start()
+    else:
+        await app.updater.start_polling()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        with contextlib.suppress(NotImplementedError):
+            loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        # сначала перестаём принимать обновления, затем stop() дорабатывает очередь
+        # и последний раз сохраняет состояние на диск
+        if server:
+            await server.stop()
+        else:
+            await app.updater.stop()
+        SCHEDULER.stop()
+        TOTALS_AUDIT.stop()
+        await app.stop()
+        await app.shutdown()
+        if router:
+            await router.stop()
+        if metrics_server:
+            await metrics_server.stop()
+        PROFILER.stop()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,256 @@
+# webhook.py
+# Режим webhook: Telegram сам присылает обновления POST-запросами на встроенный
+# aiohttp-сервер, вместо того чтобы бот опрашивал getUpdates. Включается
+# переменной WEBHOOK_URL; без неё бот работает через long polling.
+#
+# Здесь же — прогон записанных обновлений через эндпоинт для замеров без Telegram:
+#
+#   python webhook.py serve --secret S            # эндпоинт с настоящими хендлерами, без сети
+#   python webhook.py replay updates.jsonl [--url http://127.0.0.1:8443/telegram] [--secret S]
+
+import os
+import hmac
+import json
+import time
+import asyncio
+import logging
+import secrets
+import argparse
+import itertools
+from typing import Optional
+
+from telegram import Update
+from telegram.request import BaseRequest
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "")  # публичный https-адрес; пусто — long polling
+WEBHOOK_LISTEN = os.environ.get("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "/telegram")
+# секрет приходит от Telegram в заголовке каждого запроса; без настройки — случайный на запуск
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET", "")
+WEBHOOK_MAX_CONNECTIONS = int(os.environ.get("WEBHOOK_MAX_CONNECTIONS", "40"))
+WEBHOOK_SHUTDOWN_TIMEOUT = float(os.environ.get("WEBHOOK_SHUTDOWN_TIMEOUT", "10"))
+# если задан — каждое принятое обновление дописывается сюда строкой JSON (для replay)
+WEBHOOK_RECORD = os.environ.get("WEBHOOK_RECORD", "")
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """
+    aiohttp-сервер с одним эндпоинтом: проверяет секрет, разбирает Update и кладёт его
+    в update_queue приложения — дальше обновление обрабатывается так же, как при polling.
+    Одновременно обрабатывается не больше max_connections запросов; то же число
+    передаётся Telegram в setWebhook.
+    """
+
+    def __init__(self, app, url: str = WEBHOOK_URL, listen: str = WEBHOOK_LISTEN, port: int = WEBHOOK_PORT,
+                 path: str = WEBHOOK_PATH, secret: str = WEBHOOK_SECRET,
+                 max_connections: int = WEBHOOK_MAX_CONNECTIONS, record_path: str = WEBHOOK_RECORD):
+        self.app = app
+        self.url = url
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self.secret = secret or secrets.token_urlsafe(32)
+        self.max_connections = max_connections
+        self.record_path = record_path
+        self._slots = asyncio.Semaphore(max_connections)
+        self._runner = None
+        self._record = None
+        self.accepted = 0
+        self.rejected = 0
+
+    async def handle(self, request):
+        from aiohttp import web
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            self.rejected += 1
+            return web.Response(status=403)
+        async with self._slots:
+            try:
+                data = await request.json()
+                update = Update.de_json(data, self.app.bot)
+            except (ValueError, TypeError, KeyError):
+                self.rejected += 1
+                return web.Response(status=400)
+            if self._record is not None:
+                self._record.write(json.dumps(data, ensure_ascii=False) + "\n")
+            await self.dispatch(update)
+            self.accepted += 1
+        return web.Response()
+
+    async def dispatch(self, update: Update):
+        await self.app.update_queue.put(update)
+
+    async def start(self, set_webhook: bool = True):
+        try:
+            from aiohttp import web
+        except ImportError:
+            raise RuntimeError("Для WEBHOOK_URL нужен пакет aiohttp") from None
+        webapp = web.Application()
+        webapp.router.add_post(self.path, self.handle)
+        self._runner = web.AppRunner(webapp, shutdown_timeout=WEBHOOK_SHUTDOWN_TIMEOUT, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.listen, self.port).start()
+        if self.record_path:
+            self._record = open(self.record_path, "a", encoding="utf-8", buffering=1)
+        if set_webhook:
+            await self.app.bot.set_webhook(
+                url=self.url.rstrip("/") + self.path,
+                secret_token=self.secret,
+                max_connections=self.max_connections,
+                allowed_updates=Update.ALL_TYPES,
+            )
+        logger.info("Webhook слушает %s:%d%s", self.listen, self.port, self.path)
+
+    async def stop(self):
+        """
+        Перестаёт принимать соединения и дожидается запросов в обработке (не дольше
+        WEBHOOK_SHUTDOWN_TIMEOUT). Webhook у Telegram не снимается: обновления, пришедшие
+        во время перезапуска, Telegram доставит повторно.
+        """
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        if self._record is not None:
+            self._record.close()
+            self._record = None
+        logger.info("Webhook остановлен: принято %d, отклонено %d", self.accepted, self.rejected)
+
+
+async def replay(path: str, url: str, secret: str, concurrency: int = 8, limit: Optional[int] = None) -> dict:
+    """
+    Отправляет записанные обновления (по JSON на строку) в эндпоинт webhook
+    с concurrency параллельными запросами. Возвращает сводку задержек и пропускной способности.
+    """
+    import aiohttp
+
+    with open(path, encoding="utf-8") as f:
+        bodies = [line.encode("utf-8") for line in f if line.strip()][:limit]
+    latencies = []
+    statuses = {}
+    pending = iter(bodies)
+
+    async def worker(session):
+        for body in pending:
+            began = time.perf_counter()
+            async with session.post(url, data=body, headers={
+                SECRET_HEADER: secret, "Content-Type": "application/json"
+            }) as resp:
+                await resp.read()
+            latencies.append(time.perf_counter() - began)
+            statuses[resp.status] = statuses.get(resp.status, 0) + 1
+
+    began = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - began
+    latencies.sort()
+    pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1e3 if latencies else 0.0
+    return {
+        "updates": len(bodies),
+        "seconds": round(elapsed, 3),
+        "per_second": round(len(bodies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(pick(0.50), 2),
+        "p99_ms": round(pick(0.99), 2),
+        "statuses": statuses,
+    }
+
+
+class _OfflineRequest(BaseRequest):
+    """
+    Запросы к Bot API без сети: getMe — профиль бота, send*/edit* — сообщение,
+    остальное — True. Хендлеры работают как с Telegram, но ничего не уходит.
+    """
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, **timeouts):
+        api_method = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data is not None else {}
+        if api_method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "vacabot", "username": "vacabot"}
+        elif api_method.startswith(("send", "edit")):
+            chat_id = int(params.get("chat_id") or 0)
+            result = {"message_id": next(self._ids), "date": int(time.time()),
+                      "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group"}}
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode("utf-8")
+
+
+class _ReplayServer(WebhookServer):
+    """
+    Эндпоинт для replay: ответ отдаётся после того, как обновление обработано хендлерами
+    (через update_processor приложения, с тем же порядком по чатам, что и в боте), —
+    задержка replay включает работу хендлеров и хранилища.
+    """
+
+    async def dispatch(self, update: Update):
+        processor = self.app.update_processor
+        # место в backlog резервирует BackpressureQueue.get(); здесь очереди нет — резервируем сами,
+        # do_process_update вернёт его после обработки
+        await processor.admit()
+        await processor.process_update(update, self.app.process_update(update))
+
+
+async def serve_stand_in(port: int, secret: str):
+    """
+    Поднимает эндпоинт с настоящими хендлерами vacation.py над данными текущего каталога:
+    изменения из обновлений записываются в файлы команд, поэтому запускать на копии данных.
+    Состояние разговоров и привязки чатов читаются из STATE_PATH, но обратно не пишутся.
+    """
+    from telegram.ext import ApplicationBuilder, PicklePersistence
+    import vacation
+    from dispatch import ChatOrderedProcessor
+    app = (
+        ApplicationBuilder().token("0:replay")
+        .request(_OfflineRequest()).get_updates_request(_OfflineRequest())
+        .persistence(PicklePersistence(filepath=vacation.STATE_PATH))
+        .concurrent_updates(ChatOrderedProcessor())
+        .build()
+    )
+    vacation.add_handlers(app)
+    # app.start() не вызывается: без него PTB не сбрасывает состояние на диск
+    await app.initialize()
+    vacation.restore_registry(app)
+    server = _ReplayServer(app, port=port, secret=secret, record_path="")
+    await server.start(set_webhook=False)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+        await app.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Webhook бота отпусков")
+    sub = parser.add_subparsers(dest="command", required=True)
+    srv = sub.add_parser("serve", help="поднять эндпоинт с хендлерами бота для replay (на копии данных)")
+    srv.add_argument("--port", type=int, default=WEBHOOK_PORT)
+    srv.add_argument("--secret", default=WEBHOOK_SECRET or "local")
+    rep = sub.add_parser("replay", help="прогнать записанные обновления через эндпоинт")
+    rep.add_argument("file", help="JSON-строки обновлений (см. WEBHOOK_RECORD)")
+    rep.add_argument("--url", default=f"http://127.0.0.1:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+    rep.add_argument("--secret", default=WEBHOOK_SECRET or "local")
+    rep.add_argument("--concurrency", type=int, default=8)
+    rep.add_argument("--limit", type=int)
+    args = parser.parse_args()
+    if args.command == "serve":
+        logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+        try:
+            asyncio.run(serve_stand_in(args.port, args.secret))
+        except KeyboardInterrupt:
+            pass
+    elif args.command == "replay":
+        summary = asyncio.run(replay(args.file, args.url, args.secret, args.concurrency, args.limit))
+        print(json.dumps(summary, ensure_ascii=False))